@@ -0,0 +1,420 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from passage_store import PassageStore, chunk_pages
+from query_normalizer import normalize_query
+
+# torch and transformers are imported when the model is created
+if TYPE_CHECKING:
+    import pandas as pd
+
+OUTPUT_DIR = Path("models") / "advanced_model"
+
+def has_checkpoint(output_dir: Path = OUTPUT_DIR) -> bool:
+    """Whether an interrupted training run left a checkpoint to resume from"""
+    return any((output_dir / 'checkpoints').glob('step-*[0-9]'))
+
+class GIKIAdvancedModel:
+    """Extractive QA over the passage index.
+
+    A question is answered by retrieving the top few passages (or the best windows of
+    a given context), running the reader on all of them in one batch and returning
+    the highest-scoring span. Reader outputs are cached per (question, passage).
+    The fine-tuned reader in models/advanced_model is loaded when one was saved;
+    fine_tuned=False (or no saved model) loads model_name from the hub."""
+
+    def __init__(self, model_name: str = "bert-large-uncased-whole-word-masking-finetuned-squad",
+                 max_length: int = 384, doc_stride: int = 128, top_passages: int = 3,
+                 max_answer_tokens: int = 30, cache_size: int = 4096, fine_tuned: bool = True):
+        import torch
+        from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+
+        self.model_name = model_name
+        self.model_dir = Path("models")
+        self.output_dir = OUTPUT_DIR
+        self.max_length = max_length
+        self.doc_stride = doc_stride
+        self.top_passages = top_passages
+        self.max_answer_tokens = max_answer_tokens
+        self.cache_size = cache_size
+        self.setup_logging()
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        source = self.output_dir if fine_tuned and (self.output_dir / 'config.json').exists() else model_name
+        self.logger.info(f"Loading reader from {source}")
+        self.tokenizer = AutoTokenizer.from_pretrained(source)
+        self.model = AutoModelForQuestionAnswering.from_pretrained(source).to(self.device).eval()
+
+        self.passage_store = PassageStore(self.model_dir)
+        self._encoder = None
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def setup_logging(self):
+        """Setup logging configuration"""
+        logging.basicConfig(
+            filename=self.model_dir / 'advanced_model.log',
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        self.logger = logging.getLogger('GIKIAdvancedModel')
+
+    @property
+    def encoder(self):
+        """Sentence encoder the passage index was built with"""
+        if self._encoder is None:
+            from encoder_backends import load_encoder
+            self._encoder = load_encoder(cache_dir=self.model_dir)
+        return self._encoder
+
+    def retrieve(self, question: str, context: Optional[str] = None) -> List[str]:
+        """Passages for the reader: the best windows of context if given, else the top
+        passages from the index"""
+        if context is None:
+            vector = self.encoder.encode(normalize_query(question).text, convert_to_numpy=True)
+            return [passage['text'] for passage, _ in self.passage_store.search(vector, self.top_passages)]
+
+        windows = [p['text'] for p in chunk_pages([{'text': context, 'url': '', 'source': 'context'}])]
+        if len(windows) <= self.top_passages:
+            return windows
+        vectors = self.encoder.encode([normalize_query(question).text] + windows, convert_to_numpy=True)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = vectors[1:] @ vectors[0]
+        return [windows[i] for i in np.argsort(-scores)[:self.top_passages]]
+
+    def _read(self, question: str, passages: List[str]) -> List[Tuple[str, float]]:
+        """Best (span, probability) in each passage, from one batched forward pass"""
+        import torch
+
+        inputs = self.tokenizer([question] * len(passages), passages, truncation='only_second',
+                                max_length=self.max_length, stride=self.doc_stride, padding=True,
+                                return_overflowing_tokens=True, return_offsets_mapping=True,
+                                return_tensors='pt')
+        offsets = inputs.pop('offset_mapping').numpy()
+        feature_passage = inputs.pop('overflow_to_sample_mapping').numpy()
+        with torch.no_grad():
+            outputs = self.model(**{k: v.to(self.device) for k, v in inputs.items()})
+        start_probs = torch.softmax(outputs.start_logits, dim=-1).cpu().numpy()
+        end_probs = torch.softmax(outputs.end_logits, dim=-1).cpu().numpy()
+
+        best = [("", 0.0)] * len(passages)
+        for feature, passage_index in enumerate(feature_passage):
+            # Only tokens of the passage (sequence 1) can start or end an answer
+            in_context = np.array([s == 1 for s in inputs.sequence_ids(feature)])
+            start_p = np.where(in_context, start_probs[feature], 0.0)
+            end_p = np.where(in_context, end_probs[feature], 0.0)
+            # Span score for every (start, end) with start <= end < start + max_answer_tokens
+            scores = np.triu(np.outer(start_p, end_p))
+            scores = np.tril(scores, self.max_answer_tokens - 1)
+            start, end = np.unravel_index(np.argmax(scores), scores.shape)
+            if scores[start, end] > best[passage_index][1]:
+                passage = passages[passage_index]
+                answer = passage[offsets[feature][start][0]:offsets[feature][end][1]]
+                best[passage_index] = (answer, float(scores[start, end]))
+        return best
+
+    def get_answer(self, question: str, context: Optional[str] = None) -> Tuple[str, float]:
+        """Answer span and its probability, read from the retrieved passages"""
+        try:
+            passages = self.retrieve(question, context)
+            if not passages:
+                return "", 0.0
+
+            key = normalize_query(question).key
+            results: Dict[int, Tuple[str, float]] = {}
+            pending = []
+            with self._cache_lock:
+                for i, passage in enumerate(passages):
+                    cache_key = (key, hashlib.sha1(passage.encode('utf-8')).hexdigest())
+                    if cache_key in self._cache:
+                        self._cache.move_to_end(cache_key)
+                        results[i] = self._cache[cache_key]
+                    else:
+                        pending.append((i, cache_key))
+
+            if pending:
+                read = self._read(question, [passages[i] for i, _ in pending])
+                with self._cache_lock:
+                    for (i, cache_key), result in zip(pending, read):
+                        results[i] = self._cache[cache_key] = result
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+            return max(results.values(), key=lambda result: result[1])
+
+        except Exception as e:
+            self.logger.error(f"Error answering question: {str(e)}")
+            return "", 0.0
+
+    def _encode_examples(self, df: "pd.DataFrame") -> List[Dict]:
+        """Tokenize (question, context) pairs, unpadded, with the answer's token start and end"""
+        contexts = [c if isinstance(c, str) else a for c, a in zip(df.get('context', df['answer']), df['answer'])]
+        inputs = self.tokenizer(list(df['question']), contexts, truncation='only_second',
+                                max_length=self.max_length, return_offsets_mapping=True)
+        examples = []
+        for i, (context, answer) in enumerate(zip(contexts, df['answer'])):
+            char_start = context.find(answer)
+            char_end = char_start + len(answer)
+            sequence_ids = inputs.sequence_ids(i)
+            start = end = 0  # points at [CLS] when the answer was truncated away
+            if char_start >= 0:
+                for token, (s, e) in enumerate(inputs['offset_mapping'][i]):
+                    if sequence_ids[token] != 1:
+                        continue
+                    if s <= char_start < e:
+                        start = token
+                    if s < char_end <= e:
+                        end = token
+                if end < start:
+                    start = end = 0
+            example = {k: v[i] for k, v in inputs.items() if k != 'offset_mapping'}
+            example.update({'start_positions': start, 'end_positions': end})
+            examples.append(example)
+        return examples
+
+    @staticmethod
+    def length_grouped_batches(lengths: List[int], batch_size: int, seed: Optional[int] = None) -> List[List[int]]:
+        """Batches of similar-length examples, so padding to the batch maximum stays small.
+
+        With a seed the examples are shuffled and sorted only within windows of 50
+        batches, so batch order is still random from epoch to epoch."""
+        order = list(range(len(lengths)))
+        window = batch_size * 50
+        if seed is not None:
+            np.random.default_rng(seed).shuffle(order)
+        else:
+            window = len(order) or 1
+        batches = []
+        for start in range(0, len(order), window):
+            group = sorted(order[start:start + window], key=lambda i: -lengths[i])
+            batches.extend(group[i:i + batch_size] for i in range(0, len(group), batch_size))
+        if seed is not None:
+            np.random.default_rng(seed + 1).shuffle(batches)
+        return batches
+
+    def _collate(self, examples: List[Dict]) -> Dict:
+        """Pad a batch to its own longest example"""
+        batch = self.tokenizer.pad(examples, padding='longest', pad_to_multiple_of=8, return_tensors='pt')
+        return {k: v.to(self.device) for k, v in batch.items()}
+
+    def _autocast(self, bf16: bool):
+        import torch
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=bf16)
+
+    def evaluate(self, test_df: "pd.DataFrame", batch_size: int = 8, bf16: bool = False) -> float:
+        """Mean span loss on a held-out set"""
+        import torch
+
+        examples = self._encode_examples(test_df)
+        batches = self.length_grouped_batches([len(e['input_ids']) for e in examples], batch_size)
+        self.model.eval()
+        losses = []
+        with torch.no_grad(), self._autocast(bf16):
+            for batch in batches:
+                losses.append(self.model(**self._collate([examples[i] for i in batch])).loss.float().item())
+        return float(np.mean(losses)) if losses else 0.0
+
+    def _run_fingerprint(self, train_df: "pd.DataFrame", **settings) -> str:
+        """Hash of the training data and the settings a resumed run has to share"""
+        import json
+
+        digest = hashlib.sha256(json.dumps({'model_name': self.model_name, 'max_length': self.max_length,
+                                            **settings}, sort_keys=True).encode('utf-8'))
+        for column in ('question', 'answer', 'context'):
+            if column in train_df:
+                digest.update(f"\0{column}".encode('utf-8'))
+                for value in train_df[column]:
+                    digest.update(f"\0{value}".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _clear_checkpoints(self):
+        import shutil
+
+        shutil.rmtree(self.output_dir / 'checkpoints', ignore_errors=True)
+
+    def _set_aside_checkpoints(self, keep: int = 2):
+        """Move another run's checkpoints to checkpoints.stale-<time> rather than deleting
+        them, keeping the newest few such directories"""
+        import shutil
+        from datetime import datetime
+
+        checkpoint_root = self.output_dir / 'checkpoints'
+        if not has_checkpoint(self.output_dir):
+            self._clear_checkpoints()
+            return
+        target = self.output_dir / f"checkpoints.stale-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        os.replace(checkpoint_root, target)
+        self.logger.info(f"Moved checkpoints of a different run to {target}")
+        for old in sorted(self.output_dir.glob('checkpoints.stale-*'))[:-keep]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _save_checkpoint(self, optimizer, progress: Dict, keep: int = 2):
+        """Write model, optimizer and progress to checkpoints/step-N, keeping the newest few"""
+        import json
+        import shutil
+        import torch
+
+        checkpoint_root = self.output_dir / 'checkpoints'
+        target = checkpoint_root / f"step-{progress['global_step']:08d}"
+        tmp_dir = checkpoint_root / f"{target.name}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        self.model.save_pretrained(tmp_dir)
+        torch.save({'optimizer': optimizer.state_dict(), 'torch_rng': torch.get_rng_state()},
+                   tmp_dir / 'training_state.pt')
+        with open(tmp_dir / 'progress.json', 'w') as f:
+            json.dump(progress, f, indent=2)
+        # A crash mid-write leaves only the .tmp directory, which resume ignores
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+
+        for old in sorted(checkpoint_root.glob('step-*[0-9]'))[:-keep]:
+            shutil.rmtree(old, ignore_errors=True)
+        self.logger.info(f"Saved checkpoint {target}")
+
+    def _load_checkpoint(self, optimizer, fingerprint: str) -> Optional[Dict]:
+        """Restore the newest checkpoint of the same run (data and settings); returns its
+        progress, or None to start fresh"""
+        import json
+        import torch
+        from transformers import AutoModelForQuestionAnswering
+
+        checkpoints = sorted((self.output_dir / 'checkpoints').glob('step-*[0-9]'))
+        if not checkpoints:
+            return None
+        latest = checkpoints[-1]
+        with open(latest / 'progress.json', 'r') as f:
+            progress = json.load(f)
+        if progress.get('fingerprint') != fingerprint:
+            self.logger.info(f"Not resuming from {latest}: training data or settings changed")
+            return None
+        self.model.load_state_dict(AutoModelForQuestionAnswering.from_pretrained(latest).state_dict())
+        state = torch.load(latest / 'training_state.pt', map_location='cpu')
+        optimizer.load_state_dict(state['optimizer'])
+        torch.set_rng_state(state['torch_rng'])
+        self.logger.info(f"Resuming from {latest} (epoch {progress['epoch'] + 1}, batch {progress['batch']})")
+        return progress
+
+    def train(self, train_df: "pd.DataFrame", test_df: "pd.DataFrame", epochs: int = 3,
+              batch_size: int = 8, learning_rate: float = 2e-5, gradient_accumulation: int = 1,
+              bf16: Optional[bool] = None, checkpoint_steps: int = 200, resume: bool = True,
+              log_steps: int = 20, seed: int = 42) -> bool:
+        """Fine-tune the reader on (question, answer, context) pairs and save it.
+
+        Batches group examples of similar length and are padded only to their own
+        longest example. gradient_accumulation micro-batches make one optimizer step;
+        bf16 (default: GIKI_TRAIN_BF16) runs forward passes under bfloat16 autocast.
+        A checkpoint is written every checkpoint_steps optimizer steps and at the end of
+        each epoch, and with resume a restarted run continues from the newest one if it
+        was trained on the same data with the same settings. Any other run moves the
+        existing checkpoints aside (checkpoints.stale-<time>) and starts from an empty
+        checkpoint directory, and the checkpoints are removed once the final model is
+        saved."""
+        try:
+            import time
+            import torch
+
+            if bf16 is None:
+                bf16 = os.environ.get('GIKI_TRAIN_BF16', '0') == '1'
+            examples = self._encode_examples(train_df)
+            lengths = [len(example['input_ids']) for example in examples]
+            optimizer = torch.optim.AdamW(self.model.parameters(), lr=learning_rate)
+            fingerprint = self._run_fingerprint(train_df, batch_size=batch_size, learning_rate=learning_rate,
+                                                gradient_accumulation=gradient_accumulation, seed=seed)
+            progress = self._load_checkpoint(optimizer, fingerprint) if resume else None
+            if progress is None:
+                # Stale checkpoints would outlive (and be pruned instead of) this run's
+                self._set_aside_checkpoints()
+                progress = {'epoch': 0, 'batch': 0, 'global_step': 0}
+            wandb = None
+            if os.environ.get('WANDB_PROJECT'):
+                import wandb
+                wandb.init(project=os.environ['WANDB_PROJECT'],
+                           config={'model_name': self.model_name, 'epochs': epochs, 'batch_size': batch_size,
+                                   'gradient_accumulation': gradient_accumulation,
+                                   'learning_rate': learning_rate, 'bf16': bf16})
+
+            global_step = progress['global_step']
+            for epoch in range(progress['epoch'], epochs):
+                # Seeded by epoch, so a resumed run sees the same batches in the same order
+                batches = self.length_grouped_batches(lengths, batch_size, seed=seed + epoch)
+                first_batch = progress['batch'] if epoch == progress['epoch'] else 0
+                self.model.train()
+                optimizer.zero_grad()
+                losses, samples, tokens = [], 0, 0
+                epoch_start = window_start = time.perf_counter()
+                window_samples = 0
+
+                for index in range(first_batch, len(batches)):
+                    batch = [examples[i] for i in batches[index]]
+                    inputs = self._collate(batch)
+                    with self._autocast(bf16):
+                        loss = self.model(**inputs).loss
+                    (loss.float() / gradient_accumulation).backward()
+                    losses.append(loss.float().item())
+                    samples += len(batch)
+                    window_samples += len(batch)
+                    tokens += inputs['input_ids'].numel()
+
+                    last = index == len(batches) - 1
+                    if (index + 1) % gradient_accumulation and not last:
+                        continue
+                    optimizer.step()
+                    optimizer.zero_grad()
+                    global_step += 1
+
+                    if global_step % log_steps == 0:
+                        elapsed = time.perf_counter() - window_start
+                        rate = window_samples / elapsed if elapsed else 0.0
+                        self.logger.info(f"Epoch {epoch + 1} step {global_step}: loss {np.mean(losses[-log_steps:]):.4f}, "
+                                         f"{rate:.2f} samples/s")
+                        if wandb is not None:
+                            wandb.log({'step': global_step, 'train_loss': float(np.mean(losses[-log_steps:])),
+                                       'samples_per_second': rate})
+                        window_start, window_samples = time.perf_counter(), 0
+                    if checkpoint_steps and global_step % checkpoint_steps == 0 and not last:
+                        self._save_checkpoint(optimizer, {'epoch': epoch, 'batch': index + 1,
+                                                          'global_step': global_step, 'fingerprint': fingerprint})
+
+                elapsed = time.perf_counter() - epoch_start
+                eval_loss = self.evaluate(test_df, batch_size, bf16)
+                stats = {
+                    'epoch': epoch + 1,
+                    'train_loss': float(np.mean(losses)) if losses else 0.0,
+                    'eval_loss': eval_loss,
+                    'samples_per_second': samples / elapsed if elapsed else 0.0,
+                    'padding_ratio': tokens / sum(lengths[i] for b in batches[first_batch:] for i in b) if samples else 1.0
+                }
+                self.logger.info(f"Epoch {epoch + 1}/{epochs}: train loss {stats['train_loss']:.4f}, "
+                                 f"eval loss {eval_loss:.4f}, {stats['samples_per_second']:.2f} samples/s, "
+                                 f"padding {stats['padding_ratio']:.2f}x")
+                if wandb is not None:
+                    wandb.log(stats)
+                self._save_checkpoint(optimizer, {'epoch': epoch + 1, 'batch': 0, 'global_step': global_step,
+                                                  'fingerprint': fingerprint})
+
+            self.model.eval()
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.model.save_pretrained(self.output_dir)
+            self.tokenizer.save_pretrained(self.output_dir)
+            # The run is complete; a later run must not resume past its last epoch
+            self._clear_checkpoints()
+            # Cached spans came from the old weights
+            with self._cache_lock:
+                self._cache.clear()
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error training model: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    model = GIKIAdvancedModel()
+    print(model.get_answer("Where is GIKI located?"))
@@ -0,0 +1,366 @@
+import argparse
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+CHAT_HISTORY = Path("chat_data") / "chat_history.json"
+DATASET_FILE = Path("giki_dataset.json")
+RESULTS_DIR = Path("benchmarks")
+CORPUS_SIZES = [100, 1000, 10000, 100000]
+HISTORY_SIZES = [100, 1000, 10000]
+
+# Cumulative import time allowed per entry-point module, in seconds (chat_manager
+# includes streamlit itself)
+IMPORT_BUDGETS = {
+    'chat_manager': 1.0,
+    'update_scheduler': 0.1,
+    'giki_knowledge': 0.1,
+    'quick_responses': 0.05,
+    'data_processor': 0.1,
+    'data_scraper': 0.1,
+    'model_trainer': 0.3,
+    'embedding_service': 0.3,
+    'run': 0.1,
+}
+# Packages that must only be imported by the code paths that use them
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'transformers', 'onnxruntime', 'pandas', 'sklearn',
+                 'nltk', 'bs4', 'wandb')
+
+# Queries whose routing once regressed: (query, text the knowledge-base answer must
+# contain, or None when no entity may be tagged). Fee questions must never reach the
+# FEE department, which "fee"/"fees" used to alias.
+ROUTING_CASES = [
+    ("what is the fee structure", None),
+    ("how much is the hostel fee", None),
+    ("what are the fees", None),
+    ("What are the FEES for BS?", None),
+    ("fees kitni hai", None),
+    ("What is FEE?", "(FEE)"),
+    ("labs in FEE", "(FEE)"),
+    ("faculty of fee", "(FEE)"),
+    ("labs in fme", "(FME)"),
+]
+
+def load_real_queries(path: Path = CHAT_HISTORY) -> List[str]:
+    """User messages recorded in the chat history"""
+    if not path.exists():
+        return []
+    with open(path, 'r') as f:
+        chats = json.load(f)
+    return [msg['content'] for chat in chats.values() for msg in chat.get('messages', [])
+            if msg.get('role') == 'user' and msg.get('content', '').strip()]
+
+def generate_synthetic_queries(count: int, seed: int = 42) -> List[str]:
+    """Template queries over the departments, labs and societies in the dataset"""
+    rng = random.Random(seed)
+    with open(DATASET_FILE, 'r') as f:
+        dataset = json.load(f)
+
+    entities = list(dataset['departments'].keys())
+    for dept in dataset['departments'].values():
+        entities.append(dept['name'])
+        entities.extend(dept['labs'])
+        entities.extend(dept['programs'])
+    entities.extend(s['name'] for s in dataset['student_life']['societies'])
+
+    templates = [
+        "what is {}", "tell me about {}", "where is {}", "how many students in {}",
+        "which labs are in {}", "admission in {}", "giki {} facilities", "{}"
+    ]
+    return [rng.choice(templates).format(rng.choice(entities)) for _ in range(count)]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def measure(func: Callable[[str], object], queries: List[str], warmup: int = 20) -> Dict:
+    """Time func on every query and summarise latency in milliseconds"""
+    for query in queries[:warmup]:
+        func(query)
+
+    latencies = []
+    total_start = time.perf_counter()
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - start)
+    total = time.perf_counter() - total_start
+
+    latencies.sort()
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'qps': len(latencies) / total if total else 0.0
+    }
+
+def bench_matchers(queries: List[str]) -> Dict:
+    """QuickResponses and both knowledge base variants"""
+    from quick_responses import QuickResponses
+    from giki_knowledge import GIKIKnowledgeBase
+    from chat_manager import GIKIKnowledgeBase as StaticKnowledgeBase
+
+    return {
+        'quick_responses': measure(QuickResponses().get_quick_response, queries),
+        'knowledge_base': measure(GIKIKnowledgeBase().get_response, queries),
+        'static_knowledge_base': measure(StaticKnowledgeBase().get_response, queries)
+    }
+
+def bench_embedding_search(queries: List[str], corpus_sizes: List[int]) -> Dict:
+    """find_best_answer against synthetic corpora grown from the trained embeddings"""
+    try:
+        import numpy as np
+        from model_trainer import GIKIModelTrainer
+        from semantic_cache import SemanticCache
+    except ImportError as e:
+        return {'skipped': f"missing dependency: {e}"}
+
+    trainer = GIKIModelTrainer()
+    # Repeated benchmark queries would otherwise be served from the answer cache
+    trainer.answer_cache = SemanticCache(max_entries=0)
+    source_dir = trainer.model_dir
+    if not (source_dir / 'question_embeddings.npy').exists():
+        return {'skipped': "no trained embeddings, run model_trainer.py first"}
+
+    base = np.load(source_dir / 'question_embeddings.npy')
+    with open(source_dir / 'answers.json', 'r') as f:
+        base_answers = json.load(f)
+
+    rng = np.random.default_rng(42)
+    results = {}
+    for size in corpus_sizes:
+        corpus_dir = Path(tempfile.mkdtemp(prefix='giki_bench_'))
+        try:
+            # Tile the real embeddings with small noise so scores stay realistic
+            picks = rng.integers(0, len(base), size)
+            corpus = base[picks] + rng.normal(0, 0.01, (size, base.shape[1])).astype(base.dtype)
+            np.save(corpus_dir / 'question_embeddings.npy', corpus)
+            with open(corpus_dir / 'answers.json', 'w') as f:
+                json.dump([base_answers[i] for i in picks], f)
+
+            trainer.model_dir = corpus_dir
+            trainer._index_cache = None
+            results[str(size)] = measure(trainer.find_best_answer, queries)
+        finally:
+            trainer.model_dir = source_dir
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    return results
+
+def bench_semantic_cache(queries: List[str]) -> Dict:
+    """find_best_answer on the trained embeddings with the answer cache on, and its hit rate"""
+    try:
+        from model_trainer import GIKIModelTrainer
+    except ImportError as e:
+        return {'skipped': f"missing dependency: {e}"}
+
+    trainer = GIKIModelTrainer()
+    if not (trainer.model_dir / 'question_embeddings.npy').exists():
+        return {'skipped': "no trained embeddings, run model_trainer.py first"}
+    trainer.answer_cache.clear()
+    results = measure(trainer.find_best_answer, queries, warmup=0)
+    results['cache'] = trainer.answer_cache.stats()
+    return results
+
+def bench_encoder_backends(queries: List[str], backends: List[str]) -> Dict:
+    """Per-query encode latency of each encoder backend, and its parity with fp32 torch"""
+    try:
+        import numpy as np
+        from encoder_backends import load_encoder, parity
+    except ImportError as e:
+        return {'skipped': f"missing dependency: {e}"}
+
+    reference = np.asarray(load_encoder(backend='torch').encode(queries, convert_to_numpy=True))
+    results = {}
+    for backend in backends:
+        encoder = load_encoder(backend=backend)
+        results[backend] = measure(encoder.encode, queries)
+        results[backend]['encoder'] = type(encoder).__name__
+        results[backend]['parity'] = parity(reference, np.asarray(encoder.encode(queries, convert_to_numpy=True)))
+    return results
+
+def make_history(num_chats: int, messages_per_chat: int = 10, seed: int = 42) -> Dict:
+    """Synthetic chat history shaped like chat_data/chat_history.json"""
+    rng = random.Random(seed)
+    queries = generate_synthetic_queries(50, seed)
+    base_id = 1700000000000
+    chats = {}
+    for i in range(num_chats):
+        chat_id = str(base_id + i)
+        messages = []
+        for _ in range(messages_per_chat // 2):
+            messages.append({'role': 'user', 'content': rng.choice(queries)})
+            messages.append({'role': 'assistant', 'content': "GIKI offers the following programs:\n\n- " * 5})
+        chats[chat_id] = {'title': messages[0]['content'][:30], 'messages': messages, 'created_at': chat_id}
+    return chats
+
+def bench_chat_store(history_sizes: List[int], repeats: int = 5) -> Dict:
+    """save_chats/load_chats round trips with large histories"""
+    from chat_manager import ChatManager
+
+    results = {}
+    for size in history_sizes:
+        data_dir = Path(tempfile.mkdtemp(prefix='giki_bench_chats_'))
+        try:
+            manager = ChatManager(data_dir=data_dir)
+            chats = make_history(size)
+            ids = [str(i) for i in range(repeats)]
+            results[str(size)] = {
+                'save': measure(lambda _: manager.save_chats(chats), ids, warmup=1),
+                'load': measure(lambda _: manager.load_chats(), ids, warmup=1),
+                'file_bytes': manager.store.size_bytes()
+            }
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+def measure_import(module: str) -> Dict:
+    """Cumulative import time of a module in a fresh interpreter (python -X importtime)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed'}
+    cumulative_us, imported = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        name = name.strip()
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_us = int(cumulative)
+    return {'seconds': cumulative_us / 1e6, 'heavy_imports': sorted(imported.intersection(HEAVY_MODULES))}
+
+def check_import_budgets(budgets: Dict[str, float] = IMPORT_BUDGETS, repeats: int = 3) -> Tuple[Dict, List[str]]:
+    """Import time of each entry point (best of repeats) against its budget"""
+    results, failures = {}, []
+    for module, budget in budgets.items():
+        runs = [measure_import(module) for _ in range(repeats)]
+        errors = [run['error'] for run in runs if 'error' in run]
+        if errors:
+            results[module] = {'skipped': errors[0]}
+            continue
+        best = min(runs, key=lambda run: run['seconds'])
+        results[module] = {'budget_seconds': budget, **best}
+        if best['seconds'] > budget:
+            failures.append(f"{module}: import took {best['seconds']:.3f}s, budget {budget:.3f}s")
+        if best['heavy_imports']:
+            failures.append(f"{module}: imports {', '.join(best['heavy_imports'])} at module level")
+    return results, failures
+
+def check_routing(cases: List[Tuple[str, object]] = ROUTING_CASES) -> List[str]:
+    """Entity routing of the knowledge base against ROUTING_CASES"""
+    from giki_knowledge import GIKIKnowledgeBase
+
+    kb = GIKIKnowledgeBase()
+    failures = []
+    for query, expected in cases:
+        answer = kb.get_entity_answer(query)
+        if expected is None and answer is not None:
+            failures.append(f"{query!r}: expected no entity answer, got {answer.splitlines()[0]!r}")
+        elif expected is not None and (answer is None or expected not in answer):
+            failures.append(f"{query!r}: expected an answer containing {expected!r}, got {answer!r}")
+    return failures
+
+def git_revision() -> str:
+    """Current commit, so results can be compared across versions"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.2, prefix: str = "") -> List[str]:
+    """List p95 regressions larger than threshold between two result trees"""
+    regressions = []
+    for key, value in current.items():
+        if key not in baseline or not isinstance(value, dict):
+            continue
+        if 'p95_ms' in value and 'p95_ms' in baseline[key]:
+            old, new = baseline[key]['p95_ms'], value['p95_ms']
+            if old and (new - old) / old > threshold:
+                regressions.append(f"{prefix}{key}: p95 {old:.3f}ms -> {new:.3f}ms")
+        else:
+            regressions.extend(compare(value, baseline[key], threshold, f"{prefix}{key}."))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GIKI chatbot answer paths")
+    parser.add_argument('--synthetic', type=int, default=1000, help="number of synthetic queries")
+    parser.add_argument('--skip-embedding', action='store_true', help="skip the model-backed search")
+    parser.add_argument('--corpus-sizes', type=int, nargs='+', default=CORPUS_SIZES)
+    parser.add_argument('--history-sizes', type=int, nargs='+', default=HISTORY_SIZES)
+    parser.add_argument('--encoder-backends', nargs='+', choices=['torch', 'int8', 'onnx'],
+                        help="compare encode latency and parity of these backends")
+    parser.add_argument('--import-budget', action='store_true',
+                        help="only check module import times against their budgets (exit 1 if exceeded)")
+    parser.add_argument('--routing', action='store_true',
+                        help="only check entity routing of known regression queries (exit 1 on failure)")
+    parser.add_argument('--output', type=Path, help="results file (default: benchmarks/<revision>_<time>.json)")
+    parser.add_argument('--compare', type=Path, help="previous results file to check for regressions")
+    args = parser.parse_args()
+
+    if args.import_budget:
+        results, failures = check_import_budgets()
+        print(json.dumps(results, indent=2))
+        for line in failures:
+            print(f"OVER BUDGET {line}")
+        sys.exit(1 if failures else 0)
+
+    if args.routing:
+        failures = check_routing()
+        for line in failures:
+            print(f"MISROUTED {line}")
+        print(f"{len(ROUTING_CASES) - len(failures)}/{len(ROUTING_CASES)} routing cases passed")
+        sys.exit(1 if failures else 0)
+
+    queries = load_real_queries() + generate_synthetic_queries(args.synthetic)
+    random.Random(0).shuffle(queries)
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'num_queries': len(queries),
+        'matchers': bench_matchers(queries),
+        'chat_store': bench_chat_store(args.history_sizes)
+    }
+    if not args.skip_embedding:
+        results['embedding_search'] = bench_embedding_search(queries[:200], args.corpus_sizes)
+        results['semantic_cache'] = bench_semantic_cache(queries)
+    if args.encoder_backends:
+        results['encoder_backends'] = bench_encoder_backends(queries[:200], args.encoder_backends)
+
+    output = args.output or RESULTS_DIR / f"{results['revision']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    print(json.dumps(results['matchers'], indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
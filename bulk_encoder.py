@@ -0,0 +1,118 @@
+import logging
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from encoder_backends import DEFAULT_MODEL, load_encoder
+
+# Upper word-count bounds of the length buckets; longer texts share the last bucket
+BUCKET_BOUNDS = (8, 16, 32, 64, 128, 256)
+
+_worker_encoder = None
+
+def _init_worker(model_name: str, backend: Optional[str], cache_dir: str, threads: int):
+    """Load one encoder per worker process, sized to its share of the cores"""
+    global _worker_encoder
+    import torch
+    torch.set_num_threads(threads)
+    _worker_encoder = load_encoder(model_name, backend, Path(cache_dir))
+
+def _encode_batch(job):
+    batch_id, texts = job
+    return batch_id, np.asarray(_worker_encoder.encode(texts, batch_size=len(texts), convert_to_numpy=True))
+
+def length_buckets(texts: List[str], tokens_per_batch: int = 4096, max_batch: int = 256) -> List[List[int]]:
+    """Indices of texts grouped into batches of similar length.
+
+    Each bucket gets its own batch size, so short questions go in large batches and
+    long answers in small ones, and nothing is padded far beyond its own length."""
+    lengths = [len(text.split()) for text in texts]
+    buckets: Dict[int, List[int]] = {}
+    for index in sorted(range(len(texts)), key=lambda i: lengths[i]):
+        bound = next((b for b in BUCKET_BOUNDS if lengths[index] <= b), BUCKET_BOUNDS[-1] * 2)
+        buckets.setdefault(bound, []).append(index)
+
+    batches = []
+    for bound, indices in sorted(buckets.items()):
+        size = max(1, min(max_batch, tokens_per_batch // bound))
+        batches.extend(indices[i:i + size] for i in range(0, len(indices), size))
+    return batches
+
+class BulkEncoder:
+    """Encodes large lists of texts in length-bucketed batches across a process pool.
+
+    Small jobs run in-process on local_encoder (if given), since starting workers means
+    loading the model once per process."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, backend: Optional[str] = None,
+                 processes: Optional[int] = None, local_encoder=None, min_parallel: int = 2048,
+                 tokens_per_batch: int = 4096, cache_dir: Path = Path("models")):
+        self.model_name = model_name
+        self.backend = backend
+        cpus = os.cpu_count() or 1
+        self.processes = processes or int(os.environ.get('GIKI_ENCODER_PROCESSES', max(1, cpus // 2)))
+        self.local_encoder = local_encoder
+        self.min_parallel = min_parallel
+        self.tokens_per_batch = tokens_per_batch
+        self.cache_dir = Path(cache_dir)
+        self.last_stats: Dict = {}
+        self.logger = logging.getLogger('BulkEncoder')
+
+    def _encode_local(self, texts: List[str], batches: List[List[int]], out: np.ndarray) -> np.ndarray:
+        if self.local_encoder is None:
+            self.local_encoder = load_encoder(self.model_name, self.backend, self.cache_dir)
+        for batch in batches:
+            vectors = self.local_encoder.encode([texts[i] for i in batch], batch_size=len(batch),
+                                                convert_to_numpy=True)
+            out = self._store(out, batch, vectors)
+        return out
+
+    def _encode_pool(self, texts: List[str], batches: List[List[int]], out: np.ndarray) -> np.ndarray:
+        threads = max(1, (os.cpu_count() or 1) // self.processes)
+        # spawn: forked workers would inherit the parent's torch thread pools
+        context = multiprocessing.get_context('spawn')
+        # Longest batches first, so the slowest work doesn't start last
+        jobs = sorted(((batch_id, [texts[i] for i in batch]) for batch_id, batch in enumerate(batches)),
+                      key=lambda job: -sum(len(text) for text in job[1]))
+        with context.Pool(self.processes, initializer=_init_worker,
+                          initargs=(self.model_name, self.backend, str(self.cache_dir), threads)) as pool:
+            for batch_id, vectors in pool.imap_unordered(_encode_batch, jobs):
+                out = self._store(out, batches[batch_id], vectors)
+        return out
+
+    @staticmethod
+    def _store(out: Optional[np.ndarray], batch: List[int], vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if out is None or out.shape[1] == 0:
+            out = np.zeros((out.shape[0], vectors.shape[1]), dtype=np.float32)
+        out[batch] = vectors
+        return out
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of texts, in input order; throughput is kept in last_stats"""
+        start = time.perf_counter()
+        batches = length_buckets(texts, self.tokens_per_batch)
+        out = np.zeros((len(texts), 0), dtype=np.float32)
+        parallel = self.processes > 1 and len(texts) >= self.min_parallel
+        if texts:
+            out = self._encode_pool(texts, batches, out) if parallel else self._encode_local(texts, batches, out)
+        elapsed = time.perf_counter() - start
+
+        lengths = [len(text.split()) for text in texts]
+        padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+        self.last_stats = {
+            'texts': len(texts),
+            'batches': len(batches),
+            'processes': self.processes if parallel else 1,
+            'seconds': elapsed,
+            'texts_per_second': len(texts) / elapsed if elapsed else 0.0,
+            'padding_ratio': padded / sum(lengths) if sum(lengths) else 1.0
+        }
+        self.logger.info(f"Encoded {len(texts)} texts in {elapsed:.1f}s "
+                         f"({self.last_stats['texts_per_second']:.1f} texts/s, {len(batches)} batches, "
+                         f"{self.last_stats['processes']} processes)")
+        return out
@@ -0,0 +1,260 @@
+import argparse
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Opening lines of the "no match" replies of both knowledge bases
+FALLBACK_PREFIXES = (
+    "I can help you with information about",
+    "Please specify which department",
+)
+
+def iter_chats(path: Path, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Dict]]:
+    """Stream (chat_id, chat) pairs from a chat_history.json-style object without
+    loading the whole file, so memory is bounded by the largest single chat"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip(chars: str):
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number or literal at the buffer edge may be truncated
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        fill()
+        skip(' \t\r\n')
+        if pos >= len(buffer) or buffer[pos] != '{':
+            raise ValueError(f"{path} is not a JSON object")
+        pos += 1
+        while True:
+            skip(' \t\r\n,')
+            if pos >= len(buffer) or buffer[pos] == '}':
+                return
+            chat_id = decode()
+            skip(' \t\r\n:')
+            yield chat_id, decode()
+
+def is_fallback(content: str) -> bool:
+    """True for the generic reply served when no matcher found an answer"""
+    return content.lstrip().startswith(FALLBACK_PREFIXES)
+
+class GIKIChatAnalytics:
+    """Mines unanswered queries from the chat store and clusters them into intents.
+
+    Runs as a batch job or incrementally: per-chat message offsets and the cluster
+    centroids are persisted, so each run only encodes messages added since the last."""
+
+    def __init__(self, chat_file: Path = Path("chat_data") / "chat_history.json",
+                 output_dir: Path = Path("data"), encoder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 similarity_threshold: float = 0.75, max_clusters: int = 500, batch_size: int = 256):
+        self.chat_file = Path(chat_file)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        self.state_file = self.output_dir / 'analytics_state.json'
+        self.centroids_file = self.output_dir / 'analytics_centroids.npy'
+        self.report_file = self.output_dir / 'unanswered_report.json'
+        self.similarity_threshold = similarity_threshold
+        self.max_clusters = max_clusters
+        self.batch_size = batch_size
+        self._encoder = encoder
+        self.setup_logging()
+        self.load_state()
+
+    def setup_logging(self):
+        """Setup logging configuration"""
+        logging.basicConfig(
+            filename=self.output_dir / 'analytics.log',
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        self.logger = logging.getLogger('ChatAnalytics')
+
+    @property
+    def encoder(self) -> Callable[[List[str]], np.ndarray]:
+        """Sentence encoder, loaded only when there is something to encode"""
+        if self._encoder is None:
+            from model_trainer import GIKIModelTrainer
+            model = GIKIModelTrainer().model
+            self._encoder = lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True)
+        return self._encoder
+
+    def load_state(self):
+        """Load offsets, cluster stats and centroids from the previous run"""
+        self.state = {'offsets': {}, 'clusters': [], 'total_user_messages': 0, 'total_unanswered': 0}
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        try:
+            if self.state_file.exists():
+                with open(self.state_file, 'r') as f:
+                    self.state = json.load(f)
+            if self.centroids_file.exists():
+                self.centroids = np.load(self.centroids_file)
+        except Exception as e:
+            self.logger.error(f"Error loading analytics state, starting fresh: {str(e)}")
+
+    def save_state(self):
+        """Persist offsets, cluster stats and centroids"""
+        with open(self.state_file, 'w') as f:
+            json.dump(self.state, f)
+        np.save(self.centroids_file, self.centroids)
+
+    def iter_unanswered(self) -> Iterator[str]:
+        """Yield user queries answered with a fallback, skipping already processed messages"""
+        offsets = self.state['offsets']
+        shard_dir = self.chat_file.parent / 'shards'
+        if shard_dir.exists():
+            from chat_store import ShardedChatStore
+            chats = ShardedChatStore(self.chat_file.parent).iter_chats()
+        else:
+            chats = iter_chats(self.chat_file)
+        for chat_id, chat in chats:
+            messages = chat.get('messages', [])
+            start = offsets.get(chat_id, 0)
+            # Stop before a trailing user message whose reply hasn't been stored yet
+            end = len(messages) - 1 if messages and messages[-1].get('role') == 'user' else len(messages)
+            for i in range(start, end):
+                message = messages[i]
+                if message.get('role') != 'user':
+                    continue
+                self.state['total_user_messages'] += 1
+                reply = messages[i + 1] if i + 1 < len(messages) else None
+                if reply and reply.get('role') == 'assistant' and is_fallback(reply.get('content', '')):
+                    self.state['total_unanswered'] += 1
+                    yield message.get('content', '').strip()
+            offsets[chat_id] = max(start, end)
+
+    def _cluster_batch(self, queries: List[str]):
+        """Assign a batch of queries to the nearest centroid or open new clusters"""
+        vectors = np.asarray(self.encoder(queries), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        if self.centroids.size == 0:
+            self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        # One matrix product assigns everything that fits an existing cluster
+        if len(self.centroids):
+            scores = vectors @ self.centroids.T
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(vectors)), best]
+        else:
+            best = np.full(len(vectors), -1)
+            best_scores = np.full(len(vectors), -1.0)
+
+        clusters = self.state['clusters']
+        for i, query in enumerate(queries):
+            cluster_id = int(best[i])
+            if best_scores[i] < self.similarity_threshold:
+                if len(self.centroids) < self.max_clusters:
+                    self.centroids = np.vstack([self.centroids, vectors[i:i + 1]])
+                    clusters.append({'label': query, 'count': 0, 'examples': {}})
+                    cluster_id = len(clusters) - 1
+                    # Later queries in this batch may belong to the new cluster
+                    if i + 1 < len(queries):
+                        new_scores = vectors[i + 1:] @ vectors[i]
+                        better = new_scores > best_scores[i + 1:]
+                        best[i + 1:][better] = cluster_id
+                        best_scores[i + 1:][better] = new_scores[better]
+
+            cluster = clusters[cluster_id]
+            count = cluster['count']
+            # Running mean keeps the centroid representative as the cluster grows
+            centroid = (self.centroids[cluster_id] * count + vectors[i]) / (count + 1)
+            self.centroids[cluster_id] = centroid / (np.linalg.norm(centroid) or 1.0)
+            cluster['count'] = count + 1
+            examples = cluster['examples']
+            key = query.lower()
+            if key in examples or len(examples) < 20:
+                examples[key] = examples.get(key, 0) + 1
+
+    def run(self, full: bool = False) -> Dict:
+        """Process new messages (or everything with full=True) and write the report"""
+        if full:
+            self.state = {'offsets': {}, 'clusters': [], 'total_user_messages': 0, 'total_unanswered': 0}
+            self.centroids = np.zeros((0, 0), dtype=np.float32)
+
+        batch, processed = [], 0
+        for query in self.iter_unanswered():
+            if not query:
+                continue
+            batch.append(query)
+            if len(batch) >= self.batch_size:
+                self._cluster_batch(batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            self._cluster_batch(batch)
+            processed += len(batch)
+
+        self.save_state()
+        report = self.build_report()
+        with open(self.report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.logger.info(f"Analytics run processed {processed} new unanswered queries")
+        return report
+
+    def build_report(self, top_n: int = 25) -> Dict:
+        """Top unanswered intents by frequency"""
+        total_user = self.state['total_user_messages']
+        total_unanswered = self.state['total_unanswered']
+        clusters = sorted(self.state['clusters'], key=lambda c: c['count'], reverse=True)
+
+        intents = []
+        for cluster in clusters[:top_n]:
+            examples = Counter(cluster['examples'])
+            intents.append({
+                'intent': examples.most_common(1)[0][0] if examples else cluster['label'],
+                'count': cluster['count'],
+                'share_of_unanswered': cluster['count'] / total_unanswered if total_unanswered else 0.0,
+                'examples': [text for text, _ in examples.most_common(5)]
+            })
+
+        return {
+            'generated': datetime.now().isoformat(),
+            'user_messages': total_user,
+            'unanswered': total_unanswered,
+            'fallback_rate': total_unanswered / total_user if total_user else 0.0,
+            'clusters': len(clusters),
+            'top_intents': intents
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the most frequent unanswered queries")
+    parser.add_argument('--full', action='store_true', help="reprocess the whole chat store")
+    parser.add_argument('--threshold', type=float, default=0.75, help="cosine similarity to join a cluster")
+    args = parser.parse_args()
+
+    analytics = GIKIChatAnalytics(similarity_threshold=args.threshold)
+    print(json.dumps(analytics.run(full=args.full), indent=2))
@@ -0,0 +1,137 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from chat_search import message_timestamp
+from chat_store import ShardedChatStore, file_lock
+
+class ChatArchive:
+    """Compressed, append-only archive for chats that are no longer active.
+
+    Every chat is stored as its own gzip member holding one JSON line, so the file as a
+    whole is still valid gzip'd JSONL (zcat works), while the offset index allows reading
+    a single chat by id with one seek and one small decompress."""
+
+    def __init__(self, data_dir: Path = Path("chat_data"), compresslevel: int = 6):
+        self.archive_dir = Path(data_dir) / 'archive'
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.archive_file = self.archive_dir / 'chats.jsonl.gz'
+        self.index_file = self.archive_dir / 'index.json'
+        self.lock_file = self.archive_dir / 'archive.lock'
+        self.compresslevel = compresslevel
+        self.logger = logging.getLogger('ChatArchive')
+        self._index_mtime = None
+        self._index: Dict[str, Dict] = {}
+
+    @property
+    def index(self) -> Dict[str, Dict]:
+        """chat_id -> {offset, length, title, created_at}, re-read when another process updates it"""
+        try:
+            mtime = self.index_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._index_mtime:
+            with open(self.index_file, 'r') as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def __contains__(self, chat_id: str) -> bool:
+        return chat_id in self.index
+
+    def _save_index(self, index: Dict):
+        tmp_file = self.index_file.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+
+    def archive_chats(self, chats: Dict) -> int:
+        """Append chats to the archive; a re-archived chat's index entry points to the newest copy"""
+        if not chats:
+            return 0
+        with file_lock(self.lock_file):
+            index = dict(self.index)
+            with open(self.archive_file, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for chat_id, chat in chats.items():
+                    record = json.dumps({'chat_id': chat_id, **chat}, separators=(',', ':')) + '\n'
+                    data = gzip.compress(record.encode('utf-8'), compresslevel=self.compresslevel)
+                    f.write(data)
+                    index[chat_id] = {
+                        'offset': offset,
+                        'length': len(data),
+                        'title': chat.get('title', 'Untitled Chat'),
+                        'created_at': chat.get('created_at')
+                    }
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # The data is durable before the index points at it
+            self._save_index(index)
+        return len(chats)
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """Forget an archived chat; its bytes stay in the append-only file but are no
+        longer reachable by id, listing or iteration"""
+        with file_lock(self.lock_file):
+            index = dict(self.index)
+            if index.pop(chat_id, None) is None:
+                return False
+            self._save_index(index)
+        return True
+
+    def load_chat(self, chat_id: str) -> Optional[Dict]:
+        """Read one archived chat by id"""
+        entry = self.index.get(chat_id)
+        if entry is None:
+            return None
+        with open(self.archive_file, 'rb') as f:
+            f.seek(entry['offset'])
+            record = json.loads(gzip.decompress(f.read(entry['length'])))
+        record.pop('chat_id', None)
+        return record
+
+    def iter_chats(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield the current copy of every archived chat in file order"""
+        entries = sorted(self.index.items(), key=lambda item: item[1]['offset'])
+        if not entries:
+            return
+        with open(self.archive_file, 'rb') as f:
+            for chat_id, entry in entries:
+                f.seek(entry['offset'])
+                record = json.loads(gzip.decompress(f.read(entry['length'])))
+                record.pop('chat_id', None)
+                yield chat_id, record
+
+    def list_chats(self) -> List[Dict]:
+        """Metadata of archived chats, without decompressing anything"""
+        return [{'chat_id': chat_id, 'title': entry['title'], 'created_at': entry['created_at']}
+                for chat_id, entry in self.index.items()]
+
+def last_activity(chat: Dict) -> float:
+    """Epoch seconds of a chat's latest message (or its creation)"""
+    messages = chat.get('messages', [])
+    return message_timestamp(messages[-1] if messages else {}, chat)
+
+def archive_old_chats(store: ShardedChatStore, archive: ChatArchive, days: float) -> int:
+    """Move chats idle for more than `days` from the hot store into the archive"""
+    cutoff = time.time() - days * 24 * 60 * 60
+    moved = store.move_out(lambda chat: last_activity(chat) < cutoff, archive.archive_chats)
+    archive.logger.info(f"Archived {moved} chats idle for more than {days} days")
+    return moved
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move idle chats into the compressed archive")
+    parser.add_argument('--days', type=float, default=30, help="archive chats idle for this many days")
+    parser.add_argument('--data-dir', type=Path, default=Path("chat_data"))
+    args = parser.parse_args()
+
+    store = ShardedChatStore(args.data_dir)
+    print(f"Archived {archive_old_chats(store, ChatArchive(args.data_dir), args.days)} chats")
@@ -0,0 +1,333 @@
+import streamlit as st
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from datetime import datetime
+from metrics import metrics
+from query_normalizer import NormalizedQuery, normalize_query
+from profiler import profiler
+from conversation_context import ConversationContext, is_follow_up
+from chat_search import ChatSearchIndex, TimeBound
+from chat_store import ShardedChatStore
+from write_behind import WriteBehindQueue
+from chat_archive import ChatArchive, archive_old_chats
+from embedding_service import EmbeddingClient
+from giki_knowledge import GIKIKnowledgeBase as DatasetKnowledgeBase
+
+# Calibrated probability that the matched stored question is right (the search
+# returns one on every path) a semantic match needs before it replaces the default
+# reply. Even odds; under the default cosine calibration that is a cosine of 0.6
+SEMANTIC_MIN_SCORE = 0.5
+
+# How long a reply waits on the embedding service before falling back to the
+# knowledge-base default
+SEMANTIC_TIMEOUT = float(os.environ.get('GIKI_SEMANTIC_TIMEOUT_MS', 150)) / 1000
+
+class GIKIKnowledgeBase(DatasetKnowledgeBase):
+    """The app's knowledge base: answers from giki_dataset.json (reloaded in the
+    background when the file changes), with a static layer for what the dataset does
+    not cover (basic facts, location, sports, events) as the fallback"""
+    
+    def __init__(self, reload_interval: Optional[float] = None):
+        super().__init__(reload_interval=reload_interval)
+        
+        # Basic information about GIKI
+        self.basic_info = {
+            "name": "Ghulam Ishaq Khan Institute of Engineering Sciences and Technology",
+            "location": "Topi, Khyber Pakhtunkhwa, Pakistan",
+            "established": "1993",
+            "type": "Private university",
+            "campus": "400 acres"
+        }
+        
+        # Events calendar
+        self.events = {
+            "upcoming": [
+                {
+                    "name": "Spring Break",
+                    "date": "March 25-29, 2024",
+                    "description": "Spring semester break for all students"
+                },
+                {
+                    "name": "Final Examinations",
+                    "date": "May 20-31, 2024",
+                    "description": "Spring semester final examinations"
+                },
+                {
+                    "name": "Graduation Ceremony",
+                    "date": "June 15, 2024",
+                    "description": "Annual graduation ceremony for the Class of 2024"
+                }
+            ],
+            "annual": [
+                {
+                    "name": "GIKI Sports Gala",
+                    "usual_month": "February-March",
+                    "description": "Annual sports competition between departments"
+                },
+                {
+                    "name": "Job Fair",
+                    "usual_month": "April",
+                    "description": "Annual job fair connecting students with potential employers"
+                }
+            ]
+        }
+        
+        # Static FAQ patterns; the dataset's own faq_patterns are tried first
+        self.static_patterns = {
+            "what is giki": self._get_basic_info,
+            "about giki": self._get_basic_info,
+            "where is giki": self._get_location_info,
+            "location": self._get_location_info,
+            "sports": self._get_sports_info,
+            "events": self._get_next_event
+        }
+    
+    def _get_basic_info(self) -> str:
+        """Returns basic information about GIKI"""
+        return f"""GIKI ({self.basic_info['name']}) is a {self.basic_info['type']} established in {self.basic_info['established']}.
+        It is located in {self.basic_info['location']} with a campus size of {self.basic_info['campus']}."""
+    
+    def _get_location_info(self) -> str:
+        """Returns location information"""
+        return f"GIKI is located in {self.basic_info['location']}. The campus spans {self.basic_info['campus']}."
+    
+    def _get_sports_info(self) -> str:
+        """Returns information about sports facilities and events"""
+        return """GIKI has excellent sports facilities including:
+        - Sports Complex with indoor games
+        - Gymnasium
+        - Cricket Ground
+        - Football Ground
+        - Basketball Courts
+        
+        The annual Sports Gala is held in February-March."""
+    
+    def _get_next_event(self) -> str:
+        """Returns information about the next upcoming event"""
+        if self.events["upcoming"]:
+            next_event = self.events["upcoming"][0]
+            return f"The next event is {next_event['name']} scheduled for {next_event['date']}. {next_event['description']}"
+        return "No upcoming events are currently scheduled."
+    
+    def find_match(self, query: Union[str, NormalizedQuery]) -> Optional[str]:
+        """Return the FAQ response for a query, or None if no pattern matches"""
+        normalized = normalize_query(query)
+        query = normalized.text
+        # One dataset state for the whole lookup, however a reload interleaves
+        state = self._state
+        
+        response = self._entity_answer(state, normalized)
+        if response:
+            return response
+        for pattern, response_func in self.faq_patterns.items():
+            if pattern in query:
+                return response_func(state, query)
+        for pattern, response_func in self.static_patterns.items():
+            if pattern in query:
+                return response_func()
+        return None
+    
+    @metrics.timed('giki_tier_seconds', tier='static_kb')
+    def get_response(self, query: Union[str, NormalizedQuery]) -> str:
+        """Generate a response based on the query"""
+        response = self.find_match(query)
+        if response is not None:
+            return response
+        
+        # Default response if no pattern matches
+        return """I can help you with information about:
+        - Basic information about GIKI
+        - Location and campus details
+        - Departments, faculty and labs
+        - Research centers
+        - Hostels and student societies
+        - Admission process
+        - Available facilities
+        - Academic programs
+        - Sports facilities
+        - Upcoming events
+        
+        Please ask about any of these topics!"""
+
+class ChatManager:
+    def __init__(self, data_dir: Path = Path("chat_data"), write_behind: bool = False,
+                 embedding_socket: Optional[Path] = None, watch_knowledge_base: bool = False):
+        self.logger = logging.getLogger('ChatManager')
+        self.DATA_DIR = Path(data_dir)
+        self.DATA_DIR.mkdir(exist_ok=True)
+        self.DATA_FILE = self.DATA_DIR / "chat_history.json"
+        # Sharded, lock-protected store; the legacy DATA_FILE is imported on first use
+        self.store = ShardedChatStore(self.DATA_DIR)
+        # With write-behind, save_chat/append_message return immediately and a
+        # background thread persists them in batches
+        self.write_behind = WriteBehindQueue(self.store) if write_behind else None
+        # Idle chats live in a compressed archive and are only read on demand
+        self.archive = ChatArchive(self.DATA_DIR)
+        # A long-lived (serving) manager follows edits to the dataset without a restart
+        reload_interval = float(os.environ.get('GIKI_KB_RELOAD_INTERVAL', 5)) if watch_knowledge_base else None
+        self.knowledge_base = GIKIKnowledgeBase(reload_interval=reload_interval or None)
+        # Semantic search runs in the shared embedding service (embedding_service.py),
+        # so this process never loads torch or the model
+        embedding_socket = embedding_socket or os.environ.get('GIKI_EMBEDDING_SOCKET')
+        self.semantic = EmbeddingClient(Path(embedding_socket), timeout=SEMANTIC_TIMEOUT) \
+            if embedding_socket else None
+        # Text-only window: the keyword matcher needs earlier turns, not embeddings
+        self.context = ConversationContext()
+        # Built from the store on first use, then kept current by append_message
+        self._search_index = None
+        self._search_lock = threading.Lock()
+    
+    def generate_chat_id(self) -> str:
+        """Generate a unique chat ID based on timestamp"""
+        return str(int(time.time() * 1000))
+    
+    def format_timestamp(self, timestamp: str) -> str:
+        """Format timestamp for display"""
+        try:
+            return datetime.fromtimestamp(int(timestamp)/1000).strftime('%b %d %H:%M')
+        except:
+            return "Unknown time"
+    
+    @metrics.timed('giki_stage_seconds', stage='load_chats')
+    @profiler.sectioned('load_chats')
+    def load_chats(self) -> Dict:
+        """Load chat history with error handling"""
+        try:
+            chats = self.store.load_all()
+            if self.write_behind is not None:
+                chats.update(self.write_behind.pending_snapshot())
+            # Ensure all chats have required fields
+            for chat_id, chat in chats.items():
+                if "created_at" not in chat:
+                    chat["created_at"] = chat_id if chat_id.isdigit() else self.generate_chat_id()
+                if "title" not in chat:
+                    chat["title"] = "Untitled Chat"
+                if "messages" not in chat:
+                    chat["messages"] = []
+            return chats
+        except Exception as e:
+            st.error(f"Error loading chat history: {e}")
+            return {}
+    
+    @metrics.timed('giki_stage_seconds', stage='save_chats')
+    @profiler.sectioned('save_chats')
+    def save_chats(self, chats: Dict) -> bool:
+        """Save chat history with error handling; only shards with changed chats are written"""
+        try:
+            self.store.save_chats(chats)
+            return True
+        except Exception as e:
+            st.error(f"Error saving chat history: {e}")
+            return False
+    
+    def save_chat(self, chat_id: str, chat: Dict) -> bool:
+        """Save a single chat, touching only its shard"""
+        if self.write_behind is not None:
+            self.write_behind.enqueue_chat(chat_id, chat)
+            return True
+        return self.save_chats({chat_id: chat})
+    
+    def delete_chat(self, chat_id: str, chats: Dict) -> bool:
+        """Delete a chat from history, including its archived copy"""
+        try:
+            if chat_id in chats:
+                del chats[chat_id]
+                self.context.reset(chat_id)
+                if self._search_index is not None:
+                    self._search_index.remove_chat(chat_id)
+                if self.write_behind is not None:
+                    self.write_behind.discard(chat_id)
+                self.store.delete_chat(chat_id)
+                # A reopened archived chat also has its archived copy
+                self.archive.delete_chat(chat_id)
+                return True
+            return False
+        except Exception as e:
+            st.error(f"Error deleting chat: {e}")
+            return False
+    
+    def load_archived_chat(self, chat_id: str) -> Optional[Dict]:
+        """Read a single archived chat; saving it again makes it hot"""
+        try:
+            return self.archive.load_chat(chat_id)
+        except Exception as e:
+            st.error(f"Error loading archived chat: {e}")
+            return None
+    
+    def list_archived_chats(self) -> List[Dict]:
+        """Titles and creation times of archived chats"""
+        return self.archive.list_chats()
+    
+    def archive_old_chats(self, days: float = 30) -> int:
+        """Move chats idle for more than `days` out of the hot store"""
+        return archive_old_chats(self.store, self.archive, days)
+    
+    def _get_search_index(self) -> ChatSearchIndex:
+        """Return the message index, building it from the chat store the first time"""
+        with self._search_lock:
+            if self._search_index is None:
+                index = ChatSearchIndex()
+                index.add_chats(self.load_chats())
+                # Archived chats are searchable too; hot copies take precedence
+                index.add_chats({chat_id: chat for chat_id, chat in self.archive.iter_chats()
+                                 if chat_id not in index.chat_docs})
+                self._search_index = index
+            return self._search_index
+    
+    def append_message(self, chat_id: str, chat: Dict, role: str, content: str) -> Dict:
+        """Append a message to a chat and add it to the search index once that is built"""
+        message = {"role": role, "content": content, "timestamp": self.generate_chat_id()}
+        chat["messages"].append(message)
+        if self._search_index is not None:
+            self._search_index.add_message(chat_id, len(chat["messages"]) - 1, message, int(message["timestamp"]) / 1000)
+        if self.write_behind is not None:
+            self.write_behind.enqueue_append(chat_id, chat, message)
+        return message
+    
+    def search_chats(self, query: str, since: TimeBound = None, until: TimeBound = None,
+                     role: Optional[str] = "user", limit: int = 50) -> List[Dict]:
+        """Full-text search over past conversations, newest first.
+        
+        Terms are AND-ed and "quoted phrases" must match exactly; since/until take a
+        datetime or epoch seconds. Searches user messages unless role is None."""
+        return self._get_search_index().search(query, since=since, until=until, role=role, limit=limit)
+    
+    def get_response(self, query: str, chat_id: Optional[str] = None, history: Optional[List[Dict]] = None) -> str:
+        """Get response from knowledge base.
+        
+        With a chat_id, a follow-up that matches nothing on its own (a short query with a
+        pronoun or without a topic, e.g. "and its fee?") is retried together with the
+        chat's recent turns; other unmatched queries get the semantic or default reply.
+        history is the chat's earlier messages, used to seed the context window after a
+        restart."""
+        with metrics.timer('giki_request_seconds', slow_query=query), profiler.section('matching'):
+            # Canonicalized once; every matcher below reuses it
+            normalized = normalize_query(query)
+            response = self.knowledge_base.find_match(normalized)
+            if response is None and chat_id is not None and is_follow_up(normalized.tokens):
+                # Most recent turn first, so the latest subject wins
+                for previous in reversed(self.context.previous_turns(chat_id, history)):
+                    response = self.knowledge_base.find_match(f"{normalize_query(previous).text} {normalized.text}")
+                    if response is not None:
+                        break
+            if response is None and self.semantic is not None and self.semantic.available():
+                try:
+                    turns = self.context.previous_turns(chat_id, history) if chat_id is not None else None
+                    matches = self.semantic.find_best_answer(query, top_k=1, chat_id=chat_id, turns=turns)
+                    if matches and matches[0][1] >= SEMANTIC_MIN_SCORE:
+                        response = matches[0][0]
+                except Exception as e:
+                    # Service slow or down; the knowledge base default still answers
+                    metrics.increment('giki_semantic_fallbacks_total')
+                    self.logger.warning(f"Embedding service failed, using the default reply: {e!r}")
+            if response is None:
+                response = self.knowledge_base.get_response(normalized)
+            if chat_id is not None:
+                self.context.add_turn(chat_id, query, history)
+        metrics.maybe_export()
+        return response
@@ -0,0 +1,138 @@
+import heapq
+import re
+import shlex
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Union
+
+TOKEN_RE = re.compile(r"\w+")
+
+TimeBound = Optional[Union[datetime, float, int]]
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for both indexing and queries"""
+    return TOKEN_RE.findall(text.lower())
+
+def message_timestamp(message: Dict, chat: Dict) -> float:
+    """Message time in epoch seconds; older messages fall back to the chat's creation time"""
+    value = message.get("timestamp") or chat.get("created_at") or 0
+    try:
+        return int(value) / 1000
+    except (TypeError, ValueError):
+        return 0.0
+
+class ChatSearchIndex:
+    """Incrementally maintained positional inverted index over chat messages.
+
+    Supports AND-ed term queries, quoted phrase queries and time filters. Postings map
+    term -> {doc_id: [positions]}, so a query touches only the postings of its terms."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self.docs: List[Optional[Dict]] = []
+        self.chat_docs: Dict[str, List[int]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(1 for doc in self.docs if doc is not None)
+
+    def add_message(self, chat_id: str, message_index: int, message: Dict, timestamp: float):
+        """Index one message; called on every append"""
+        tokens = tokenize(message.get("content", ""))
+        with self._lock:
+            doc_id = len(self.docs)
+            self.docs.append({
+                "chat_id": chat_id,
+                "message_index": message_index,
+                "message": message,
+                "timestamp": timestamp
+            })
+            self.chat_docs.setdefault(chat_id, []).append(doc_id)
+            for position, token in enumerate(tokens):
+                self.postings.setdefault(token, {}).setdefault(doc_id, []).append(position)
+
+    def add_chats(self, chats: Dict):
+        """Bulk-index a chat store as returned by ChatManager.load_chats"""
+        for chat_id, chat in chats.items():
+            for index, message in enumerate(chat.get("messages", [])):
+                self.add_message(chat_id, index, message, message_timestamp(message, chat))
+
+    def remove_chat(self, chat_id: str):
+        """Drop a chat's messages; their stale postings are skipped at query time"""
+        with self._lock:
+            for doc_id in self.chat_docs.pop(chat_id, []):
+                self.docs[doc_id] = None
+
+    def _candidates(self, tokens: List[str]) -> Set[int]:
+        """Documents containing every token, intersecting from the rarest posting list"""
+        lists = []
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if not posting:
+                return set()
+            lists.append(posting)
+        lists.sort(key=len)
+        result = set(lists[0])
+        for posting in lists[1:]:
+            result.intersection_update(posting.keys())
+            if not result:
+                break
+        return result
+
+    def _has_phrase(self, doc_id: int, phrase: List[str]) -> bool:
+        """Check that the phrase tokens occur at consecutive positions"""
+        starts = self.postings[phrase[0]][doc_id]
+        for offset, token in enumerate(phrase[1:], start=1):
+            positions = set(self.postings[token][doc_id])
+            starts = [p for p in starts if p + offset in positions]
+            if not starts:
+                return False
+        return True
+
+    @staticmethod
+    def _to_epoch(value: TimeBound) -> Optional[float]:
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return value.timestamp()
+        return float(value)
+
+    def search(self, query: str, since: TimeBound = None, until: TimeBound = None,
+               role: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Search messages. Bare words are AND-ed; "quoted text" must appear as a phrase.
+
+        Results are newest first."""
+        try:
+            parts = shlex.split(query)
+        except ValueError:
+            parts = query.split()
+        phrases = [tokenize(part) for part in parts if len(tokenize(part)) > 1]
+        terms = [token for part in parts for token in tokenize(part)]
+        if not terms:
+            return []
+
+        since_ts, until_ts = self._to_epoch(since), self._to_epoch(until)
+        hits = []
+        with self._lock:
+            for doc_id in self._candidates(terms):
+                doc = self.docs[doc_id]
+                if doc is None:
+                    continue
+                if since_ts is not None and doc["timestamp"] < since_ts:
+                    continue
+                if until_ts is not None and doc["timestamp"] > until_ts:
+                    continue
+                if role is not None and doc["message"].get("role") != role:
+                    continue
+                if any(not self._has_phrase(doc_id, phrase) for phrase in phrases):
+                    continue
+                hits.append(doc)
+
+        hits = heapq.nlargest(limit, hits, key=lambda doc: doc["timestamp"])
+        return [{
+            "chat_id": doc["chat_id"],
+            "message_index": doc["message_index"],
+            "role": doc["message"].get("role"),
+            "content": doc["message"].get("content", ""),
+            "timestamp": doc["timestamp"]
+        } for doc in hits]
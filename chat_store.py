@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive advisory lock held for the duration of the block, across processes"""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def try_lock(f) -> bool:
+    """Take an exclusive lock on an open file without waiting; False if another process holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def message_key(message: Dict) -> Tuple:
+    """Identity of a message when merging concurrent edits of a chat"""
+    return message.get('timestamp'), message.get('role'), message.get('content')
+
+class ShardedChatStore:
+    """Chat history sharded by chat id across JSON files.
+
+    Each shard has its own advisory lock, so writers in different processes only
+    contend when they touch the same shard. Every chat carries a version; a writer
+    holding a stale version has its new messages merged into the stored chat instead
+    of overwriting it, so no message is ever lost."""
+
+    def __init__(self, data_dir: Path = Path("chat_data"), num_shards: int = 16):
+        self.data_dir = Path(data_dir)
+        self.shard_dir = self.data_dir / 'shards'
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger('ChatStore')
+        self.num_shards = self._load_num_shards(num_shards)
+        self.migrate_legacy()
+
+    def _load_num_shards(self, default: int) -> int:
+        """The shard count is fixed once the store exists, or ids would map elsewhere"""
+        meta_file = self.shard_dir / 'meta.json'
+        with file_lock(self.shard_dir / 'meta.lock'):
+            if meta_file.exists():
+                with open(meta_file, 'r') as f:
+                    return json.load(f)['num_shards']
+            with open(meta_file, 'w') as f:
+                json.dump({'num_shards': default}, f)
+            return default
+
+    def shard_for(self, chat_id: str) -> int:
+        """Stable shard number for a chat id (crc32, not hash(), so all processes agree)"""
+        return zlib.crc32(chat_id.encode()) % self.num_shards
+
+    def _shard_path(self, shard: int) -> Path:
+        return self.shard_dir / f'shard_{shard:03d}.json'
+
+    def _lock_path(self, shard: int) -> Path:
+        return self.shard_dir / f'shard_{shard:03d}.lock'
+
+    def _read_shard(self, shard: int) -> Dict:
+        """Read a shard; writes replace files atomically so readers need no lock"""
+        path = self._shard_path(shard)
+        if not path.exists():
+            return {'chats': {}, 'deleted': {}}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_shard(self, shard: int, data: Dict):
+        """Atomically replace a shard file (caller holds the shard lock)"""
+        path = self._shard_path(shard)
+        tmp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def migrate_legacy(self):
+        """Import chat_data/chat_history.json the first time the sharded store is used"""
+        legacy_file = self.data_dir / 'chat_history.json'
+        marker = self.shard_dir / 'migrated'
+        if not legacy_file.exists() or marker.exists():
+            return
+        with file_lock(self.shard_dir / 'meta.lock'):
+            if marker.exists():
+                return
+            with open(legacy_file, 'r') as f:
+                chats = json.load(f)
+            self.save_chats(chats)
+            marker.touch()
+            self.logger.info(f"Migrated {len(chats)} chats from {legacy_file}")
+
+    def iter_chats(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield every chat, reading one shard at a time"""
+        for shard in range(self.num_shards):
+            for chat_id, chat in self._read_shard(shard)['chats'].items():
+                yield chat_id, chat
+
+    def load_all(self) -> Dict:
+        """All chats across shards"""
+        return dict(self.iter_chats())
+
+    def load_chat(self, chat_id: str) -> Dict:
+        """A single chat, or None"""
+        return self._read_shard(self.shard_for(chat_id))['chats'].get(chat_id)
+
+    def _merge(self, stored: Dict, incoming: Dict) -> Dict:
+        """Merge a stale writer's copy into the stored chat, keeping every message"""
+        merged = dict(stored)
+        known = {message_key(m) for m in stored.get('messages', [])}
+        merged['messages'] = list(stored.get('messages', [])) + \
+            [m for m in incoming.get('messages', []) if message_key(m) not in known]
+        if stored.get('title') in (None, 'New Chat'):
+            merged['title'] = incoming.get('title', stored.get('title'))
+        return merged
+
+    def save_chats(self, chats: Dict) -> List[str]:
+        """Write changed chats, one lock and one file write per affected shard.
+
+        Chats are updated in place with their new version (and merged messages after
+        a conflict). Returns the ids of chats that had to be merged."""
+        by_shard: Dict[int, List[str]] = {}
+        for chat_id in chats:
+            by_shard.setdefault(self.shard_for(chat_id), []).append(chat_id)
+
+        conflicts = []
+        for shard, chat_ids in by_shard.items():
+            with file_lock(self._lock_path(shard)):
+                data = self._read_shard(shard)
+                changed = False
+                for chat_id in chat_ids:
+                    if chat_id in data['deleted']:
+                        continue
+                    chat = chats[chat_id]
+                    stored = data['chats'].get(chat_id)
+                    if stored is not None:
+                        if {k: v for k, v in stored.items() if k != 'version'} == \
+                                {k: v for k, v in chat.items() if k != 'version'}:
+                            chat['version'] = stored.get('version', 0)
+                            continue
+                        if chat.get('version', 0) != stored.get('version', 0):
+                            # Someone else saved this chat since we loaded it
+                            conflicts.append(chat_id)
+                            merged = self._merge(stored, chat)
+                            chat.clear()
+                            chat.update(merged)
+                    chat['version'] = (stored or {}).get('version', 0) + 1
+                    data['chats'][chat_id] = chat
+                    changed = True
+                if changed:
+                    self._write_shard(shard, data)
+
+        if conflicts:
+            self.logger.info(f"Merged concurrent updates for chats: {', '.join(conflicts)}")
+        return conflicts
+
+    def move_out(self, predicate: Callable[[Dict], bool], sink: Callable[[Dict], object]) -> int:
+        """Remove chats matching predicate, shard by shard, after handing them to sink.
+
+        sink runs under the shard lock before the shard is rewritten, so a crash can
+        leave a chat in both places but never in neither."""
+        moved = 0
+        for shard in range(self.num_shards):
+            with file_lock(self._lock_path(shard)):
+                data = self._read_shard(shard)
+                selected = {chat_id: chat for chat_id, chat in data['chats'].items() if predicate(chat)}
+                if not selected:
+                    continue
+                sink(selected)
+                for chat_id in selected:
+                    del data['chats'][chat_id]
+                self._write_shard(shard, data)
+                moved += len(selected)
+        return moved
+    
+    def delete_chat(self, chat_id: str) -> bool:
+        """Delete a chat and tombstone it so stale copies elsewhere don't resurrect it"""
+        shard = self.shard_for(chat_id)
+        with file_lock(self._lock_path(shard)):
+            data = self._read_shard(shard)
+            existed = data['chats'].pop(chat_id, None) is not None
+            data['deleted'][chat_id] = True
+            self._write_shard(shard, data)
+        return existed
+
+    def size_bytes(self) -> int:
+        """Total size of all shard files"""
+        return sum(self._shard_path(i).stat().st_size for i in range(self.num_shards)
+                   if self._shard_path(i).exists())
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Words that point back at an earlier turn's subject
+ANAPHORS = frozenset({'it', 'its', 'they', 'them', 'their', 'theirs', 'there', 'that', 'those',
+                      'this', 'these', 'he', 'she', 'him', 'his', 'her', 'same'})
+# Openers of elliptical follow-ups ("and the labs?", "what about fee?")
+ELLIPSIS_OPENERS = (('and',), ('also',), ('what', 'about'), ('how', 'about'), ('and', 'what', 'about'))
+# Words a follow-up may ask about without naming a topic of its own
+ASPECT_WORDS = frozenset({'fee', 'cost', 'facilities', 'programs', 'program', 'labs', 'lab', 'location',
+                          'deadline', 'deadlines', 'requirements', 'criteria', 'faculty', 'events',
+                          'capacity', 'contact', 'seats', 'scholarships', 'timings', 'research', 'head',
+                          'the', 'a', 'an', 'is', 'are', 'what', 'when', 'where', 'how', 'many', 'much',
+                          'of', 'for', 'in', 'do', 'does', 'about', 'and', 'also'})
+FOLLOW_UP_MAX_TOKENS = 6
+
+def is_follow_up(tokens) -> bool:
+    """Whether a query leans on an earlier turn: a short query with a pronoun
+    ("what are its labs?"), or an elliptical one that names no topic of its own
+    ("and the fee?"). "thanks", "hello" and "what about hostels?" are not."""
+    tokens = tuple(tokens)
+    if not tokens or len(tokens) > FOLLOW_UP_MAX_TOKENS:
+        return False
+    if any(token in ANAPHORS for token in tokens):
+        return True
+    opener = next((o for o in ELLIPSIS_OPENERS if tokens[:len(o)] == o), None)
+    return opener is not None and all(token in ASPECT_WORDS for token in tokens[len(opener):])
+
+class ConversationContext:
+    """Rolling, size-bounded window of recent user turns per chat.
+
+    Each turn is encoded once and its embedding is kept with the turn, so building a
+    context-weighted query vector costs one encode plus a window_size weighted sum,
+    however long the conversation is."""
+
+    def __init__(self, encoder: Optional[Callable[[str], np.ndarray]] = None, window_size: int = 4,
+                 decay: float = 0.35, max_chats: int = 1000):
+        self.encoder = encoder
+        self.window_size = window_size
+        self.decay = decay
+        self.max_chats = max_chats
+        self._windows: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _encode(self, text: str) -> Optional[np.ndarray]:
+        if self.encoder is None:
+            return None
+        vector = np.asarray(self.encoder(text), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _window(self, chat_id: str, history: Optional[List[Dict]] = None) -> deque:
+        """Get the window for a chat, seeding it from stored messages after a restart"""
+        with self._lock:
+            window = self._windows.get(chat_id)
+            if window is not None:
+                self._windows.move_to_end(chat_id)
+                return window
+
+        window = deque(maxlen=self.window_size)
+        if history:
+            user_turns = [m['content'] for m in history if m.get('role') == 'user' and m.get('content')]
+            for text in user_turns[-self.window_size:]:
+                window.append((text, self._encode(text)))
+
+        with self._lock:
+            window = self._windows.setdefault(chat_id, window)
+            self._windows.move_to_end(chat_id)
+            while len(self._windows) > self.max_chats:
+                self._windows.popitem(last=False)
+        return window
+
+    def add_turn(self, chat_id: str, text: str, history: Optional[List[Dict]] = None,
+                 encode: bool = True) -> Optional[np.ndarray]:
+        """Record a user turn and return its (normalized) embedding.
+
+        With encode=False the turn is kept as text and only encoded if a later
+        query_vector needs it."""
+        window = self._window(chat_id, history)
+        vector = self._encode(text) if encode else None
+        window.append((text, vector))
+        return vector
+
+    def sync(self, chat_id: str, turns: List[str]):
+        """Make a chat's window hold exactly these user turns (oldest first), keeping the
+        vectors of turns it already has; for a process that sees only some of a chat's
+        turns, e.g. the embedding service behind the app"""
+        window = self._window(chat_id)
+        known = {text: vector for text, vector in window}
+        if [text for text, _ in window] == list(turns[-self.window_size:]):
+            return
+        window.clear()
+        for text in turns[-self.window_size:]:
+            window.append((text, known.get(text)))
+
+    def previous_turns(self, chat_id: str, history: Optional[List[Dict]] = None) -> List[str]:
+        """Texts of the turns currently in the window, oldest first"""
+        return [text for text, _ in self._window(chat_id, history)]
+
+    def query_vector(self, chat_id: str, query: str, history: Optional[List[Dict]] = None) -> np.ndarray:
+        """Context-weighted, normalized query vector; the query is recorded as a new turn.
+
+        The current turn has weight 1 and the k-th previous turn decay**k."""
+        if self.encoder is None:
+            raise ValueError("ConversationContext needs an encoder to build query vectors")
+
+        window = self._window(chat_id, history)
+        previous = []
+        for i, (text, vector) in enumerate(list(window)):
+            if vector is None:
+                vector = self._encode(text)
+                window[i] = (text, vector)
+            previous.append(vector)
+        current = self.add_turn(chat_id, query, history)
+
+        combined = current.copy()
+        weight = 1.0
+        for vector in reversed(previous):
+            weight *= self.decay
+            combined += weight * vector
+        norm = np.linalg.norm(combined)
+        return combined / norm if norm else combined
+
+    def reset(self, chat_id: str):
+        """Forget a chat's window (e.g. when the chat is deleted)"""
+        with self._lock:
+            self._windows.pop(chat_id, None)
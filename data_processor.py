@@ -1,18 +1,14 @@
-import pandas as pd
-import numpy as np
-from typing import List, Dict, Tuple
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from pathlib import Path
 import json
-import requests
-from bs4 import BeautifulSoup
 import logging
 from datetime import datetime
-from sklearn.model_selection import train_test_split
-import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
+from query_normalizer import normalize_query
+
+# pandas, sklearn, nltk, requests, bs4 and numpy are imported where they are used, so
+# importing this module (e.g. from train.py or the pipeline) stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
 
 class GIKIDataProcessor:
     def __init__(self):
@@ -33,6 +29,10 @@ class GIKIDataProcessor:
     def setup_nltk(self):
         """Download required NLTK data"""
         try:
+            import nltk
+            from nltk.corpus import stopwords
+            from nltk.stem import WordNetLemmatizer
+            
             nltk.download('punkt')
             nltk.download('stopwords')
             nltk.download('wordnet')
@@ -42,7 +42,10 @@ class GIKIDataProcessor:
             self.logger.error(f"Error setting up NLTK: {str(e)}")
     
     def collect_web_data(self):
-        """Collect data from various web sources"""
+        """Collect data from various web sources.
+        
+        Paragraphs and headers are kept in document order, so pages can be re-joined
+        into passages."""
         sources = {
             'giki_main': 'https://giki.edu.pk/',
             'wikipedia': 'https://en.wikipedia.org/wiki/Ghulam_Ishaq_Khan_Institute_of_Engineering_Sciences_and_Technology',
@@ -51,6 +54,9 @@ class GIKIDataProcessor:
             'admissions': 'https://giki.edu.pk/admissions/'
         }
         
+        import requests
+        from bs4 import BeautifulSoup
+        
         collected_data = []
         
         for source_name, url in sources.items():
@@ -58,27 +64,18 @@ class GIKIDataProcessor:
                 response = requests.get(url)
                 soup = BeautifulSoup(response.text, 'html.parser')
                 
-                # Extract paragraphs
-                paragraphs = soup.find_all('p')
-                for p in paragraphs:
-                    text = p.get_text().strip()
-                    if len(text) > 50:  # Filter out short snippets
-                        collected_data.append({
-                            'text': text,
-                            'source': source_name,
-                            'url': url,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                
-                # Extract headers
-                headers = soup.find_all(['h1', 'h2', 'h3'])
-                for h in headers:
-                    text = h.get_text().strip()
-                    if len(text) > 20:  # Filter out short headers
+                # Extract paragraphs and headers
+                for position, element in enumerate(soup.find_all(['h1', 'h2', 'h3', 'p'])):
+                    text = element.get_text().strip()
+                    kind = 'paragraph' if element.name == 'p' else 'header'
+                    # Filter out short snippets and headers
+                    if len(text) > (50 if kind == 'paragraph' else 20):
                         collected_data.append({
                             'text': text,
                             'source': source_name,
                             'url': url,
+                            'kind': kind,
+                            'position': position,
                             'timestamp': datetime.now().isoformat()
                         })
             
@@ -89,23 +86,26 @@ class GIKIDataProcessor:
     
     def preprocess_text(self, text: str) -> str:
         """Preprocess text data"""
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove special characters and digits
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
-        
-        # Tokenize
-        tokens = word_tokenize(text)
+        # Same canonicalization as live queries (case, Unicode, contractions, synonyms),
+        # so processed training text and queries agree
+        tokens = normalize_query(text).tokens
         
-        # Remove stopwords and lemmatize
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens if token not in self.stop_words]
+        # Drop digits, remove stopwords and lemmatize
+        tokens = [self.lemmatizer.lemmatize(token) for token in tokens
+                  if token.isalpha() and token not in self.stop_words]
         
         return ' '.join(tokens)
     
-    def generate_training_pairs(self, texts: List[Dict]) -> List[Dict]:
-        """Generate question-answer pairs from texts"""
+    def generate_training_pairs(self, texts: List[Dict], passages: Optional[List[Dict]] = None) -> List[Dict]:
+        """Generate question-answer pairs from texts, each with the passage that contains
+        its answer as context"""
         training_pairs = []
+        if passages is None:
+            from passage_store import chunk_pages
+            passages = chunk_pages(texts)
+        passages_by_url: Dict[str, List[Dict]] = {}
+        for passage in passages:
+            passages_by_url.setdefault(passage['url'], []).append(passage)
         
         # Question patterns
         patterns = [
@@ -118,17 +118,25 @@ class GIKIDataProcessor:
             ("which", "Which")
         ]
         
+        import nltk
+        
         for text_dict in texts:
             text = text_dict['text']
             sentences = nltk.sent_tokenize(text)
             
             for sentence in sentences:
+                # Passages are whitespace-joined, so compare on the same spacing
+                flat = ' '.join(sentence.split())
+                passage = next((p for p in passages_by_url.get(text_dict['url'], []) if flat in p['text']), None)
+                
                 # Generate different types of questions
                 for q_word, pattern in patterns:
                     if len(sentence.split()) > 5:  # Only use meaningful sentences
                         training_pairs.append({
                             'question': f"{pattern} {sentence.strip('.')}?",
                             'answer': sentence,
+                            'context': passage['text'] if passage else sentence,
+                            'passage_id': passage['id'] if passage else None,
                             'source': text_dict['source'],
                             'url': text_dict['url']
                         })
@@ -138,13 +146,22 @@ class GIKIDataProcessor:
     def create_dataset(self):
         """Create and save the training dataset"""
         try:
+            import pandas as pd
+            from sklearn.model_selection import train_test_split
+            from passage_store import PassageStore, chunk_pages
+            
             # Collect web data
             self.logger.info("Collecting web data...")
             web_data = self.collect_web_data()
             
+            # Chunk pages into passages and index them for direct retrieval
+            self.logger.info("Indexing passages...")
+            passages = chunk_pages(web_data)
+            PassageStore().build(passages)
+            
             # Generate training pairs
             self.logger.info("Generating training pairs...")
-            training_pairs = self.generate_training_pairs(web_data)
+            training_pairs = self.generate_training_pairs(web_data, passages)
             
             # Create DataFrame
             df = pd.DataFrame(training_pairs)
@@ -172,9 +189,15 @@ class GIKIDataProcessor:
             self.logger.error(f"Error creating dataset: {str(e)}")
             return False
     
-    def load_dataset(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def has_dataset(self) -> bool:
+        """Whether create_dataset has already written the train and test splits"""
+        return (self.data_dir / 'train_dataset.csv').exists() and (self.data_dir / 'test_dataset.csv').exists()
+
+    def load_dataset(self) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
         """Load the training and test datasets"""
         try:
+            import pandas as pd
+
             train_df = pd.read_csv(self.data_dir / 'train_dataset.csv')
             test_df = pd.read_csv(self.data_dir / 'test_dataset.csv')
             return train_df, test_df
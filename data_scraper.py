@@ -1,12 +1,14 @@
-import requests
-from bs4 import BeautifulSoup
 import json
+import os
 from datetime import datetime
-import pandas as pd
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List
 import logging
 from pathlib import Path
 
+# requests and bs4 are only needed once a page is fetched
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
 class GIKIDataScraper:
     def __init__(self):
         self.base_url = "https://giki.edu.pk/"
@@ -25,9 +27,12 @@ class GIKIDataScraper:
         )
         self.logger = logging.getLogger('GIKIScraper')
     
-    def fetch_page(self, url: str) -> BeautifulSoup:
+    def fetch_page(self, url: str) -> "BeautifulSoup":
         """Fetch and parse a webpage"""
         try:
+            import requests
+            from bs4 import BeautifulSoup
+            
             response = requests.get(url)
             response.raise_for_status()
             return BeautifulSoup(response.text, 'html.parser')
@@ -158,9 +163,12 @@ class GIKIDataScraper:
             dataset['faculty'] = self.scrape_faculty_data()
             dataset['publications'] = self.scrape_research_publications()
             
-            # Save updated dataset
-            with open(dataset_path, 'w') as f:
+            # Save updated dataset; replaced atomically so readers that watch the file
+            # (the knowledge base hot reload) never see it half-written
+            tmp_path = dataset_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
                 json.dump(dataset, f, indent=2)
+            os.replace(tmp_path, dataset_path)
             
             self.logger.info("Dataset successfully updated")
             return True
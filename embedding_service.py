@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SOCKET_PATH = Path("models") / "embedding.sock"
+HEADER = struct.Struct('!I')
+
+def send_frame(sock: socket.socket, message: Dict):
+    """Write one length-prefixed JSON message"""
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def recv_frame(sock: socket.socket) -> Optional[Dict]:
+    """Read one length-prefixed JSON message; None when the peer closed the connection"""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exact(sock, HEADER.unpack(header)[0])
+    return None if payload is None else json.loads(payload)
+
+class EmbeddingService:
+    """Holds the sentence encoder and the search index once for every frontend.
+
+    Requests from all connections go through one queue; the batcher waits up to
+    max_wait for more requests and then encodes them with a single model call. Answer
+    requests run the trainer's full find_best_answer pipeline (entity answers, the
+    semantic cache, the chat's context for follow-ups) and reply with answer texts and
+    scores; search replies carry top-k answer ids and scores; encode replies pass the
+    vectors through a shared-memory block instead of the socket."""
+
+    def __init__(self, socket_path: Path = SOCKET_PATH, max_batch: int = 64, max_wait: float = 0.005):
+        from model_trainer import GIKIModelTrainer
+
+        self.socket_path = Path(socket_path)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.trainer = GIKIModelTrainer()
+        self.logger = logging.getLogger('EmbeddingService')
+        self._requests: "queue.Queue[Tuple[Dict, socket.socket, threading.Lock]]" = queue.Queue()
+        self._matrix_source = None
+        self._matrix = None
+
+    def _search_matrix(self) -> np.ndarray:
+        """Row-normalized question matrix, recomputed only when the trainer reloads it"""
+        q_emb, _, is_normalized = self.trainer._load_search_index()
+        if q_emb is not self._matrix_source:
+            matrix = q_emb.astype(np.float32)
+            if not is_normalized:
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix /= np.where(norms == 0, 1.0, norms)
+            self._matrix_source, self._matrix = q_emb, matrix
+        return self._matrix
+
+    def _handle_connection(self, conn: socket.socket):
+        """Read requests from one frontend and hand them to the batcher"""
+        write_lock = threading.Lock()
+        with conn:
+            while True:
+                try:
+                    request = recv_frame(conn)
+                except (OSError, ValueError):
+                    return
+                if request is None:
+                    return
+                self._requests.put((request, conn, write_lock))
+
+    def _next_batch(self) -> List[Tuple[Dict, socket.socket, threading.Lock]]:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _reply(self, conn: socket.socket, write_lock: threading.Lock, message: Dict):
+        try:
+            with write_lock:
+                send_frame(conn, message)
+        except OSError:
+            pass  # frontend went away
+
+    def _process(self, batch: List[Tuple[Dict, socket.socket, threading.Lock]]):
+        """Encode every text in the batch with one model call, then answer each request"""
+        texts, spans = [], []
+        for request, _, _ in batch:
+            if request.get('op') == 'answer':
+                items = []  # encoded by find_best_answers, after its cache lookups
+            else:
+                items = request['texts'] if request.get('op') == 'encode' else [request.get('query', '')]
+            spans.append((len(texts), len(texts) + len(items)))
+            texts.extend(items)
+        vectors = np.zeros((0, 0), dtype=np.float32)
+        if texts:
+            vectors = np.asarray(self.trainer.model.encode(texts, batch_size=len(texts),
+                                                           convert_to_numpy=True), dtype=np.float32)
+
+        # Frontends send the chat's earlier user turns, since they answer some turns
+        # without the service; the trainer's context window is synced to them
+        answers = [i for i, (request, _, _) in enumerate(batch) if request.get('op') == 'answer']
+        answered = {}
+        if answers:
+            for i in answers:
+                if batch[i][0].get('chat_id') is not None:
+                    self.trainer.context.sync(batch[i][0]['chat_id'], batch[i][0].get('turns') or [])
+            top_k = max(int(batch[i][0].get('top_k', 3)) for i in answers)
+            requests = [(batch[i][0].get('query', ''), batch[i][0].get('chat_id'), None) for i in answers]
+            answered = dict(zip(answers, self.trainer.find_best_answers(requests, top_k)))
+
+        # Every search in the batch goes through the retrieval cascade together, so the
+        # cross-encoder also sees one batched call
+        searches = [i for i, (request, _, _) in enumerate(batch) if request.get('op') == 'search']
+        ranked = {}
+        if searches:
+            matrix = self._search_matrix()
+            scores = [matrix @ (vectors[spans[i][0]] / (np.linalg.norm(vectors[spans[i][0]]) or 1.0))
+                      for i in searches]
+            top_k = max(int(batch[i][0].get('top_k', 3)) for i in searches)
+            queries = [batch[i][0].get('query', '') for i in searches]
+            ranked = dict(zip(searches, self.trainer.rank(queries, scores, top_k)))
+
+        for i, ((request, conn, write_lock), (start, end)) in enumerate(zip(batch, spans)):
+            reply = {'id': request.get('id')}
+            if request.get('op') == 'encode':
+                block = vectors[start:end]
+                shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+                np.ndarray(block.shape, dtype=np.float32, buffer=shm.buf)[:] = block
+                # The client unlinks the block after copying it out
+                resource_tracker.unregister(shm._name, 'shared_memory')
+                reply.update({'shm': shm.name, 'shape': list(block.shape)})
+                shm.close()
+            elif request.get('op') == 'answer':
+                reply['answers'] = [[text, score] for text, score in answered[i][:int(request.get('top_k', 3))]]
+            else:
+                top = ranked[i][:int(request.get('top_k', 3))]
+                reply.update({'ids': [j for j, _ in top], 'scores': [score for _, score in top]})
+            self._reply(conn, write_lock, reply)
+
+    def _run_batcher(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except Exception as e:
+                self.logger.error(f"Error processing batch of {len(batch)}: {str(e)}")
+                for request, conn, write_lock in batch:
+                    self._reply(conn, write_lock, {'id': request.get('id'), 'error': str(e)})
+
+    def serve_forever(self):
+        """Listen on the Unix socket until interrupted"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.socket_path))
+        server.listen(128)
+        threading.Thread(target=self._run_batcher, name='embedding-batcher', daemon=True).start()
+        self.logger.info(f"Embedding service listening on {self.socket_path}")
+        try:
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            self.socket_path.unlink(missing_ok=True)
+
+class EmbeddingClient:
+    """Frontend side of the embedding service; imports neither torch nor the model"""
+
+    def __init__(self, socket_path: Path = SOCKET_PATH, timeout: float = 10.0):
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def available(self) -> bool:
+        return self.socket_path.exists()
+
+    def _call(self, request: Dict) -> Dict:
+        with self._lock:
+            self._next_id += 1
+            request['id'] = self._next_id
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self._sock.settimeout(self.timeout)
+                        self._sock.connect(str(self.socket_path))
+                    send_frame(self._sock, request)
+                    reply = recv_frame(self._sock)
+                    if reply is None:
+                        raise ConnectionError("embedding service closed the connection")
+                    break
+                except OSError as e:
+                    # Service restarted: reconnect once. A timeout is not retried, the
+                    # caller's deadline is already spent; the half-read reply goes with
+                    # the closed socket
+                    if self._sock is not None:
+                        self._sock.close()
+                        self._sock = None
+                    if attempt or isinstance(e, socket.timeout):
+                        raise
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Top-k (answer id, score) pairs"""
+        reply = self._call({'op': 'search', 'query': query, 'top_k': top_k})
+        return list(zip(reply['ids'], reply['scores']))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of texts, copied out of the shared-memory block the service filled"""
+        reply = self._call({'op': 'encode', 'texts': list(texts)})
+        shm = shared_memory.SharedMemory(name=reply['shm'])
+        try:
+            return np.ndarray(tuple(reply['shape']), dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def find_best_answer(self, query: str, top_k: int = 3, chat_id: Optional[str] = None,
+                         turns: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """GIKIModelTrainer.find_best_answer in the service; turns are the chat's earlier
+        user messages, oldest first, for follow-ups"""
+        reply = self._call({'op': 'answer', 'query': query, 'top_k': top_k, 'chat_id': chat_id,
+                            'turns': list(turns or [])})
+        return [(text, score) for text, score in reply['answers']]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve sentence encoding and search over a Unix socket")
+    parser.add_argument('--socket', type=Path, default=Path(os.environ.get('GIKI_EMBEDDING_SOCKET', SOCKET_PATH)))
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    EmbeddingService(args.socket, args.max_batch, args.max_wait_ms / 1000).serve_forever()
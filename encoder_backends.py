@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+BACKENDS = ('torch', 'int8', 'onnx')
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+
+# Minimum cosine similarity between a backend's embeddings and the fp32 model's
+PARITY_THRESHOLD = 0.98
+
+# Short texts shaped like real queries and answers, for parity checks
+PROBE_TEXTS = [
+    "What is GIKI?",
+    "Which labs are in the Faculty of Electronic Engineering?",
+    "who heads materials engineering",
+    "hostel capacity for girls",
+    "GIKI admissions are based on the GIKI Entry Test, FSc/A-Level results and an interview.",
+    "The Faculty of Computer Science and Engineering offers Computer Science, Computer Engineering "
+    "and Software Engineering.",
+]
+
+logger = logging.getLogger('EncoderBackends')
+
+def selected_backend(backend: Optional[str] = None) -> str:
+    """Backend from the argument or GIKI_ENCODER_BACKEND, defaulting to plain fp32 torch"""
+    backend = (backend or os.environ.get('GIKI_ENCODER_BACKEND') or 'torch').lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {BACKENDS}")
+    return backend
+
+def parity(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """Row-wise cosine similarity between two embedding matrices"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+    return {'min_cosine': float(cosine.min()), 'mean_cosine': float(cosine.mean())}
+
+class OnnxSentenceEncoder:
+    """Sentence encoder running an exported transformer graph on onnxruntime.
+
+    Mirrors the parts of SentenceTransformer.encode the app uses (batching, mean
+    pooling, optional normalization, numpy or tensor output)."""
+
+    def __init__(self, export_dir: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(export_dir / 'export.json', 'r') as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(export_dir / 'model.onnx'), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dimension']
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               convert_to_tensor: bool = False, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        # Length-sorted batches pad less; the original order is restored below
+        order = np.argsort([-len(text) for text in texts])
+        embeddings = np.zeros((len(texts), self.config['dimension']), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            inputs = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                    max_length=self.config['max_seq_length'], return_tensors='np')
+            feed = {name: inputs[name].astype(np.int64) for name in inputs if name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings[batch] = pooled
+        if self.config['normalize'] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+        result = embeddings[0] if single else embeddings
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(result)
+        return result
+
+def export_onnx(model_name: str, export_dir: Path) -> Dict:
+    """Export the model's transformer to ONNX and check it against the fp32 model"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    export_dir.mkdir(parents=True, exist_ok=True)
+
+    sample = tokenizer(PROBE_TEXTS[:2], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    tmp_file = export_dir / 'model.onnx.tmp'
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in input_names), str(tmp_file),
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+    os.replace(tmp_file, export_dir / 'model.onnx')
+    tokenizer.save_pretrained(str(export_dir))
+
+    config = {
+        'model_name': model_name,
+        'dimension': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model)
+    }
+    with open(export_dir / 'export.json', 'w') as f:
+        json.dump(config, f, indent=2)
+
+    encoder = OnnxSentenceEncoder(export_dir)
+    result = parity(model.encode(PROBE_TEXTS, convert_to_numpy=True), encoder.encode(PROBE_TEXTS))
+    config['parity'] = result
+    with open(export_dir / 'export.json', 'w') as f:
+        json.dump(config, f, indent=2)
+    logger.info(f"Exported {model_name} to {export_dir} (parity {result})")
+    return config
+
+def load_encoder(model_name: str = DEFAULT_MODEL, backend: Optional[str] = None,
+                 cache_dir: Path = Path("models")):
+    """Sentence encoder for the selected backend, falling back to fp32 torch if the
+    optimized model cannot be built or fails the parity check"""
+    backend = selected_backend(backend)
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'onnx':
+        export_dir = Path(cache_dir) / 'onnx' / model_name.replace('/', '_')
+        try:
+            if not (export_dir / 'export.json').exists():
+                export_onnx(model_name, export_dir)
+            with open(export_dir / 'export.json', 'r') as f:
+                check = json.load(f).get('parity', {})
+            if check.get('min_cosine', 0.0) < PARITY_THRESHOLD:
+                raise ValueError(f"ONNX export failed the parity check: {check}")
+            return OnnxSentenceEncoder(export_dir)
+        except Exception as e:
+            logger.error(f"ONNX encoder unavailable, using fp32 torch: {str(e)}")
+            return SentenceTransformer(model_name)
+
+    # Dynamic quantization only runs on the CPU; plain torch keeps using a GPU if present
+    model = SentenceTransformer(model_name, device='cpu' if backend == 'int8' else None)
+    if backend == 'int8':
+        import torch
+        try:
+            reference = model.encode(PROBE_TEXTS, convert_to_numpy=True)
+            quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            check = parity(reference, quantized.encode(PROBE_TEXTS, convert_to_numpy=True))
+            if check['min_cosine'] < PARITY_THRESHOLD:
+                raise ValueError(f"int8 model failed the parity check: {check}")
+            logger.info(f"Using dynamic int8 encoder (parity {check})")
+            return quantized
+        except Exception as e:
+            logger.error(f"int8 encoder unavailable, using fp32 torch: {str(e)}")
+    return model
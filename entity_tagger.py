@@ -0,0 +1,112 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Leading titles dropped from person names, so "Dr. Ahmed Khan" is also tagged as "ahmed khan"
+HONORIFICS = ('dr', 'prof', 'professor', 'engr', 'mr', 'ms', 'mrs')
+
+# Everyday words that are also short aliases (the FEE department code is "fee"). A
+# one-word alias from this list is only tagged when written exactly as registered,
+# in capitals ("FEE"), never from lowercase text.
+COMMON_WORDS = frozenset({
+    'fee', 'me', 'it', 'is', 'am', 'as', 'us', 'an', 'at', 'be', 'do', 'go', 'he', 'if', 'in', 'no',
+    'of', 'on', 'or', 'so', 'to', 'up', 'we', 'all', 'and', 'any', 'are', 'art', 'bus', 'can', 'car',
+    'day', 'few', 'for', 'fun', 'get', 'how', 'law', 'man', 'map', 'may', 'new', 'not', 'now', 'old',
+    'one', 'our', 'out', 'own', 'pay', 'see', 'set', 'the', 'top', 'use', 'way', 'who', 'why', 'yes',
+    'cost', 'food', 'life', 'main', 'mess', 'more', 'name', 'room', 'time', 'week', 'work', 'year',
+})
+
+def is_common_word(name: str) -> bool:
+    """Whether a name is a single everyday word that must not be tagged from lowercase text"""
+    return entity_key(name) in COMMON_WORDS
+
+def entity_key(text: str) -> str:
+    """Normalized lookup key: lowercase word tokens with a naive plural strip ("Labs" -> "lab")"""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return ' '.join(tokens)
+
+def strip_honorifics(name: str) -> str:
+    """Person name without leading titles"""
+    tokens = entity_key(name).split()
+    while tokens and tokens[0] in HONORIFICS:
+        tokens.pop(0)
+    return ' '.join(tokens)
+
+class EntityTagger:
+    """Dictionary tagger over a token trie.
+
+    Names are stored as token paths; tagging walks the query once from left to right,
+    taking the longest name that starts at each position, so the cost depends on the
+    query length and the longest name, not on how many names are known. Names that are
+    common words are kept apart and only matched case-sensitively against the raw
+    query.
+
+    A name is specific when it has several words or is registered as an acronym
+    ("FME"); a single ordinary word ("Robotics") may just be the topic of a question."""
+
+    _END = '__entities__'
+    _SPECIFIC = '__specific__'
+
+    def __init__(self):
+        self.root: Dict = {}
+        self.exact: Dict[str, List[Dict]] = {}
+        self.size = 0
+
+    def add(self, name: str, entity: Dict):
+        """Register an entity under a name; one name may carry several entities"""
+        if is_common_word(name):
+            # Only an all-caps spelling ("FEE") is specific enough to tag
+            if name.isupper():
+                entities = self.exact.setdefault(name.strip(), [])
+                if not any(existing is entity for existing in entities):
+                    entities.append(entity)
+                    self.size += 1
+            return
+        tokens = entity_key(name).split()
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        entities = node.setdefault(self._END, [])
+        if not any(existing is entity for existing in entities):
+            entities.append(entity)
+            self.size += 1
+        if len(tokens) > 1 or name.strip().isupper():
+            node[self._SPECIFIC] = True
+
+    def tag(self, text: str, raw: Optional[str] = None,
+            specific_only: bool = False) -> List[Tuple[str, List[Dict]]]:
+        """Non-overlapping (matched key, entities) spans, longest match at each position.
+
+        raw is the query as typed, for the case-sensitive names; a query written
+        entirely in capitals gives no case information and is not checked. With
+        specific_only, spans of single ordinary words are left out."""
+        tokens = entity_key(text).split()
+        spans = []
+        if raw and self.exact and not raw.isupper():
+            for token in TOKEN_RE.findall(raw):
+                if token in self.exact:
+                    spans.append((token.lower(), self.exact[token]))
+        i = 0
+        while i < len(tokens):
+            node = self.root
+            match_end, match, match_node = i, None, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if self._END in node:
+                    match_end, match, match_node = j + 1, node[self._END], node
+            if match is not None:
+                if not specific_only or match_node.get(self._SPECIFIC):
+                    spans.append((' '.join(tokens[i:match_end]), match))
+                i = match_end
+            else:
+                i += 1
+        return spans
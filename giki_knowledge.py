@@ -1,19 +1,324 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 import json
+import logging
+import threading
 from pathlib import Path
+from metrics import metrics
+from entity_tagger import EntityTagger, entity_key, strip_honorifics
+from query_normalizer import NormalizedQuery, normalize_query
+
+DATASET_FILE = Path("giki_dataset.json")
+
+# Faculty and publications scraped by GIKIDataScraper.update_dataset
+SCRAPED_DATASET = Path("data") / "giki_dataset.json"
+
+# Most specific first: a lab named after its department's field is still the lab
+ENTITY_PRIORITY = ['publication', 'faculty_member', 'lab', 'hostel', 'society', 'research_center', 'cafeteria',
+                   'program', 'research_area', 'department']
+
+HEAD_DESIGNATIONS = ('dean', 'head', 'chair', 'director')
+
+class KnowledgeState(NamedTuple):
+    """The dataset and the indexes built from it, swapped together on a reload"""
+    dataset: Dict
+    entity_index: Dict[str, List[Dict]]
+    tagger: EntityTagger
 
 class GIKIKnowledgeBase:
-    def __init__(self):
-        self.load_dataset()
+    def __init__(self, reload_interval: Optional[float] = None, snapshot=None):
+        self.logger = logging.getLogger('GIKIKnowledge')
+        self._signature = self._dataset_signature()
+        # A warm-state snapshot taken from the same data files saves rebuilding the indexes
+        self._state = self._state_from_snapshot(snapshot) or self._build_state()
         self.setup_faq_patterns()
+        # Edits to the dataset (or fresh scraper output) are picked up in the background;
+        # only long-lived serving instances pass a reload_interval
+        self._stop_watching = threading.Event()
+        if reload_interval:
+            self.watch(reload_interval)
+    
+    # The dataset and its indexes are swapped together as one tuple. Answering a query
+    # reads self._state once and passes it down, so a reload mid-answer cannot mix an
+    # old index with a new dataset; these properties are for one-off reads
+    @property
+    def dataset(self) -> Dict:
+        return self._state[0]
+    
+    @property
+    def entity_index(self) -> Dict[str, List[Dict]]:
+        return self._state[1]
     
-    def load_dataset(self):
+    @property
+    def tagger(self) -> EntityTagger:
+        return self._state[2]
+    
+    def load_dataset(self) -> Dict:
         """Load the GIKI dataset from JSON file"""
         try:
-            with open('giki_dataset.json', 'r') as f:
-                self.dataset = json.load(f)
+            with open(DATASET_FILE, 'r') as f:
+                dataset = json.load(f)
         except Exception as e:
             raise Exception(f"Failed to load dataset: {e}")
+        
+        # Scraped data is optional; the curated dataset wins where both have a key
+        try:
+            if SCRAPED_DATASET.exists():
+                with open(SCRAPED_DATASET, 'r') as f:
+                    scraped = json.load(f)
+                for key in ('faculty', 'publications'):
+                    dataset.setdefault(key, scraped.get(key) or ({} if key == 'faculty' else []))
+        except Exception as e:
+            self.logger.error(f"Error loading scraped dataset: {str(e)}")
+            # On a reload, keep the scraped data we already have
+            if hasattr(self, '_state'):
+                for key in ('faculty', 'publications'):
+                    if key in self.dataset:
+                        dataset.setdefault(key, self.dataset[key])
+        return dataset
+    
+    def _build_state(self) -> KnowledgeState:
+        dataset = self.load_dataset()
+        entity_index, tagger = self.build_entity_index(dataset)
+        return KnowledgeState(dataset, entity_index, tagger)
+    
+    def _state_from_snapshot(self, snapshot=None) -> Optional[KnowledgeState]:
+        """Indexes from a warm-state snapshot (the shared one unless given; False skips it)"""
+        if snapshot is False:
+            return None
+        try:
+            if snapshot is None:
+                from warm_state import load_warm_state
+                snapshot = load_warm_state()
+            if snapshot is None or 'knowledge_base' not in snapshot:
+                return None
+            saved = snapshot.object('knowledge_base')
+            if tuple(saved['signature']) != self._signature:
+                return None  # data changed since the snapshot was taken
+            return KnowledgeState(*saved['state'])
+        except Exception as e:
+            self.logger.error(f"Error reading knowledge base from snapshot: {str(e)}")
+            return None
+    
+    def snapshot_state(self) -> Dict:
+        """What a warm-state snapshot stores for the knowledge base"""
+        return {'signature': self._signature, 'state': tuple(self._state)}
+    
+    def _dataset_signature(self) -> Tuple:
+        """mtime and size of the data files; changes when either is rewritten"""
+        signature = []
+        for path in (DATASET_FILE, SCRAPED_DATASET):
+            try:
+                stat = path.stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def check_for_updates(self) -> bool:
+        """Rebuild and swap in the indexes if a data file changed; True if reloaded"""
+        signature = self._dataset_signature()
+        if signature == self._signature:
+            return False
+        try:
+            state = self._build_state()
+        except Exception as e:
+            # Keep serving the old data; a half-written file is retried on the next poll
+            self.logger.error(f"Error reloading knowledge base: {str(e)}")
+            return False
+        self._state = state
+        self._signature = signature
+        self.logger.info(f"Knowledge base reloaded with {len(state.entity_index)} entity names")
+        return True
+    
+    def watch(self, interval: float = 5.0) -> threading.Thread:
+        """Poll the data files on a daemon thread"""
+        def poll():
+            while not self._stop_watching.wait(interval):
+                self.check_for_updates()
+        
+        thread = threading.Thread(target=poll, name='knowledge-base-watcher', daemon=True)
+        thread.start()
+        return thread
+    
+    def stop_watching(self):
+        """Stop the polling thread"""
+        self._stop_watching.set()
+    
+    @staticmethod
+    def _add_entity(entity_index: Dict, tagger: EntityTagger, name: str, entity_type: str, record: Dict,
+                    departments: List[str] = None, centers: List[str] = None):
+        """Register an entity under its normalized name, merging reverse links for repeated names"""
+        key = entity_key(name)
+        if not key:
+            return
+        entries = entity_index.setdefault(key, [])
+        for entry in entries:
+            if entry['type'] == entity_type:
+                entry['departments'].extend(d for d in departments or [] if d not in entry['departments'])
+                entry['centers'].extend(c for c in centers or [] if c not in entry['centers'])
+                return
+        entries.append({
+            'type': entity_type,
+            'name': name,
+            'record': record,
+            'departments': list(departments or []),
+            'centers': list(centers or [])
+        })
+        tagger.add(name, entries[-1])
+    
+    def build_entity_index(self, dataset: Dict) -> Tuple[Dict[str, List[Dict]], EntityTagger]:
+        """Precompute name -> record lookups for every entity in the dataset.
+        
+        Each entry carries its reverse links (lab -> department, program -> departments,
+        research area -> departments and centers), so entity questions are dict lookups.
+        The same entries feed the tagger that finds entity mentions in queries."""
+        entity_index: Dict[str, List[Dict]] = {}
+        tagger = EntityTagger()
+        
+        def add(*args, **kwargs):
+            self._add_entity(entity_index, tagger, *args, **kwargs)
+        
+        for code, dept in dataset['departments'].items():
+            # A code that is also a word ("FEE") is only tagged in capitals; with a
+            # department word it is unambiguous in any case
+            add(code, 'department', dept, [code])
+            for alias in (f"{code} department", f"department of {code}", f"faculty of {code}", f"{code} faculty"):
+                add(alias, 'department', dept, [code])
+            add(dept['name'], 'department', dept, [code])
+            # "Mechanical Engineering" for "Faculty of Mechanical Engineering"
+            if dept['name'].lower().startswith('faculty of '):
+                add(dept['name'][len('faculty of '):], 'department', dept, [code])
+            for lab in dept['labs']:
+                add(lab, 'lab', {'name': lab}, [code])
+            for program in dept['programs']:
+                add(program, 'program', {'name': program}, [code])
+            for area in dept['research_areas']:
+                add(area, 'research_area', {'name': area}, [code])
+        
+        for center in dataset['research_centers']:
+            add(center['name'], 'research_center', center)
+            for area in center['focus_areas']:
+                add(area, 'research_area', {'name': area}, centers=[center['name']])
+        
+        student_life = dataset['student_life']
+        for society in student_life['societies']:
+            add(society['name'], 'society', society)
+            if society['name'].startswith('GIKI '):
+                add(society['name'][len('GIKI '):], 'society', society)
+        for hostel in student_life['facilities']['hostels']:
+            add(hostel['name'], 'hostel', hostel)
+        for cafe in student_life['facilities']['cafeterias']:
+            add(cafe, 'cafeteria', {'name': cafe})
+        
+        for code, members in dataset.get('faculty', {}).items():
+            for member in members:
+                add(member['name'], 'faculty_member', member, [code])
+                add(strip_honorifics(member['name']), 'faculty_member', member, [code])
+        for publication in dataset.get('publications', []):
+            add(publication['title'], 'publication', publication)
+        return entity_index, tagger
+    
+    def lookup(self, name: str, entity_type: Optional[str] = None) -> List[Dict]:
+        """Entities registered under a name (code, full name, lab, program, ...)"""
+        entries = self.entity_index.get(entity_key(name), [])
+        if entity_type is not None:
+            entries = [entry for entry in entries if entry['type'] == entity_type]
+        return entries
+    
+    def find_entities(self, query: Union[str, NormalizedQuery], specific_only: bool = False) -> List[Dict]:
+        """Entities mentioned in a query, longest match first, in a single pass over the query"""
+        return self._find_entities(self._state, normalize_query(query), specific_only)
+    
+    @staticmethod
+    def _find_entities(state: KnowledgeState, query: NormalizedQuery, specific_only: bool = False) -> List[Dict]:
+        spans = sorted(state.tagger.tag(query.text, raw=query.raw, specific_only=specific_only),
+                       key=lambda span: len(span[0]), reverse=True)
+        return [entry for _, entries in spans for entry in entries]
+    
+    def _department_heads(self, state: KnowledgeState, code: str) -> List[Dict]:
+        return [member for member in state.dataset.get('faculty', {}).get(code, [])
+                if any(word in member.get('designation', '').lower() for word in HEAD_DESIGNATIONS)]
+    
+    def _format_department(self, state: KnowledgeState, code: str) -> str:
+        dept = state.dataset['departments'][code]
+        return f"""Department: {dept['name']} ({code})
+                \nEstablished: {dept['established']}
+                \nFaculty Count: {dept['faculty_count']}
+                \nPrograms: {', '.join(dept['programs'])}
+                \nResearch Areas: {', '.join(dept['research_areas'])}
+                \nLabs: {', '.join(dept['labs'])}"""
+    
+    def _get_department_aspect(self, state: KnowledgeState, code: str, query: str) -> Optional[str]:
+        """Answer a question about one field of a department, if the query asks for one"""
+        dept = state.dataset['departments'][code]
+        name = f"{dept['name']} ({code})"
+        if "lab" in query:
+            return f"Labs in {name}:\n" + "\n".join(f"- {lab}" for lab in dept['labs'])
+        if "program" in query or "degree" in query:
+            return f"{name} offers {len(dept['programs'])} programs:\n" + \
+                   "\n".join(f"- {program}" for program in dept['programs'])
+        if "research" in query:
+            return f"Research areas of {name}:\n" + "\n".join(f"- {area}" for area in dept['research_areas'])
+        if "head" in query or "dean" in query or "chair" in query:
+            heads = self._department_heads(state, code)
+            if heads:
+                return f"{name} is headed by " + \
+                       ", ".join(f"{member['name']} ({member['designation']})" for member in heads) + "."
+        if "how many faculty" in query or "faculty count" in query or "faculty member" in query:
+            return f"{name} has {dept['faculty_count']} faculty members."
+        if "professor" in query or "teacher" in query or "who teach" in query:
+            members = state.dataset.get('faculty', {}).get(code, [])
+            if members:
+                return f"Faculty members of {name}:\n" + \
+                       "\n".join(f"- {member['name']}, {member['designation']}" for member in members)
+        if "establish" in query or "founded" in query:
+            return f"{name} was established in {dept['established']}."
+        return None
+    
+    def _get_entity_response(self, state: KnowledgeState, query: str, entities: List[Dict]) -> Optional[str]:
+        """Targeted answer for the most specific entity mentioned in the query"""
+        entity = min(entities, key=lambda e: ENTITY_PRIORITY.index(e['type']))
+        departments = state.dataset['departments']
+        
+        if entity['type'] in ('department', 'program'):
+            codes = entity['departments']
+            if len(codes) == 1:
+                aspect = self._get_department_aspect(state, codes[0], query)
+                if aspect:
+                    return aspect
+            if entity['type'] == 'department':
+                return self._format_department(state, codes[0])
+            return f"{entity['name']} is offered by " + \
+                   ", ".join(f"{departments[code]['name']} ({code})" for code in codes) + "."
+        
+        if entity['type'] == 'faculty_member':
+            member = entity['record']
+            code = entity['departments'][0]
+            dept_name = departments[code]['name'] if code in departments else code
+            return f"{member['name']} - {member['designation']}, {dept_name} ({code}), " \
+                   f"specializing in {member['specialization']}.\nEmail: {member['email']}"
+        if entity['type'] == 'publication':
+            pub = entity['record']
+            return f"'{pub['title']}' was published in {pub['journal']} ({pub['year']}) by {pub['authors']}."
+        if entity['type'] == 'lab':
+            code = entity['departments'][0]
+            return f"The {entity['name']} belongs to the {departments[code]['name']} ({code})."
+        if entity['type'] == 'research_area':
+            places = [f"{departments[code]['name']} ({code})" for code in entity['departments']]
+            places += entity['centers']
+            return f"Research in {entity['name']} is carried out at:\n" + "\n".join(f"- {p}" for p in places)
+        if entity['type'] == 'research_center':
+            center = entity['record']
+            return f"📚 {center['name']}\nFocus Areas:\n" + "\n".join(f"- {area}" for area in center['focus_areas'])
+        if entity['type'] == 'hostel':
+            hostel = entity['record']
+            return f"🏢 {hostel['name']}\nType: {hostel['type']}\nCapacity: {hostel['capacity']} students"
+        if entity['type'] == 'society':
+            society = entity['record']
+            return f"📌 {society['name']}\nType: {society['type']}\nActivities: {', '.join(society['activities'])}"
+        if entity['type'] == 'cafeteria':
+            return f"{entity['name']} is one of the cafeterias on the GIKI campus."
+        return None
     
     def setup_faq_patterns(self):
         """Setup FAQ patterns and their corresponding response functions"""
@@ -24,43 +329,38 @@ class GIKIKnowledgeBase:
             "research": self._get_research_info,
             "admission": self._get_admission_info,
             "hostel": self._get_hostel_info,
-            "facility": self._get_facilities_info,
+            "facilit": self._get_facilities_info,
             "societ": self._get_societies_info,
             "lab": self._get_labs_info,
             "how many": self._get_count_info
         }
     
-    def _get_department_info(self, query: str) -> str:
+    def _get_department_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about departments"""
-        if "how many" in query.lower():
-            return f"GIKI has {len(self.dataset['departments'])} main departments/faculties:\n\n" + \
-                   "\n".join(f"- {dept['name']}" for dept in self.dataset['departments'].values())
+        if "how many" in query:
+            return f"GIKI has {len(state.dataset['departments'])} main departments/faculties:\n\n" + \
+                   "\n".join(f"- {dept['name']}" for dept in state.dataset['departments'].values())
         
         # Check for specific department
-        for code, dept in self.dataset['departments'].items():
-            if code.lower() in query.lower() or dept['name'].lower() in query.lower():
-                return f"""Department: {dept['name']} ({code})
-                \nEstablished: {dept['established']}
-                \nFaculty Count: {dept['faculty_count']}
-                \nPrograms: {', '.join(dept['programs'])}
-                \nResearch Areas: {', '.join(dept['research_areas'])}
-                \nLabs: {', '.join(dept['labs'])}"""
+        for entity in self._find_entities(state, normalize_query(query)):
+            if entity['type'] == 'department':
+                return self._format_department(state, entity['departments'][0])
         
         return "Please specify which department you'd like to know about. Available departments are: " + \
-               ", ".join(f"{code} ({dept['name']})" for code, dept in self.dataset['departments'].items())
+               ", ".join(f"{code} ({dept['name']})" for code, dept in state.dataset['departments'].items())
     
-    def _get_programs_info(self, query: str) -> str:
+    def _get_programs_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about academic programs"""
         all_programs = []
-        for dept in self.dataset['departments'].values():
+        for dept in state.dataset['departments'].values():
             all_programs.extend(dept['programs'])
         
         return f"GIKI offers the following programs:\n\n" + \
                "\n".join(f"- {program}" for program in sorted(all_programs))
     
-    def _get_research_info(self, query: str) -> str:
+    def _get_research_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about research centers and areas"""
-        centers = self.dataset['research_centers']
+        centers = state.dataset['research_centers']
         response = "GIKI Research Centers:\n\n"
         
         for center in centers:
@@ -70,9 +370,9 @@ class GIKIKnowledgeBase:
         
         return response
     
-    def _get_admission_info(self, query: str) -> str:
+    def _get_admission_info(self, state: KnowledgeState, query: str) -> str:
         """Get admission-related information"""
-        adm = self.dataset['admissions']
+        adm = state.dataset['admissions']
         return f"""Admission Requirements at GIKI:
 
 1. Academic: {adm['requirements']['academic']}
@@ -88,9 +388,9 @@ Annual Intake:
 - Undergraduate: {adm['annual_intake']['undergraduate']} students
 - Graduate: {adm['annual_intake']['graduate']} students"""
     
-    def _get_hostel_info(self, query: str) -> str:
+    def _get_hostel_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about hostels"""
-        hostels = self.dataset['student_life']['facilities']['hostels']
+        hostels = state.dataset['student_life']['facilities']['hostels']
         response = "GIKI Hostel Facilities:\n\n"
         
         for hostel in hostels:
@@ -100,9 +400,9 @@ Annual Intake:
         
         return response
     
-    def _get_facilities_info(self, query: str) -> str:
+    def _get_facilities_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about campus facilities"""
-        facilities = self.dataset['student_life']['facilities']
+        facilities = state.dataset['student_life']['facilities']
         response = "GIKI Campus Facilities:\n\n"
         
         response += "🏠 Hostels:\n"
@@ -113,9 +413,9 @@ Annual Intake:
         
         return response
     
-    def _get_societies_info(self, query: str) -> str:
+    def _get_societies_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about student societies"""
-        societies = self.dataset['student_life']['societies']
+        societies = state.dataset['student_life']['societies']
         response = "GIKI Student Societies:\n\n"
         
         for society in societies:
@@ -125,32 +425,30 @@ Annual Intake:
         
         return response
     
-    def _get_labs_info(self, query: str) -> str:
+    def _get_labs_info(self, state: KnowledgeState, query: str) -> str:
         """Get information about laboratories"""
         all_labs = []
-        for dept in self.dataset['departments'].values():
+        for dept in state.dataset['departments'].values():
             response = f"Labs in {dept['name']}:\n"
             response += "\n".join(f"- {lab}" for lab in dept['labs'])
             all_labs.append(response)
         
         return "\n\n".join(all_labs)
     
-    def _get_count_info(self, query: str) -> str:
+    def _get_count_info(self, state: KnowledgeState, query: str) -> str:
         """Handle 'how many' type questions"""
-        query = query.lower()
-        
         if "department" in query or "facult" in query:
-            return self._get_department_info(query)
+            return self._get_department_info(state, query)
         elif "program" in query:
             all_programs = []
-            for dept in self.dataset['departments'].values():
+            for dept in state.dataset['departments'].values():
                 all_programs.extend(dept['programs'])
             return f"GIKI offers {len(all_programs)} different academic programs."
         elif "hostel" in query:
-            hostels = self.dataset['student_life']['facilities']['hostels']
+            hostels = state.dataset['student_life']['facilities']['hostels']
             return f"GIKI has {len(hostels)} hostels ({sum(1 for h in hostels if h['type']=='Male')} male, {sum(1 for h in hostels if h['type']=='Female')} female)."
         elif "societ" in query:
-            return f"GIKI has {len(self.dataset['student_life']['societies'])} major student societies."
+            return f"GIKI has {len(state.dataset['student_life']['societies'])} major student societies."
         
         return self._get_default_response()
     
@@ -169,13 +467,33 @@ Annual Intake:
 
 Please ask about any of these topics!"""
     
-    def get_response(self, query: str) -> str:
+    def get_entity_answer(self, query: Union[str, NormalizedQuery], specific_only: bool = False) -> Optional[str]:
+        """Targeted answer when the query names a known entity, else None; with
+        specific_only, a single ordinary word ("robotics") is not enough"""
+        return self._entity_answer(self._state, normalize_query(query), specific_only)
+    
+    def _entity_answer(self, state: KnowledgeState, query: NormalizedQuery,
+                       specific_only: bool = False) -> Optional[str]:
+        entities = self._find_entities(state, query, specific_only)
+        if not entities:
+            return None
+        return self._get_entity_response(state, query.text, entities)
+    
+    @metrics.timed('giki_tier_seconds', tier='knowledge_base')
+    def get_response(self, query: Union[str, NormalizedQuery]) -> str:
         """Generate a response based on the query using the knowledge base"""
-        query = query.lower()
+        normalized = normalize_query(query)
+        query = normalized.text
+        state = self._state
+        
+        # Specific entities get a targeted answer instead of a whole list
+        response = self._entity_answer(state, normalized)
+        if response:
+            return response
         
         # Check for patterns in FAQ
         for pattern, response_func in self.faq_patterns.items():
             if pattern in query:
-                return response_func(query)
+                return response_func(state, query)
         
         return self._get_default_response() 
\ No newline at end of file
@@ -0,0 +1,206 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record a single observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile from bucket boundaries (upper bound of the bucket)"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            target = q * self.count
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+                running += bucket_count
+                if running >= target:
+                    return bound
+        return float('inf')
+
+class MetricsRegistry:
+    """Process-wide timers, histograms and a slow-query log"""
+
+    def __init__(self, log_dir: Path = Path("logs"), slow_query_threshold: float = None,
+                 export_interval: float = 30.0):
+        self.log_dir = Path(log_dir)
+        self.export_file = self.log_dir / 'metrics.prom'
+        self.slow_query_threshold = slow_query_threshold if slow_query_threshold is not None else \
+            float(os.environ.get('GIKI_SLOW_QUERY_SECONDS', '0.5'))
+        self.export_interval = export_interval
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+        self._slow_logger = None
+        self._server = None
+        self.logger = logging.getLogger('Metrics')
+
+    def _key(self, name: str, labels: Dict[str, str]):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Get or create the histogram for a metric name and label set"""
+        key = self._key(name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, Histogram())
+        return hist
+
+    def increment(self, name: str, amount: float = 1.0, **labels):
+        """Increment a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    @contextmanager
+    def timer(self, name: str, slow_query: Optional[str] = None, **labels):
+        """Time a block into a histogram; if slow_query is given, log it when slow"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram(name, **labels).observe(elapsed)
+            if slow_query is not None and elapsed >= self.slow_query_threshold:
+                self.log_slow_query(slow_query, elapsed, **labels)
+
+    def timed(self, name: str, query_arg: Optional[int] = None, **labels):
+        """Decorator form of timer(); query_arg is the positional index of the query
+        argument (after self) to record in the slow-query log"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                query = None
+                if query_arg is not None and len(args) > query_arg:
+                    query = str(args[query_arg])
+                with self.timer(name, slow_query=query, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def log_slow_query(self, query: str, elapsed: float, **labels):
+        """Append a slow query to logs/slow_queries.log"""
+        if self._slow_logger is None:
+            self.log_dir.mkdir(exist_ok=True)
+            slow_logger = logging.getLogger('SlowQueries')
+            handler = logging.FileHandler(self.log_dir / 'slow_queries.log')
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+            slow_logger.addHandler(handler)
+            slow_logger.propagate = False
+            slow_logger.setLevel(logging.INFO)
+            self._slow_logger = slow_logger
+        label_str = ' '.join(f"{k}={v}" for k, v in sorted(labels.items()))
+        self._slow_logger.info(f"{elapsed * 1000:.1f}ms {label_str} query={query!r}")
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        seen_types = set()
+        for (name, labels), hist in histograms:
+            if name not in seen_types:
+                lines.append(f"# TYPE {name} histogram")
+                seen_types.add(name)
+            running = 0
+            for bound, bucket_count in zip(hist.buckets, hist.counts):
+                running += bucket_count
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {running}")
+            lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {hist.count}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {hist.count}")
+
+        for (name, labels), value in counters:
+            if name not in seen_types:
+                lines.append(f"# TYPE {name} counter")
+                seen_types.add(name)
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: Optional[Path] = None) -> bool:
+        """Write the Prometheus text file atomically (for node_exporter's textfile collector)"""
+        path = Path(path) if path else self.export_file
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_file, 'w') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_file, path)
+            self._last_export = time.time()
+            return True
+        except Exception as e:
+            self.logger.error(f"Error exporting metrics: {str(e)}")
+            return False
+
+    def maybe_export(self):
+        """Export at most once per export_interval; cheap to call on every request"""
+        if time.time() - self._last_export >= self.export_interval:
+            self.export()
+
+    def serve(self, port: int = 9108, host: str = '127.0.0.1') -> "ThreadingHTTPServer":
+        """Serve /metrics over HTTP from a daemon thread (once per process)"""
+        if self._server is not None:
+            return self._server
+        # http.server is only imported by processes that actually expose metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return self._server
+
+# Shared registry used by all answer tiers
+metrics = MetricsRegistry()
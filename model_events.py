@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import weakref
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+class ModelVersionEvents:
+    """Publishes new model versions to in-process subscribers and to a version file
+    that other processes poll, so serving code can hot-swap without a restart"""
+
+    def __init__(self, model_dir: Path = Path("models")):
+        self.model_dir = Path(model_dir)
+        self.model_dir.mkdir(exist_ok=True)
+        self.version_file = self.model_dir / 'version.json'
+        self.logger = logging.getLogger('ModelEvents')
+        # Bound methods are held weakly, so a subscriber object dies with its last
+        # outside reference instead of living as long as this process-wide channel
+        self._subscribers: List[Callable[[], Optional[Callable[[Dict], None]]]] = []
+        self._lock = threading.Lock()
+        self._cached_mtime = None
+        self._cached_version: Dict = {'version': 0}
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        """Register a callback invoked with the version info after each publish; a bound
+        method does not keep its object alive"""
+        if hasattr(callback, '__self__') and hasattr(callback, '__func__'):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback
+        with self._lock:
+            self._subscribers.append(ref)
+
+    def unsubscribe(self, callback: Callable[[Dict], None]):
+        """Remove a previously registered callback"""
+        with self._lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() not in (None, callback)]
+
+    def _live_subscribers(self) -> List[Callable[[Dict], None]]:
+        """Callbacks whose objects are still alive, dropping the rest (caller holds the lock)"""
+        live = [(ref, ref()) for ref in self._subscribers]
+        self._subscribers = [ref for ref, callback in live if callback is not None]
+        return [callback for _, callback in live if callback is not None]
+
+    def current_version(self) -> Dict:
+        """Return the latest published version, re-reading the file only when it changed"""
+        try:
+            mtime = self.version_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {'version': 0}
+        if mtime != self._cached_mtime:
+            try:
+                with open(self.version_file, 'r') as f:
+                    self._cached_version = json.load(f)
+                self._cached_mtime = mtime
+            except Exception as e:
+                self.logger.error(f"Error reading model version: {str(e)}")
+        return self._cached_version
+
+    def publish(self, metadata: Dict = None) -> Dict:
+        """Bump the version, write it atomically and notify subscribers"""
+        with self._lock:
+            info = {
+                'version': self.current_version().get('version', 0) + 1,
+                'published': datetime.now().isoformat()
+            }
+            info.update(metadata or {})
+
+            tmp_file = self.version_file.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(info, f)
+            os.replace(tmp_file, self.version_file)
+            subscribers = self._live_subscribers()
+
+        self.logger.info(f"Published model version {info['version']}")
+        for callback in subscribers:
+            try:
+                callback(info)
+            except Exception as e:
+                self.logger.error(f"Error in model version subscriber: {str(e)}")
+        return info
+
+    def watch(self, callback: Callable[[Dict], None], interval: float = 5.0) -> threading.Event:
+        """Poll the version file from a daemon thread and call back on changes made by
+        other processes. Set the returned event to stop watching."""
+        stop = threading.Event()
+        seen = self.current_version().get('version', 0)
+
+        def poll():
+            nonlocal seen
+            while not stop.wait(interval):
+                info = self.current_version()
+                if info.get('version', 0) != seen:
+                    seen = info.get('version', 0)
+                    try:
+                        callback(info)
+                    except Exception as e:
+                        self.logger.error(f"Error in model version watcher: {str(e)}")
+
+        threading.Thread(target=poll, name='model-version-watch', daemon=True).start()
+        return stop
+
+_events = {}
+_events_lock = threading.Lock()
+
+def get_model_events(model_dir: Path = Path("models")) -> ModelVersionEvents:
+    """Return the process-wide event channel for a model directory"""
+    key = str(Path(model_dir).resolve())
+    with _events_lock:
+        if key not in _events:
+            _events[key] = ModelVersionEvents(model_dir)
+        return _events[key]
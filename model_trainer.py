@@ -1,12 +1,23 @@
 import json
+import os
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import torch
+from typing import List, Dict, Optional, Tuple, Union
 import logging
+import threading
 from datetime import datetime
+from model_events import get_model_events
+from metrics import metrics
+from profiler import profiler
+from conversation_context import ConversationContext, is_follow_up
+from query_normalizer import NormalizedQuery, normalize_query
+from encoder_backends import load_encoder
+from bulk_encoder import BulkEncoder
+from semantic_cache import SemanticCache
+from reranker import (COSINE_CALIBRATION_FILE, fit_cosine_calibration, load_cosine_calibration, platt_scale,
+                      save_calibration, top_candidates)
+from passage_store import PassageStore
+from warm_state import SNAPSHOT_FILE, build_snapshot, load_warm_state
 
 class GIKIModelTrainer:
     def __init__(self):
@@ -15,6 +26,17 @@ class GIKIModelTrainer:
         self.model_dir.mkdir(exist_ok=True)
         self.setup_logging()
         self.load_model()
+        self._index_lock = threading.Lock()
+        self._index_cache = None
+        self.events = get_model_events(self.model_dir)
+        self.events.subscribe(self._on_new_version)
+        self.context = ConversationContext(encoder=self.encode_query)
+        self.answer_cache = SemanticCache()
+        self.passage_store = PassageStore(self.model_dir)
+        self._knowledge_base = None
+        self._reranker = None
+        self._questions = (None, [])
+        self._cosine_calibration = (None, load_cosine_calibration(self.model_dir))
         
     def setup_logging(self):
         """Setup logging configuration"""
@@ -26,10 +48,14 @@ class GIKIModelTrainer:
         self.logger = logging.getLogger('GIKIModel')
     
     def load_model(self):
-        """Load or download the sentence transformer model"""
+        """Load or download the sentence transformer model.
+        
+        GIKI_ENCODER_BACKEND selects torch (fp32), int8 (dynamic quantization) or onnx
+        (exported graph on onnxruntime); optimized backends fall back to fp32 if they
+        fail the parity check."""
         try:
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            self.logger.info("Model loaded successfully")
+            self.model = load_encoder('all-MiniLM-L6-v2', cache_dir=self.model_dir)
+            self.logger.info(f"Model loaded successfully ({type(self.model).__name__})")
         except Exception as e:
             self.logger.error(f"Error loading model: {str(e)}")
             raise
@@ -88,15 +114,22 @@ class GIKIModelTrainer:
             self.logger.error(f"Error preparing training data: {str(e)}")
             return []
     
-    def encode_qa_pairs(self, training_data: List[Dict]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
-        """Encode questions and answers using the model"""
+    def encode_qa_pairs(self, training_data: List[Dict],
+                        encode_answers: bool = False) -> Tuple[np.ndarray, Optional[np.ndarray], List[str]]:
+        """Encode questions (and answers, if a retrieval mode needs them) using the model"""
         try:
             questions = [item['question'] for item in training_data]
             answers = [item['answer'] for item in training_data]
             
-            # Encode questions and answers
-            question_embeddings = self.model.encode(questions, convert_to_tensor=True)
-            answer_embeddings = self.model.encode(answers, convert_to_tensor=True)
+            # Length-bucketed batches over a process pool; small sets stay in-process
+            encoder = BulkEncoder(local_encoder=self.model, cache_dir=self.model_dir)
+            question_embeddings = encoder.encode(questions)
+            self.encoding_stats = {'questions': encoder.last_stats}
+            # Search only scores questions, so answers are not encoded by default
+            answer_embeddings = None
+            if encode_answers:
+                answer_embeddings = encoder.encode(answers)
+                self.encoding_stats['answers'] = encoder.last_stats
             
             return question_embeddings, answer_embeddings, answers
         
@@ -104,25 +137,38 @@ class GIKIModelTrainer:
             self.logger.error(f"Error encoding QA pairs: {str(e)}")
             raise
     
-    def save_embeddings(self, question_embeddings: torch.Tensor, answer_embeddings: torch.Tensor, answers: List[str]):
+    def save_embeddings(self, question_embeddings: np.ndarray, answer_embeddings: Optional[np.ndarray],
+                        answers: List[str], questions: Optional[List[str]] = None):
         """Save the encoded embeddings and answers"""
         try:
-            # Convert tensors to numpy arrays for saving
-            q_emb = question_embeddings.cpu().numpy()
-            a_emb = answer_embeddings.cpu().numpy()
+            # Tensors (from callers encoding themselves) are converted to numpy arrays for saving
+            import torch
+            q_emb = question_embeddings.cpu().numpy() if torch.is_tensor(question_embeddings) else question_embeddings
             
             # Save embeddings and answers
             np.save(self.model_dir / 'question_embeddings.npy', q_emb)
-            np.save(self.model_dir / 'answer_embeddings.npy', a_emb)
+            if answer_embeddings is not None:
+                a_emb = answer_embeddings.cpu().numpy() if torch.is_tensor(answer_embeddings) else answer_embeddings
+                np.save(self.model_dir / 'answer_embeddings.npy', a_emb)
+            else:
+                # Don't leave embeddings of an older answer list next to the new one
+                (self.model_dir / 'answer_embeddings.npy').unlink(missing_ok=True)
             
             with open(self.model_dir / 'answers.json', 'w') as f:
                 json.dump(answers, f)
+            # The re-ranker scores queries against the stored questions
+            if questions is not None:
+                with open(self.model_dir / 'questions.json', 'w') as f:
+                    json.dump(questions, f)
+            else:
+                (self.model_dir / 'questions.json').unlink(missing_ok=True)
             
             # Save metadata
             metadata = {
                 'last_updated': datetime.now().isoformat(),
                 'model_name': self.model.get_sentence_embedding_dimension(),
-                'num_qa_pairs': len(answers)
+                'num_qa_pairs': len(answers),
+                'encoding': getattr(self, 'encoding_stats', {})
             }
             
             with open(self.model_dir / 'metadata.json', 'w') as f:
@@ -134,33 +180,305 @@ class GIKIModelTrainer:
             self.logger.error(f"Error saving embeddings: {str(e)}")
             raise
     
-    def find_best_answer(self, query: str, top_k: int = 3) -> List[Tuple[str, float]]:
-        """Find the best matching answers for a query"""
-        try:
-            # Load saved embeddings and answers
-            q_emb = np.load(self.model_dir / 'question_embeddings.npy')
-            with open(self.model_dir / 'answers.json', 'r') as f:
+    def _on_new_version(self, info: Dict):
+        """Drop the cached search index so the next query loads the new embeddings"""
+        with self._index_lock:
+            self._index_cache = None
+        self.answer_cache.clear()
+        self.logger.info(f"Search index invalidated for model version {info.get('version')}")
+    
+    def close(self):
+        """Stop following new model versions and data-file edits"""
+        self.events.unsubscribe(self._on_new_version)
+        if self._knowledge_base:
+            self._knowledge_base.stop_watching()
+    
+    def _load_search_index(self) -> Tuple[np.ndarray, List[str], bool]:
+        """Return (question matrix, answers, is_normalized), reloading only when files change"""
+        index_file = self.model_dir / 'question_index.npy'
+        embeddings_file = self.model_dir / 'question_embeddings.npy'
+        answers_file = self.model_dir / 'answers.json'
+        
+        # Version bumps cover other processes; mtimes cover files replaced outside the trainer
+        use_index = index_file.exists() and index_file.stat().st_mtime >= embeddings_file.stat().st_mtime
+        key = (
+            self.events.current_version().get('version', 0),
+            (index_file if use_index else embeddings_file).stat().st_mtime_ns,
+            answers_file.stat().st_mtime_ns
+        )
+        
+        with self._index_lock:
+            if self._index_cache is not None and self._index_cache[0] == key:
+                return self._index_cache[1]
+        
+        # A snapshot of the same model version is already mapped and normalized
+        snapshot = load_warm_state(self.model_dir / SNAPSHOT_FILE.name)
+        if snapshot is not None and 'question_index' in snapshot and \
+                snapshot.meta.get('version') == key[0] and key[0]:
+            loaded = (snapshot.array('question_index'), snapshot.object('answers'), True)
+        else:
+            q_emb = np.load(index_file if use_index else embeddings_file)
+            with open(answers_file, 'r') as f:
                 answers = json.load(f)
-            
-            # Encode the query
+            loaded = (q_emb, answers, use_index)
+        
+        with self._index_lock:
+            self._index_cache = (key, loaded)
+        return loaded
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """Encode a single query into a numpy vector"""
+        with metrics.timer('giki_stage_seconds', stage='encode'), profiler.section('encode'):
             query_embedding = self.model.encode(query, convert_to_tensor=True)
-            
-            # Calculate similarities
-            similarities = cosine_similarity(
-                query_embedding.cpu().numpy().reshape(1, -1),
-                q_emb
-            )[0]
-            
-            # Get top-k matches
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
-            
-            return [(answers[i], float(similarities[i])) for i in top_indices]
-            
+            return query_embedding.cpu().numpy().reshape(-1)
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode several queries with one model call"""
+        with metrics.timer('giki_stage_seconds', stage='encode'), profiler.section('encode'):
+            return np.asarray(self.model.encode(queries, batch_size=len(queries) or 1, convert_to_numpy=True),
+                              dtype=np.float32).reshape(len(queries), -1)
+    
+    def load_questions(self) -> List[str]:
+        """Stored questions, aligned with the answers (empty for models trained without them)"""
+        questions_file = self.model_dir / 'questions.json'
+        try:
+            mtime = questions_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if self._questions[0] != mtime:
+            with open(questions_file, 'r') as f:
+                self._questions = (mtime, json.load(f))
+        return self._questions[1]
+    
+    def calibrate_cosines(self, cosines: np.ndarray) -> np.ndarray:
+        """Bi-encoder cosines as the probability that the stored question matches, on
+        the same scale as the cross-encoder's calibrated confidences"""
+        calibration_file = self.model_dir / COSINE_CALIBRATION_FILE
+        try:
+            mtime = calibration_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._cosine_calibration[0] != mtime:
+            self._cosine_calibration = (mtime, load_cosine_calibration(self.model_dir))
+        return platt_scale(cosines, self._cosine_calibration[1])
+    
+    def fit_calibration(self, question_embeddings: np.ndarray, questions: List[str], answers: List[str]):
+        """Fit the score calibrations on the training questions, each used as a query
+        with itself held out of the index; questions sharing its answer are the hits"""
+        q_emb = np.asarray(question_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(q_emb, axis=1, keepdims=True)
+        q_emb = q_emb / np.where(norms == 0, 1.0, norms)
+        limit = int(os.environ.get('GIKI_CALIBRATION_QUERIES', 200))
+        query_ids = np.unique(np.linspace(0, len(q_emb) - 1, min(limit, len(q_emb))).astype(int))
+        similarities = q_emb[query_ids] @ q_emb.T
+        similarities[np.arange(len(query_ids)), query_ids] = -np.inf
+        
+        calibration = fit_cosine_calibration(similarities, query_ids, answers)
+        if calibration is None:
+            # Without paraphrased questions there is nothing to fit; keep the default curve
+            (self.model_dir / COSINE_CALIBRATION_FILE).unlink(missing_ok=True)
+            self.logger.info("Too few paraphrased questions to fit the cosine calibration")
+        else:
+            save_calibration(self.model_dir / COSINE_CALIBRATION_FILE, calibration)
+            self.logger.info(f"Cosine calibration fitted: {calibration}")
+        
+        reranker = self.reranker
+        if reranker is not None:
+            fitted = reranker.fit_calibration([questions[i] for i in query_ids], [answers[i] for i in query_ids],
+                                              answers, questions, similarities)
+            if fitted is None:
+                self.logger.info("Too few paraphrased questions to fit the cross-encoder calibration")
+            else:
+                self.logger.info(f"Cross-encoder calibration fitted: {fitted}")
+    
+    @property
+    def reranker(self):
+        """Cross-encoder for the second retrieval stage; None if disabled or unavailable"""
+        if self._reranker is None:
+            self._reranker = False
+            if os.environ.get('GIKI_RERANK', '1') != '0':
+                try:
+                    from reranker import CrossEncoderReranker
+                    reranker = CrossEncoderReranker(self.model_dir)
+                    reranker.model  # load now, so a missing model disables re-ranking once
+                    self._reranker = reranker
+                except Exception as e:
+                    self.logger.error(f"Re-ranking disabled, cross-encoder failed to load: {str(e)}")
+        return self._reranker or None
+    
+    def similarities(self, query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of an encoded query to every stored question"""
+        # Load saved embeddings and answers (cached until a new version is published)
+        q_emb, _, is_normalized = self._load_search_index()
+        query_vector = np.asarray(query_vector).reshape(1, -1)
+        
+        # Calculate similarities, using the pre-normalized index built by the pipeline when it is current
+        with metrics.timer('giki_stage_seconds', stage='score'):
+            if is_normalized:
+                norm = np.linalg.norm(query_vector)
+                return q_emb @ (query_vector[0] / (norm if norm else 1.0))
+            from sklearn.metrics.pairwise import cosine_similarity
+            return cosine_similarity(query_vector, q_emb)[0]
+    
+    def rank(self, queries: List[str], similarities: List[np.ndarray], top_k: int = 3) -> List[List[Tuple[int, float]]]:
+        """Top-k (question index, score) per query through the retrieval cascade.
+        
+        The bi-encoder's top candidates are re-ranked by the cross-encoder, whose
+        calibrated confidence replaces the cosine score; queries with a decisive
+        bi-encoder winner, or that would not fit in the latency budget, keep the
+        cosine ranking. Scores on every path are calibrated probabilities that the
+        stored question matches."""
+        reranker = self.reranker if queries else None
+        questions = self.load_questions() if reranker else []
+        if not reranker or len(questions) != len(similarities[0]):
+            with metrics.timer('giki_stage_seconds', stage='top_k'):
+                ranked = []
+                for scores in similarities:
+                    ids = top_candidates(scores, top_k)
+                    ranked.append([(int(i), float(p)) for i, p in zip(ids, self.calibrate_cosines(scores[ids]))])
+                return ranked
+        
+        with metrics.timer('giki_stage_seconds', stage='top_k'):
+            candidates = [top_candidates(scores, reranker.candidates) for scores in similarities]
+            bi_scores = [scores[ids] for scores, ids in zip(similarities, candidates)]
+        with metrics.timer('giki_stage_seconds', stage='rerank'), profiler.section('rerank'):
+            confidences = reranker.rerank(queries, candidates, bi_scores, questions)
+        
+        ranked = []
+        for ids, scores, confidence in zip(candidates, bi_scores, confidences):
+            if confidence is None:
+                ranked.append([(int(i), float(p)) for i, p in zip(ids[:top_k], self.calibrate_cosines(scores[:top_k]))])
+            else:
+                metrics.increment('giki_reranked_total')
+                order = np.argsort(-confidence)[:top_k]
+                ranked.append([(int(ids[j]), float(confidence[j])) for j in order])
+        return ranked
+    
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 3,
+                      query_text: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Find the best matching answers for an already encoded query; with the
+        query's text the candidates are re-ranked by the cross-encoder"""
+        answers = self._load_search_index()[1]
+        similarities = self.similarities(query_vector)
+        if query_text is None:
+            with metrics.timer('giki_stage_seconds', stage='top_k'):
+                ids = top_candidates(similarities, top_k)
+                ranked = [(int(i), float(p)) for i, p in zip(ids, self.calibrate_cosines(similarities[ids]))]
+        else:
+            ranked = self.rank([query_text], [similarities], top_k)[0]
+        
+        with metrics.timer('giki_stage_seconds', stage='format'):
+            return [(answers[i], score) for i, score in ranked]
+    
+    def search_vectors(self, query_vectors: List[np.ndarray], top_k: int,
+                       query_texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """search_vector for several encoded queries, re-ranked together"""
+        answers = self._load_search_index()[1]
+        ranked = self.rank(query_texts, [self.similarities(vector) for vector in query_vectors], top_k)
+        with metrics.timer('giki_stage_seconds', stage='format'):
+            return [[(answers[i], score) for i, score in found] for found in ranked]
+    
+    def entity_answer(self, query: Union[str, NormalizedQuery]) -> Optional[str]:
+        """Targeted knowledge-base answer when the query names a specific entity (a
+        several-word name or an acronym); single ordinary words are left to the search"""
+        if self._knowledge_base is None:
+            try:
+                from giki_knowledge import GIKIKnowledgeBase
+                # The trainer serves for the life of the process, so it watches the data files
+                self._knowledge_base = GIKIKnowledgeBase(
+                    reload_interval=float(os.environ.get('GIKI_KB_RELOAD_INTERVAL', 5)) or None)
+            except Exception as e:
+                self.logger.error(f"Entity tagging disabled, knowledge base failed to load: {str(e)}")
+                self._knowledge_base = False
+        if not self._knowledge_base:
+            return None
+        with profiler.section('entity_tagging'):
+            return self._knowledge_base.get_entity_answer(query, specific_only=True)
+    
+    @metrics.timed('giki_tier_seconds', query_arg=1, tier='embedding')
+    def find_best_answer(self, query: Union[str, NormalizedQuery], top_k: int = 3, chat_id: Optional[str] = None,
+                         history: Optional[List[Dict]] = None) -> List[Tuple[str, float]]:
+        """Find the best matching answers for a query.
+        
+        With a chat_id, a follow-up like "and its labs?" has the chat's earlier turns
+        blended into its query vector so it keeps its subject; history (the chat's
+        stored messages) seeds the window after a restart. A query naming a specific
+        entity is answered from the knowledge base without encoding it.
+        
+        Results of other queries are kept in a semantic cache shared by all chats: a
+        repeat of a recent query skips encoding, and a paraphrase close enough to one
+        (GIKI_SEMANTIC_CACHE_THRESHOLD) skips the search. Entries are tagged with the
+        model version they were computed on and ignored once a new one is out."""
+        try:
+            return self.find_best_answers([(query, chat_id, history)], top_k)[0]
         except Exception as e:
             self.logger.error(f"Error finding answer: {str(e)}")
             return []
     
-    def train(self):
+    def find_best_answers(self, requests: List[Tuple[Union[str, NormalizedQuery], Optional[str], Optional[List[Dict]]]],
+                          top_k: int = 3) -> List[List[Tuple[str, float]]]:
+        """find_best_answer for several (query, chat_id, history) requests at once: the
+        queries that need encoding share one model call and every search goes through
+        one re-ranking pass"""
+        # Read before searching: results of a search that straddles a new version
+        # are stored under the old one and never served
+        version = self.events.current_version().get('version', 0)
+        results: List[Optional[List[Tuple[str, float]]]] = [None] * len(requests)
+        to_encode, searches = [], []
+        for i, (query, chat_id, history) in enumerate(requests):
+            query = normalize_query(query)
+            answer = self.entity_answer(query)
+            if answer is not None:
+                metrics.increment('giki_entity_hits_total')
+                if chat_id is not None:
+                    # Kept as text; encoded only if a follow-up needs the context vector
+                    self.context.add_turn(chat_id, query.text, history, encode=False)
+                results[i] = [(answer, 1.0)]
+            elif chat_id is not None and is_follow_up(query.tokens) and self.context.previous_turns(chat_id, history):
+                # Context-blended vectors carry the chat's earlier turns, so they neither
+                # read nor fill the cache other chats share
+                query_vector = self.context.query_vector(chat_id, query.text, history)
+                # The previous turn gives follow-ups their subject for the cross-encoder
+                searches.append((i, query_vector, ' '.join(self.context.previous_turns(chat_id)[-2:]), None))
+            else:
+                if chat_id is not None:
+                    self.context.add_turn(chat_id, query.text, history, encode=False)
+                cached = self.answer_cache.get_exact(query.key, top_k, version)
+                if cached is not None:
+                    metrics.increment('giki_semantic_cache_hits_total', kind='exact')
+                    results[i] = cached
+                else:
+                    to_encode.append((i, query))
+        
+        if to_encode:
+            vectors = self.encode_queries([query.text for _, query in to_encode])
+            for (i, query), query_vector in zip(to_encode, vectors):
+                cached = self.answer_cache.get_similar(query_vector, top_k, version)
+                if cached is not None:
+                    metrics.increment('giki_semantic_cache_hits_total', kind='semantic')
+                    results[i] = cached
+                else:
+                    searches.append((i, query_vector, query.text, query.key))
+        
+        if searches:
+            found = self.search_vectors([vector for _, vector, _, _ in searches], top_k,
+                                        [text for _, _, text, _ in searches])
+            for (i, query_vector, _, key), result in zip(searches, found):
+                results[i] = result
+                if key is not None:
+                    self.answer_cache.put(key, query_vector, result, version)
+        return results
+    
+    def find_passages(self, query: Union[str, NormalizedQuery], top_k: int = 3) -> List[Tuple[Dict, float]]:
+        """Scraped passages most similar to a query, with their source metadata"""
+        try:
+            query = normalize_query(query)
+            return self.passage_store.search(self.encode_query(query.text), top_k)
+        except Exception as e:
+            self.logger.error(f"Error finding passages: {str(e)}")
+            return []
+    
+    def train(self, encode_answers: bool = False):
         """Train/update the model with latest data"""
         try:
             # Prepare training data
@@ -169,10 +487,28 @@ class GIKIModelTrainer:
                 raise ValueError("No training data available")
             
             # Encode QA pairs
-            q_embeddings, a_embeddings, answers = self.encode_qa_pairs(training_data)
+            q_embeddings, a_embeddings, answers = self.encode_qa_pairs(training_data, encode_answers)
             
             # Save embeddings and answers
-            self.save_embeddings(q_embeddings, a_embeddings, answers)
+            questions = [item['question'] for item in training_data]
+            self.save_embeddings(q_embeddings, a_embeddings, answers, questions=questions)
+            
+            # Served scores are calibrated probabilities; refit them on the new data
+            try:
+                import torch
+                q_emb = q_embeddings.cpu().numpy() if torch.is_tensor(q_embeddings) else q_embeddings
+                self.fit_calibration(q_emb, questions, answers)
+            except Exception as e:
+                self.logger.error(f"Error fitting score calibration: {str(e)}")
+            
+            # Let serving processes hot-swap to the new embeddings
+            info = self.events.publish({'num_qa_pairs': len(answers)})
+            
+            # New workers map this instead of rebuilding indexes and tables
+            try:
+                build_snapshot(self.model_dir, version=info['version'])
+            except Exception as e:
+                self.logger.error(f"Error writing warm-state snapshot: {str(e)}")
             
             self.logger.info("Training completed successfully")
             return True
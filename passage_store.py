@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reranker import top_candidates
+
+PASSAGES_FILE = 'passages.json'
+PASSAGE_INDEX_FILE = 'passage_index.npy'
+# Window and overlap in words; 128 words stays inside the encoder's 256 word-piece limit
+WINDOW_TOKENS = 128
+OVERLAP_TOKENS = 32
+
+def chunk_pages(records: List[Dict], window: int = WINDOW_TOKENS, overlap: int = OVERLAP_TOKENS) -> List[Dict]:
+    """Split scraped records into overlapping word windows, one page at a time.
+
+    Records of a page (same url) are joined in document order; each passage keeps the
+    page's source and url, the header it starts under, and its word offsets. Identical
+    windows (e.g. a footer repeated on every page of a site) are kept once."""
+    pages: Dict[str, List[Dict]] = {}
+    for record in records:
+        pages.setdefault(record['url'], []).append(record)
+
+    passages, seen = [], set()
+    stride = max(1, window - overlap)
+    for url, page in pages.items():
+        words, sections, section = [], [], None
+        for record in sorted(page, key=lambda r: r.get('position', 0)):
+            if record.get('kind') == 'header':
+                section = record['text']
+            record_words = record['text'].split()
+            words.extend(record_words)
+            sections.extend([section] * len(record_words))
+
+        for start in range(0, max(len(words) - overlap, 1), stride):
+            end = min(start + window, len(words))
+            text = ' '.join(words[start:end])
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            passages.append({
+                'id': hashlib.sha1(f"{url}\0{text}".encode('utf-8')).hexdigest()[:16],
+                'text': text,
+                'source': page[0]['source'],
+                'url': url,
+                'section': sections[start],
+                'start': start,
+                'end': end,
+                'timestamp': page[0].get('timestamp')
+            })
+    return passages
+
+class PassageStore:
+    """Scraped page text as overlapping passages with one embedding each, searchable
+    directly by query vector.
+
+    Rebuilding reuses the stored vector of every passage whose text is unchanged, so
+    each chunk is encoded once."""
+
+    def __init__(self, store_dir: Path = Path("models")):
+        self.store_dir = Path(store_dir)
+        self.logger = logging.getLogger('PassageStore')
+        self._lock = threading.Lock()
+        self._loaded = (None, [], None)
+
+    def _load(self) -> Tuple[List[Dict], Optional[np.ndarray]]:
+        """Passages and their normalized vectors, reloaded when the store is rebuilt"""
+        index_file = self.store_dir / PASSAGE_INDEX_FILE
+        try:
+            mtime = index_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return [], None
+        with self._lock:
+            if self._loaded[0] != mtime:
+                with open(self.store_dir / PASSAGES_FILE, 'r') as f:
+                    passages = json.load(f)
+                index = np.load(index_file, mmap_mode='r')
+                if len(passages) != len(index):
+                    return [], None  # caught between the two renames of a rebuild
+                self._loaded = (mtime, passages, index)
+            return self._loaded[1], self._loaded[2]
+
+    @property
+    def passages(self) -> List[Dict]:
+        return self._load()[0]
+
+    def build(self, passages: List[Dict], encoder=None) -> int:
+        """Embed and index passages from chunk_pages; returns the number indexed"""
+        previous, previous_index = self._load()
+        known = {}
+        if previous_index is not None:
+            known = {p['text']: previous_index[i] for i, p in enumerate(previous)}
+        new_texts = [p['text'] for p in passages if p['text'] not in known]
+
+        vectors = np.zeros((0, 0), dtype=np.float32)
+        if new_texts:
+            if encoder is None:
+                from bulk_encoder import BulkEncoder
+                encoder = BulkEncoder(cache_dir=self.store_dir)
+            vectors = np.asarray(encoder.encode(new_texts), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        encoded = dict(zip(new_texts, vectors))
+
+        dimension = vectors.shape[1] if new_texts else (previous_index.shape[1] if known else 0)
+        index = np.zeros((len(passages), dimension), dtype=np.float32)
+        for i, passage in enumerate(passages):
+            index[i] = encoded[passage['text']] if passage['text'] in encoded else known[passage['text']]
+
+        # Passages first, index last: readers reload on the index's mtime
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.store_dir / f'{PASSAGES_FILE}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(passages, f)
+        os.replace(tmp_file, self.store_dir / PASSAGES_FILE)
+        tmp_file = self.store_dir / f'{PASSAGE_INDEX_FILE}.tmp.npy'
+        np.save(tmp_file, index)
+        os.replace(tmp_file, self.store_dir / PASSAGE_INDEX_FILE)
+
+        self.logger.info(f"Indexed {len(passages)} passages ({len(new_texts)} newly encoded)")
+        return len(passages)
+
+    def search(self, query_vector: np.ndarray, top_k: int = 3) -> List[Tuple[Dict, float]]:
+        """Most similar passages to an encoded query, best first"""
+        passages, index = self._load()
+        if index is None or not len(passages):
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query_vector)
+        scores = index @ (query_vector / (norm if norm else 1.0))
+        return [(passages[i], float(scores[i])) for i in top_candidates(scores, top_k)]
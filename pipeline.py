@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+class PipelineStage:
+    def __init__(self, name: str, func: Callable[[], bool], inputs: Optional[List] = None,
+                 outputs: Optional[List] = None, depends_on: Optional[List[str]] = None,
+                 max_age: Optional[float] = None, always_run: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in (inputs or [])]
+        self.outputs = [Path(p) for p in (outputs or [])]
+        self.depends_on = list(depends_on or [])
+        # Stages without file inputs (e.g. web scraping) are considered fresh for max_age seconds
+        self.max_age = max_age
+        self.always_run = always_run
+
+class GIKIPipeline:
+    def __init__(self, state_file: Path = Path("data") / "pipeline_state.json", max_workers: int = 2):
+        self.state_file = Path(state_file)
+        self.state_file.parent.mkdir(exist_ok=True)
+        self.max_workers = max_workers
+        self.stages: Dict[str, PipelineStage] = {}
+        self.timings: Dict[str, float] = {}
+        self.logger = logging.getLogger('Pipeline')
+        self.state = self.load_state()
+
+    def add_stage(self, stage: PipelineStage):
+        """Register a stage; dependencies must already be registered"""
+        for dep in stage.depends_on:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        self.stages[stage.name] = stage
+
+    def load_state(self) -> Dict:
+        """Load fingerprints recorded by previous runs"""
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.error(f"Error loading pipeline state: {str(e)}")
+        return {}
+
+    def save_state(self):
+        """Persist stage fingerprints and timings"""
+        try:
+            tmp_file = self.state_file.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            tmp_file.replace(self.state_file)
+        except Exception as e:
+            self.logger.error(f"Error saving pipeline state: {str(e)}")
+
+    def _hash_path(self, path: Path, digest):
+        """Feed the content of a file (or every file under a directory) into digest"""
+        if path.is_dir():
+            for child in sorted(p for p in path.rglob('*') if p.is_file()):
+                self._hash_path(child, digest)
+            return
+        digest.update(str(path).encode())
+        if not path.exists():
+            digest.update(b'<missing>')
+            return
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+    def fingerprint(self, stage: PipelineStage) -> str:
+        """Content fingerprint of a stage's declared inputs"""
+        digest = hashlib.sha256(stage.name.encode())
+        for path in stage.inputs:
+            self._hash_path(path, digest)
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: PipelineStage, fingerprint: str) -> bool:
+        """Check whether a stage can be skipped"""
+        if stage.always_run:
+            return False
+        previous = self.state.get(stage.name)
+        if not previous or previous.get('fingerprint') != fingerprint:
+            return False
+        if not all(path.exists() for path in stage.outputs):
+            return False
+        if stage.max_age is not None:
+            return time.time() - previous.get('completed_at', 0) < stage.max_age
+        return True
+
+    def _run_stage(self, stage: PipelineStage, force: bool) -> str:
+        """Run a single stage, returning 'ran', 'skipped' or 'failed'"""
+        fingerprint = self.fingerprint(stage)
+        if not force and self.is_fresh(stage, fingerprint):
+            self.logger.info(f"Stage '{stage.name}' is up to date, skipping")
+            return 'skipped'
+
+        self.logger.info(f"Running stage '{stage.name}'")
+        start = time.perf_counter()
+        try:
+            success = stage.func()
+        except Exception as e:
+            self.logger.error(f"Stage '{stage.name}' raised: {str(e)}")
+            success = False
+        self.timings[stage.name] = time.perf_counter() - start
+
+        if not success:
+            self.logger.error(f"Stage '{stage.name}' failed after {self.timings[stage.name]:.2f}s")
+            return 'failed'
+
+        # Record the input fingerprint this successful run was based on
+        self.state[stage.name] = {
+            'fingerprint': fingerprint,
+            'completed_at': time.time(),
+            'completed': datetime.now().isoformat(),
+            'duration': self.timings[stage.name]
+        }
+        self.save_state()
+        self.logger.info(f"Stage '{stage.name}' completed in {self.timings[stage.name]:.2f}s")
+        return 'ran'
+
+    def run(self, force: bool = False) -> bool:
+        """Run all stages in dependency order, independent stages in parallel"""
+        results: Dict[str, str] = {}
+        self.timings = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # A stage whose dependency failed cannot run
+                for name, stage in list(pending.items()):
+                    if any(results.get(dep) in ('failed', 'blocked') for dep in stage.depends_on):
+                        self.logger.error(f"Stage '{name}' blocked by failed dependency")
+                        results[name] = 'blocked'
+                        del pending[name]
+
+                ready = [stage for stage in pending.values()
+                         if all(results.get(dep) in ('ran', 'skipped') for dep in stage.depends_on)]
+                for stage in ready:
+                    del pending[stage.name]
+                    running[executor.submit(self._run_stage, stage, force)] = stage.name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        for name in self.stages:
+            timing = f" ({self.timings[name]:.2f}s)" if name in self.timings else ""
+            self.logger.info(f"Stage summary - {name}: {results.get(name, 'not run')}{timing}")
+
+        return all(result in ('ran', 'skipped') for result in results.values())
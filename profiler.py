@@ -0,0 +1,160 @@
+import cProfile
+import functools
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+class StackSampler:
+    """Samples one thread's call stack at a fixed interval into folded-stack counts"""
+
+    def __init__(self, thread_id: int, sections: List[str], interval: float = 0.005):
+        self.thread_id = thread_id
+        self.sections = sections
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            # Prefix with the active sections so flame graphs group by request stage
+            self.counts[';'.join([f"[{s}]" for s in self.sections] + stack)] += 1
+
+class RequestProfiler:
+    """Opt-in per-request profiling: cProfile dumps plus aggregated folded stacks
+    (flamegraph.pl / speedscope compatible) under logs/profiles"""
+
+    def __init__(self, log_dir: Path = Path("logs") / "profiles", sample_interval: float = 0.005):
+        self.log_dir = Path(log_dir)
+        self.sample_interval = sample_interval
+        self.aggregate_file = self.log_dir / 'aggregate.folded'
+        self.logger = logging.getLogger('Profiler')
+        self._local = threading.local()
+        self._aggregate_lock = threading.Lock()
+
+    def is_enabled(self, query_params: Optional[Dict] = None) -> bool:
+        """Enabled for every request by GIKI_PROFILE=1, or per request by a
+        ?profile=<token> query parameter matching the admin's GIKI_PROFILE_TOKEN.
+        Without a token configured the query parameter is ignored, so visitors of a
+        public deployment cannot turn profiling on."""
+        if os.environ.get('GIKI_PROFILE', '').lower() in ('1', 'true', 'yes'):
+            return True
+        token = os.environ.get('GIKI_PROFILE_TOKEN', '')
+        if not token or not query_params:
+            return False
+        return hmac.compare_digest(str(query_params.get('profile', '')), token)
+
+    @property
+    def active(self) -> bool:
+        return getattr(self._local, 'request', None) is not None
+
+    @contextmanager
+    def profile_request(self, name: str = 'request', enabled: bool = False):
+        """Profile everything inside the block when enabled; a no-op otherwise"""
+        if not enabled or self.active:
+            yield
+            return
+
+        request = {'name': name, 'sections': [], 'timings': {}}
+        self._local.request = request
+        sampler = StackSampler(threading.get_ident(), request['sections'], self.sample_interval)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            counts = sampler.stop()
+            request['timings']['total'] = time.perf_counter() - start
+            self._local.request = None
+            self._dump(request, profile, counts)
+
+    @contextmanager
+    def section(self, name: str):
+        """Label a stage of the current request; free when not profiling"""
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            yield
+            return
+
+        request['sections'].append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            request['sections'].pop()
+            request['timings'][name] = request['timings'].get(name, 0.0) + time.perf_counter() - start
+
+    def sectioned(self, name: str):
+        """Decorator form of section()"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.section(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _dump(self, request: Dict, profile: cProfile.Profile, counts: Counter):
+        """Write the per-request profile and merge its samples into the aggregate"""
+        try:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            stem = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request['name']}"
+            profile.dump_stats(self.log_dir / f"{stem}.prof")
+
+            with open(self.log_dir / f"{stem}.folded", 'w') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+
+            with open(self.log_dir / f"{stem}.json", 'w') as f:
+                json.dump({'name': request['name'], 'timings': request['timings'], 'samples': sum(counts.values())},
+                          f, indent=2)
+
+            with self._aggregate_lock:
+                aggregate = Counter()
+                if self.aggregate_file.exists():
+                    with open(self.aggregate_file, 'r') as f:
+                        for line in f:
+                            stack, _, count = line.rstrip('\n').rpartition(' ')
+                            if stack:
+                                aggregate[stack] += int(count)
+                aggregate.update(counts)
+                tmp_file = self.aggregate_file.with_suffix(f'.{os.getpid()}.tmp')
+                with open(tmp_file, 'w') as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in aggregate.most_common())
+                os.replace(tmp_file, self.aggregate_file)
+
+            timings = ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in request['timings'].items())
+            self.logger.info(f"Profiled {request['name']}: {timings}")
+        except Exception as e:
+            self.logger.error(f"Error writing profile: {str(e)}")
+
+# Shared profiler used by the chat request path
+profiler = RequestProfiler()
@@ -0,0 +1,119 @@
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Tuple, Union
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Typographic characters NFKC leaves alone
+CHARACTER_MAP = str.maketrans({
+    '‘': "'", '’': "'", 'ʼ': "'", '`': "'",
+    '“': '"', '”': '"',
+    '–': '-', '—': '-',
+})
+
+# Irregular contractions first; the generic suffix rules below handle the rest
+CONTRACTIONS = [
+    (re.compile(r"\bwon't\b"), "will not"),
+    (re.compile(r"\bcan't\b"), "can not"),
+    (re.compile(r"\bshan't\b"), "shall not"),
+    (re.compile(r"\b(what|where|when|who|how|that|there|it|here)'s\b"), r"\1 is"),
+    (re.compile(r"\bi'm\b"), "i am"),
+    (re.compile(r"\blet's\b"), "let us"),
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'d\b"), " would"),
+    (re.compile(r"'s\b"), ""),  # possessive: "giki's hostels" -> "giki hostels"
+]
+
+# Roman Urdu question words and common spellings; an empty value drops the token.
+# Words that are also English ("main", "he", "me") are deliberately left out.
+ROMAN_URDU = {
+    'kya': 'what', 'kia': 'what', 'kiya': 'what',
+    'kahan': 'where', 'kahaan': 'where', 'kidhar': 'where',
+    'kab': 'when',
+    'kaise': 'how', 'kaisay': 'how', 'kesay': 'how', 'kaisy': 'how',
+    'kitne': 'how many', 'kitni': 'how many', 'kitna': 'how many', 'kitnay': 'how many',
+    'kaun': 'who', 'kon': 'who', 'kaunsa': 'which', 'konsa': 'which', 'konsi': 'which', 'kaunsi': 'which',
+    'kyun': 'why', 'kyon': 'why',
+    'dakhla': 'admission', 'dakhila': 'admission', 'dakhlay': 'admission',
+    'shoba': 'department', 'shobay': 'departments',
+    'hai': '', 'hain': '', 'ka': '', 'ki': '', 'ke': '', 'ko': '', 'mein': '', 'mai': '', 'se': '',
+    'batao': '', 'btao': '', 'bataen': '', 'bataein': '', 'bataye': '', 'plz': '', 'pls': '', 'please': '',
+}
+
+# Single-token synonyms, mapped to the words the matchers' patterns use
+SYNONYMS = {
+    'dept': 'department', 'depts': 'departments',
+    'programme': 'program', 'programmes': 'programs',
+    'laboratory': 'lab', 'laboratories': 'labs',
+    'dorm': 'hostel', 'dorms': 'hostels', 'dormitory': 'hostel', 'dormitories': 'hostels',
+    'prof': 'professor', 'profs': 'professors',
+    'uni': 'university',
+    'fees': 'fee',
+    'gik': 'giki',
+    'soc': 'society',
+    'canteen': 'cafeteria', 'canteens': 'cafeterias', 'cafe': 'cafeteria', 'cafes': 'cafeterias',
+}
+
+# Multi-word synonyms, applied to the token string
+PHRASE_SYNONYMS = [
+    (re.compile(r"\bghulam ishaq khan institute( of engineering sciences and technology)?\b"), "giki"),
+    (re.compile(r"\bghulam ishaq khan\b"), "giki"),
+]
+
+# Identifies the canonical forms this module produces; anything stored under
+# normalized keys (e.g. the warm-state quick-answer table) is rebuilt when it changes.
+# Bump the leading revision when _normalize itself changes.
+NORMALIZER_VERSION = hashlib.sha1(repr((
+    1, CHARACTER_MAP, [(pattern.pattern, replacement) for pattern, replacement in CONTRACTIONS],
+    ROMAN_URDU, SYNONYMS, [(pattern.pattern, replacement) for pattern, replacement in PHRASE_SYNONYMS]
+)).encode('utf-8')).hexdigest()[:12]
+
+class NormalizedQuery(NamedTuple):
+    """A query canonicalized once per request and passed to every matcher.
+
+    text is the canonical string (and the shared cache key); tokens are its words."""
+    raw: str
+    text: str
+    tokens: Tuple[str, ...]
+
+    @property
+    def key(self) -> str:
+        return self.text
+
+    def __str__(self) -> str:
+        return self.raw
+
+def fold_unicode(text: str) -> str:
+    """NFKC, casefold and strip accents ("Café" -> "cafe", full-width -> ASCII)"""
+    text = unicodedata.normalize('NFKC', text).translate(CHARACTER_MAP).casefold()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+@lru_cache(maxsize=4096)
+def _normalize(query: str) -> NormalizedQuery:
+    text = fold_unicode(query)
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+
+    tokens = []
+    for token in TOKEN_RE.findall(text):
+        token = ROMAN_URDU.get(token, token)
+        token = SYNONYMS.get(token, token)
+        if token:
+            tokens.append(token)
+
+    text = ' '.join(tokens)
+    for pattern, replacement in PHRASE_SYNONYMS:
+        text = pattern.sub(replacement, text)
+    return NormalizedQuery(query, text, tuple(text.split()))
+
+def normalize_query(query: Union[str, NormalizedQuery]) -> NormalizedQuery:
+    """Canonical form of a query; already-normalized queries are returned as is"""
+    if isinstance(query, NormalizedQuery):
+        return query
+    return _normalize(query or '')
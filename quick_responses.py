@@ -1,8 +1,52 @@
-from typing import Dict, Optional
+import hashlib
+import json
+import logging
+from typing import Dict, Optional, Union
+from metrics import metrics
+from query_normalizer import NORMALIZER_VERSION, NormalizedQuery, normalize_query
 
 class QuickResponses:
-    def __init__(self):
-        self.quick_answers = {
+    def __init__(self, snapshot=None):
+        self.logger = logging.getLogger('QuickResponses')
+        self.quick_answers = self._source_answers()
+        self._add_question_variations()
+        # The canonicalized table is part of the warm-state snapshot, reused only if it
+        # was built from this table by this normalizer
+        self.signature = hashlib.sha1(json.dumps([NORMALIZER_VERSION, self.quick_answers],
+                                                 sort_keys=True).encode('utf-8')).hexdigest()
+        saved = self._table_from_snapshot(snapshot)
+        if saved is not None:
+            self.quick_answers = saved
+        else:
+            # Keys go through the same canonicalization as queries ("what's giki" -> "what is giki")
+            self.quick_answers = {normalize_query(q).text: answer for q, answer in self.quick_answers.items()}
+    
+    def _table_from_snapshot(self, snapshot=None) -> Optional[Dict[str, str]]:
+        """Canonical table from a warm-state snapshot (the shared one unless given; False skips it)"""
+        if snapshot is False:
+            return None
+        try:
+            if snapshot is None:
+                from warm_state import load_warm_state
+                snapshot = load_warm_state()
+            if snapshot is None or 'quick_answers' not in snapshot:
+                return None
+            saved = snapshot.object('quick_answers')
+            if not isinstance(saved.get('signature'), str) or saved['signature'] != self.signature:
+                return None  # table or normalizer changed since the snapshot was taken
+            return saved['table']
+        except Exception as e:
+            self.logger.error(f"Error reading quick answers from snapshot: {str(e)}")
+            return None
+    
+    def snapshot_state(self) -> Dict:
+        """What a warm-state snapshot stores for the quick answers"""
+        return {'signature': self.signature, 'table': self.quick_answers}
+    
+    @staticmethod
+    def _source_answers() -> Dict[str, str]:
+        """The curated answers under their questions as written"""
+        return {
             "what is giki": """GIKI stands for Ghulam Ishaq Khan Institute of Engineering Sciences and Technology. 
 It is one of Pakistan's premier engineering universities, established in 1993 and located in Topi, Khyber Pakhtunkhwa.
 The institute is named after Mr. Ghulam Ishaq Khan, former President of Pakistan.""",
@@ -53,9 +97,6 @@ The admission process typically starts in June-July each year.""",
 • Facilities: Modern labs, hostels, sports complex
 • Recognition: HEC recognized, PEC accredited""",
         }
-        
-        # Add variations of questions
-        self._add_question_variations()
     
     def _add_question_variations(self):
         """Add common variations of questions to the quick answers"""
@@ -78,9 +119,12 @@ The admission process typically starts in June-July each year.""",
             for var in vars:
                 self.quick_answers[var] = base_answer
     
-    def get_quick_response(self, query: str) -> Optional[str]:
+    @metrics.timed('giki_tier_seconds', tier='quick')
+    def get_quick_response(self, query: Union[str, NormalizedQuery]) -> Optional[str]:
         """Get a quick response for common questions"""
-        query = query.lower().strip()
+        query = normalize_query(query).text
+        if not query:
+            return None
         
         # Direct match
         if query in self.quick_answers:
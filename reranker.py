@@ -0,0 +1,270 @@
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_RERANKER = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+CALIBRATION_FILE = 'reranker_calibration.json'
+COSINE_CALIBRATION_FILE = 'cosine_calibration.json'
+
+# Bi-encoder cosines map to the same probability scale as the cross-encoder's
+# confidences. Until train() fits one: 0.5 at cosine 0.6, 0.88 at 0.8
+DEFAULT_COSINE_CALIBRATION = {'a': 10.0, 'b': -6.0}
+
+logger = logging.getLogger('Reranker')
+
+def top_candidates(similarities: np.ndarray, count: int) -> np.ndarray:
+    """Indices of the count highest similarities, best first"""
+    count = min(count, len(similarities))
+    if count <= 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(-similarities, count - 1)[:count]
+    return top[np.argsort(-similarities[top])]
+
+def fit_platt(logits: np.ndarray, labels: np.ndarray, iterations: int = 100) -> Tuple[float, float]:
+    """Platt scaling: (a, b) with P(correct) = sigmoid(a * logit + b).
+
+    Newton's method with backtracking on Platt's smoothed targets, so a perfectly
+    separable set still gives a finite scale."""
+    logits = np.asarray(logits, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    positives, negatives = labels.sum(), (~labels).sum()
+    targets = np.where(labels, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+    features = np.stack([logits, np.ones_like(logits)], axis=1)
+
+    def loss(params: np.ndarray) -> float:
+        z = features @ params
+        return float((targets * np.logaddexp(0, -z) + (1 - targets) * np.logaddexp(0, z)).sum())
+
+    params = np.array([1.0, 0.0])
+    current = loss(params)
+    for _ in range(iterations):
+        p = 0.5 * (1 + np.tanh(0.5 * (features @ params)))
+        gradient = features.T @ (p - targets)
+        hessian = features.T @ (features * (p * (1 - p))[:, None]) + 1e-12 * np.eye(2)
+        step = np.linalg.solve(hessian, gradient)
+        size = 1.0
+        while size > 1e-10 and loss(params - size * step) > current:
+            size /= 2
+        params = params - size * step
+        previous, current = current, loss(params)
+        if previous - current < 1e-10:
+            break
+    return float(params[0]), float(params[1])
+
+def platt_scale(scores: np.ndarray, calibration: Dict) -> np.ndarray:
+    """sigmoid(a * score + b) with fitted Platt parameters"""
+    return 1 / (1 + np.exp(-(calibration['a'] * np.asarray(scores, dtype=np.float64) + calibration['b'])))
+
+def save_calibration(path: Path, calibration: Dict):
+    tmp_file = path.with_name(f'{path.name}.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp_file, path)
+
+def load_cosine_calibration(model_dir: Path = Path("models")) -> Dict:
+    """Platt parameters fitted on the bi-encoder's cosines, or the default curve"""
+    try:
+        with open(Path(model_dir) / COSINE_CALIBRATION_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error loading cosine calibration: {str(e)}")
+    return dict(DEFAULT_COSINE_CALIBRATION)
+
+def fit_cosine_calibration(similarities: np.ndarray, query_ids: Sequence[int], answers: List[str],
+                           candidates: int = 10, min_labels: int = 10) -> Optional[Dict]:
+    """Platt parameters for the bi-encoder from stored questions used as queries.
+
+    similarities holds each query's cosines against every stored question, its own
+    row held out (-inf); a candidate counts as correct when it shares the query's
+    answer. None when there are too few correct or wrong candidates to fit."""
+    cosines, labels = [], []
+    for query_id, scores in zip(query_ids, similarities):
+        ids = top_candidates(scores, candidates)
+        ids = ids[np.isfinite(scores[ids])]
+        cosines.extend(scores[ids])
+        labels.extend(answers[j] == answers[query_id] for j in ids)
+    positives = int(sum(labels))
+    if positives < min_labels or len(labels) - positives < min_labels:
+        return None
+    a, b = fit_platt(np.array(cosines), np.array(labels))
+    return {'a': a, 'b': b, 'pairs': len(labels), 'positives': positives}
+
+class CrossEncoderReranker:
+    """Second stage of the retrieval cascade.
+
+    The bi-encoder's top candidates are scored as (query, stored question) pairs by a
+    small cross-encoder and the logits are calibrated to a probability that the stored
+    question matches. Queries whose bi-encoder ranking is already decisive skip the
+    cross-encoder. Model calls are sized from the measured time per pair (timed once
+    when the model loads, then tracked as a moving average), and a query is only
+    scored if its pairs are expected to finish inside the latency budget; queries
+    left unscored keep their bi-encoder ranking. So that one slow measurement cannot
+    shut the cross-encoder off for good, a single query is let through as a probe
+    when nothing has been scored for probe_seconds, which refreshes the estimate."""
+
+    def __init__(self, model_dir: Path = Path("models"), model_name: Optional[str] = None,
+                 candidates: Optional[int] = None, budget_ms: Optional[float] = None,
+                 decisive_score: float = 0.9, decisive_margin: float = 0.15, batch_size: int = 32,
+                 probe_seconds: Optional[float] = None):
+        self.model_dir = Path(model_dir)
+        self.model_name = model_name or os.environ.get('GIKI_RERANKER_MODEL', DEFAULT_RERANKER)
+        self.candidates = candidates or int(os.environ.get('GIKI_RERANK_CANDIDATES', 50))
+        self.budget = (budget_ms if budget_ms is not None else
+                       float(os.environ.get('GIKI_RERANK_BUDGET_MS', 40))) / 1000
+        self.decisive_score = decisive_score
+        self.decisive_margin = decisive_margin
+        self.batch_size = batch_size
+        self.probe_seconds = (probe_seconds if probe_seconds is not None else
+                              float(os.environ.get('GIKI_RERANK_PROBE_SECONDS', 30)))
+        self.calibration = self.load_calibration()
+        self._model = None
+        self.pair_seconds: Optional[float] = None
+        self.last_scored = time.perf_counter()
+        self.stats = {'reranked': 0, 'decisive': 0, 'over_budget': 0, 'probes': 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.model_name, max_length=128)
+            # One full batch up front, so the first query already has a latency estimate
+            pairs = [('how many hostels are there', 'what hostels does giki have')] * self.batch_size
+            model.predict(pairs, batch_size=len(pairs))
+            start = time.perf_counter()
+            model.predict(pairs, batch_size=len(pairs))
+            self.pair_seconds = (time.perf_counter() - start) / len(pairs)
+            self._model = model
+        return self._model
+
+    def load_calibration(self) -> Dict:
+        """Platt parameters fitted for this cross-encoder, or the plain sigmoid"""
+        path = self.model_dir / CALIBRATION_FILE
+        try:
+            with open(path, 'r') as f:
+                calibration = json.load(f)
+            if calibration.get('model_name') == self.model_name:
+                return calibration
+            logger.info(f"Ignoring calibration fitted for {calibration.get('model_name')}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading reranker calibration: {str(e)}")
+        return {'model_name': self.model_name, 'a': 1.0, 'b': 0.0}
+
+    def calibrate(self, logits: np.ndarray) -> np.ndarray:
+        return platt_scale(logits, self.calibration)
+
+    def is_decisive(self, scores: np.ndarray) -> bool:
+        """Whether the bi-encoder's best-first scores leave no doubt about the winner"""
+        if len(scores) < 2:
+            return len(scores) == 1
+        return scores[0] >= self.decisive_score or scores[0] - scores[1] >= self.decisive_margin
+
+    def predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return np.asarray(self.model.predict(pairs, batch_size=len(pairs) or 1), dtype=np.float64)
+
+    def rerank(self, queries: Sequence[str], candidates: Sequence[np.ndarray], bi_scores: Sequence[np.ndarray],
+               questions: List[str]) -> List[Optional[np.ndarray]]:
+        """Calibrated confidences for each query's candidates, or None where the
+        cross-encoder was skipped (decisive or over budget)"""
+        start = time.perf_counter()
+        results: List[Optional[np.ndarray]] = [None] * len(queries)
+        pending = []
+        for i, (ids, scores) in enumerate(zip(candidates, bi_scores)):
+            if self.is_decisive(scores):
+                self.stats['decisive'] += 1
+            else:
+                pending.append(i)
+
+        # Queries are scored whole, several per model call, as long as the pairs are
+        # expected to finish inside the budget
+        while pending:
+            self.model  # loads the model and measures pair_seconds
+            remaining = self.budget - (time.perf_counter() - start)
+            # Without an estimate (a model set from outside) one query is scored to get one
+            affordable = int(remaining / self.pair_seconds) if self.pair_seconds else len(candidates[pending[0]])
+            limit = min(self.batch_size, affordable)
+            if remaining <= 0 or len(candidates[pending[0]]) > affordable:
+                if time.perf_counter() - self.last_scored < self.probe_seconds:
+                    self.stats['over_budget'] += len(pending)
+                    break
+                # The estimate may be stale; score one query to measure it afresh
+                self.stats['probes'] += 1
+                limit = len(candidates[pending[0]])
+                self.pair_seconds = None
+            chunk, size = [], 0
+            while pending and (not chunk or size + len(candidates[pending[0]]) <= limit):
+                chunk.append(pending.pop(0))
+                size += len(candidates[chunk[-1]])
+            pairs = [(queries[i], questions[j]) for i in chunk for j in candidates[i]]
+            call_start = time.perf_counter()
+            logits = self.predict(pairs)
+            self.last_scored = time.perf_counter()
+            per_pair = (self.last_scored - call_start) / len(pairs)
+            self.pair_seconds = per_pair if self.pair_seconds is None else 0.8 * self.pair_seconds + 0.2 * per_pair
+            offset = 0
+            for i in chunk:
+                count = len(candidates[i])
+                results[i] = self.calibrate(logits[offset:offset + count])
+                offset += count
+                self.stats['reranked'] += 1
+        return results
+
+    def fit_calibration(self, queries: List[str], expected_answers: List[str], answers: List[str],
+                        questions: List[str], similarities: np.ndarray, min_labels: int = 10) -> Optional[Dict]:
+        """Fit and save Platt parameters from labeled queries.
+
+        similarities holds each query's bi-encoder scores against the stored questions
+        (-inf for held-out ones); a candidate counts as correct when its answer is the
+        expected one. With fewer than min_labels correct or wrong candidates nothing
+        is fitted and the current calibration is kept; returns None then."""
+        logits, labels = [], []
+        for query, expected, scores in zip(queries, expected_answers, similarities):
+            ids = top_candidates(scores, self.candidates)
+            ids = ids[np.isfinite(scores[ids])]
+            logits.extend(self.predict([(query, questions[j]) for j in ids]))
+            labels.extend(answers[j] == expected for j in ids)
+        positives = int(sum(labels))
+        if positives < min_labels or len(labels) - positives < min_labels:
+            logger.info(f"Keeping the reranker calibration: {positives} of {len(labels)} pairs correct")
+            return None
+        a, b = fit_platt(np.array(logits), np.array(labels))
+        self.calibration = {'model_name': self.model_name, 'a': a, 'b': b,
+                            'pairs': len(labels), 'positives': positives}
+
+        save_calibration(self.model_dir / CALIBRATION_FILE, self.calibration)
+        return self.calibration
+
+if __name__ == "__main__":
+    from model_trainer import GIKIModelTrainer
+
+    parser = argparse.ArgumentParser(description="Fit the cross-encoder's confidence calibration")
+    parser.add_argument('--labeled', type=Path,
+                        help="JSON list of {query, answer}; defaults to the training questions")
+    parser.add_argument('--limit', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    trainer = GIKIModelTrainer()
+    questions, answers = trainer.load_questions(), trainer._load_search_index()[1]
+    if args.labeled:
+        with open(args.labeled, 'r') as f:
+            labeled = [(item['query'], item['answer']) for item in json.load(f)]
+    else:
+        labeled = list(zip(questions, answers))
+    labeled = labeled[:args.limit]
+
+    queries = [query for query, _ in labeled]
+    vectors = trainer.model.encode(queries, convert_to_numpy=True)
+    similarities = [trainer.similarities(vector) for vector in vectors]
+    reranker = CrossEncoderReranker(trainer.model_dir)
+    fitted = reranker.fit_calibration(queries, [answer for _, answer in labeled], answers, questions, similarities)
+    print(json.dumps(fitted, indent=2) if fitted else "Too few correct or wrong candidates; calibration unchanged")
@@ -1,9 +1,16 @@
 import subprocess
 import sys
 import os
+import importlib.util
 from pathlib import Path
 import logging
 from datetime import datetime
+from pipeline import GIKIPipeline, PipelineStage
+
+DATA_DIR = Path("data")
+DATASET_DIR = Path("dataset")
+MODEL_DIR = Path("models")
+SCRAPE_MAX_AGE = 12 * 60 * 60  # Web sources are re-scraped at most twice a day
 
 def setup_logging():
     """Setup logging configuration"""
@@ -57,18 +64,74 @@ def check_requirements():
     """Check if all required packages are installed"""
     logger = logging.getLogger('Pipeline')
     
-    try:
-        import torch
-        import transformers
-        import pandas
-        import nltk
-        import wandb
-        import streamlit
-        logger.info("All required packages are installed")
-        return True
-    except ImportError as e:
-        logger.error(f"Missing required package: {str(e)}")
+    # find_spec locates packages without paying their import cost
+    missing = [name for name in ('torch', 'transformers', 'pandas', 'nltk', 'streamlit', 'sentence_transformers')
+               if importlib.util.find_spec(name) is None]
+    if missing:
+        logger.error(f"Missing required packages: {', '.join(missing)}")
         return False
+    logger.info("All required packages are installed")
+    return True
+
+def scrape_stage() -> bool:
+    """Scrape fresh news, events, faculty and publications"""
+    from data_scraper import GIKIDataScraper
+    return GIKIDataScraper().update_dataset()
+
+def process_stage() -> bool:
+    """Collect web text and build the train/test CSVs"""
+    from data_processor import GIKIDataProcessor
+    return GIKIDataProcessor().create_dataset()
+
+def embed_stage() -> bool:
+    """Encode QA pairs from the scraped dataset"""
+    from model_trainer import GIKIModelTrainer
+    return GIKIModelTrainer().train()
+
+def index_stage() -> bool:
+    """Precompute the normalized question matrix used for search"""
+    import numpy as np
+    q_emb = np.load(MODEL_DIR / 'question_embeddings.npy').astype(np.float32)
+    norms = np.linalg.norm(q_emb, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    np.save(MODEL_DIR / 'question_index.npy', q_emb / norms)
+    return True
+
+def serve_stage() -> bool:
+    """Start the chatbot UI"""
+    return run_command("streamlit run chatbot.py", logging.getLogger('Pipeline'))
+
+def build_pipeline() -> GIKIPipeline:
+    """Declare the pipeline stages and the files they consume and produce"""
+    pipeline = GIKIPipeline()
+    pipeline.add_stage(PipelineStage(
+        'scrape', scrape_stage,
+        outputs=[DATA_DIR / 'giki_dataset.json'],
+        max_age=SCRAPE_MAX_AGE
+    ))
+    pipeline.add_stage(PipelineStage(
+        'process', process_stage,
+        outputs=[DATASET_DIR / 'train_dataset.csv', DATASET_DIR / 'test_dataset.csv'],
+        max_age=SCRAPE_MAX_AGE
+    ))
+    pipeline.add_stage(PipelineStage(
+        'embed', embed_stage,
+        inputs=[DATA_DIR / 'giki_dataset.json'],
+        outputs=[MODEL_DIR / 'question_embeddings.npy', MODEL_DIR / 'answers.json'],
+        depends_on=['scrape']
+    ))
+    pipeline.add_stage(PipelineStage(
+        'index', index_stage,
+        inputs=[MODEL_DIR / 'question_embeddings.npy'],
+        outputs=[MODEL_DIR / 'question_index.npy'],
+        depends_on=['embed']
+    ))
+    pipeline.add_stage(PipelineStage(
+        'serve', serve_stage,
+        depends_on=['process', 'index'],
+        always_run=True
+    ))
+    return pipeline
 
 def main():
     logger = setup_logging()
@@ -85,21 +148,10 @@ def main():
         for dir_name in ['data', 'models', 'logs', 'dataset']:
             Path(dir_name).mkdir(exist_ok=True)
         
-        # Step 3: Run data collection and processing
-        logger.info("Starting data collection and processing...")
-        if not run_command(f"{sys.executable} data_processor.py", logger):
-            logger.error("Data processing failed")
-            return
-        
-        # Step 4: Run model training
-        logger.info("Starting model training...")
-        if not run_command(f"{sys.executable} train.py", logger):
-            logger.error("Model training failed")
-            return
-        
-        # Step 5: Start the chatbot
-        logger.info("Starting the chatbot...")
-        run_command(f"streamlit run chatbot.py", logger)
+        # Step 3: Run the stages in-process, skipping those whose inputs are unchanged
+        pipeline = build_pipeline()
+        if not pipeline.run(force='--force' in sys.argv):
+            logger.error("Pipeline failed")
         
     except Exception as e:
         logger.error(f"Pipeline failed: {str(e)}")
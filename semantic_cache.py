@@ -0,0 +1,162 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+EVICTION_POLICIES = ('lru', 'lfu')
+
+class SemanticCache:
+    """Bounded cache of recently answered queries, matched by embedding similarity.
+
+    A query whose canonical text was answered before is an exact hit and needs no
+    encoding; otherwise its vector is compared with every cached query vector and the
+    stored answers are reused when the best cosine reaches the threshold. Vectors live
+    in one preallocated matrix, so a lookup is a single matrix-vector product.
+
+    Every entry carries the model version its answers came from; lookups only match
+    entries of the version they ask for, so a search that finishes after a new model
+    was published cannot serve its stale answers."""
+
+    def __init__(self, max_entries: Optional[int] = None, threshold: Optional[float] = None,
+                 policy: Optional[str] = None):
+        self.max_entries = max_entries if max_entries is not None else \
+            int(os.environ.get('GIKI_SEMANTIC_CACHE_SIZE', 2048))
+        self.threshold = threshold if threshold is not None else \
+            float(os.environ.get('GIKI_SEMANTIC_CACHE_THRESHOLD', 0.92))
+        self.policy = (policy or os.environ.get('GIKI_SEMANTIC_CACHE_POLICY') or 'lru').lower()
+        if self.policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {self.policy!r}, expected one of {EVICTION_POLICIES}")
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[Optional[str]] = [None] * self.max_entries
+        self._answers: List[Optional[List[Tuple[str, float]]]] = [None] * self.max_entries
+        self._versions = np.full(self.max_entries, -1, dtype=np.int64)
+        self._slots: Dict[str, int] = {}
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        # Per-slot recency (a logical clock) and use count, for the eviction policies
+        self._last_used = np.zeros(self.max_entries, dtype=np.int64)
+        self._uses = np.zeros(self.max_entries, dtype=np.int64)
+        self._clock = 0
+        self._stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _touch(self, slot: int):
+        self._clock += 1
+        self._last_used[slot] = self._clock
+        self._uses[slot] += 1
+
+    def _hit(self, slot: int, top_k: int, kind: str) -> Optional[List[Tuple[str, float]]]:
+        answers = self._answers[slot]
+        if len(answers) < top_k:
+            return None  # cached for a smaller top_k
+        self._touch(slot)
+        self._stats[kind] += 1
+        return answers[:top_k]
+
+    def get_exact(self, key: str, top_k: int = 3, version: int = 0) -> Optional[List[Tuple[str, float]]]:
+        """Stored answers for a query with the same canonical text"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or self._versions[slot] != version:
+                return None
+            return self._hit(slot, top_k, 'exact_hits')
+
+    def get_similar(self, vector: np.ndarray, top_k: int = 3, version: int = 0) -> Optional[List[Tuple[str, float]]]:
+        """Stored answers of the most similar cached query, if it clears the threshold.
+
+        Counts a miss when nothing matches, so call it once per query after get_exact."""
+        if not self.enabled:
+            return None
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        with self._lock:
+            if self._slots and norm:
+                scores = self._matrix @ (vector / norm)
+                # Free slots hold zero vectors, so they never clear a positive threshold
+                scores[self._versions != version] = -np.inf
+                slot = int(np.argmax(scores))
+                if scores[slot] >= self.threshold and self._keys[slot] is not None:
+                    answers = self._hit(slot, top_k, 'semantic_hits')
+                    if answers is not None:
+                        return answers
+            self._stats['misses'] += 1
+            return None
+
+    def _evict(self) -> int:
+        """Free the least recently (lru) or least frequently (lfu) used slot"""
+        if self.policy == 'lfu':
+            # Ties go to the least recently used entry
+            order = np.lexsort((self._last_used, self._uses))
+        else:
+            order = np.argsort(self._last_used)
+        slot = int(order[0])
+        del self._slots[self._keys[slot]]
+        self._keys[slot] = None
+        self._answers[slot] = None
+        self._versions[slot] = -1
+        self._stats['evictions'] += 1
+        return slot
+
+    def put(self, key: Optional[str], vector: np.ndarray, answers: List[Tuple[str, float]], version: int = 0):
+        """Cache a query's answers computed on a model version; without a key the entry
+        is only found by similarity"""
+        if not self.enabled or not answers:
+            return
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._clear()
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            key = key if key is not None else f"\0vector:{self._clock}"
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._free.pop() if self._free else self._evict()
+                self._slots[key] = slot
+                self._keys[slot] = key
+                self._uses[slot] = 0
+            self._matrix[slot] = vector / norm
+            self._answers[slot] = list(answers)
+            self._versions[slot] = version
+            self._touch(slot)
+
+    def _clear(self):
+        self._slots.clear()
+        self._keys = [None] * self.max_entries
+        self._answers = [None] * self.max_entries
+        self._versions[:] = -1
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._last_used[:] = 0
+        self._uses[:] = 0
+        if self._matrix is not None:
+            self._matrix[:] = 0
+
+    def clear(self):
+        """Drop every entry (e.g. when a new model version changes the answers)"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        """Hit-rate report since the cache was created"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._slots)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats.update({
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'policy': self.policy,
+            'lookups': lookups,
+            'hit_rate': (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        })
+        return stats
@@ -1,9 +1,8 @@
 import logging
+import os
+import sys
 from pathlib import Path
 from data_processor import GIKIDataProcessor
-from advanced_model import GIKIAdvancedModel
-import torch
-import wandb
 from datetime import datetime
 
 def setup_logging():
@@ -27,12 +26,19 @@ def main():
         logger.info("Initializing data processor")
         processor = GIKIDataProcessor()
         
-        # Step 2: Create dataset
-        logger.info("Creating dataset")
-        success = processor.create_dataset()
-        if not success:
-            logger.error("Failed to create dataset")
-            return
+        # Step 2: Create dataset. A restarted run continues from the newest checkpoint,
+        # which only matches the dataset it was trained on, so that one is reused
+        # instead of scraping the sites again
+        from advanced_model import has_checkpoint
+        resume = os.environ.get('GIKI_TRAIN_RESUME', '1') == '1'
+        if resume and has_checkpoint() and processor.has_dataset():
+            logger.info("Resuming training: reusing the existing dataset")
+        else:
+            logger.info("Creating dataset")
+            success = processor.create_dataset()
+            if not success:
+                logger.error("Failed to create dataset")
+                return
         
         # Step 3: Load the processed data
         logger.info("Loading processed data")
@@ -45,14 +51,22 @@ def main():
         
         # Step 4: Initialize the model
         logger.info("Initializing model")
-        model = GIKIAdvancedModel(model_name="bert-large-uncased-whole-word-masking-finetuned-squad")
+        from advanced_model import GIKIAdvancedModel
+        # Fine-tuning starts from the base reader, not a previous run's output
+        model = GIKIAdvancedModel(model_name="bert-large-uncased-whole-word-masking-finetuned-squad",
+                                  fine_tuned=False)
         
-        # Step 5: Configure training parameters
+        # Step 5: Configure training parameters (4 x 2 accumulated keeps the effective
+        # batch at 8 with half the activation memory)
         training_config = {
             'epochs': 10,
-            'batch_size': 8,
+            'batch_size': 4,
+            'gradient_accumulation': 2,
             'learning_rate': 2e-5,
-            'max_length': 512,
+            'bf16': os.environ.get('GIKI_TRAIN_BF16', '0') == '1',
+            'checkpoint_steps': 200,
+            'max_length': model.max_length,
+            'top_passages': model.top_passages,
             'model_name': model.model_name,
             'device': str(model.device)
         }
@@ -67,7 +81,11 @@ def main():
             test_df=test_df,
             epochs=training_config['epochs'],
             batch_size=training_config['batch_size'],
-            learning_rate=training_config['learning_rate']
+            learning_rate=training_config['learning_rate'],
+            gradient_accumulation=training_config['gradient_accumulation'],
+            bf16=training_config['bf16'],
+            checkpoint_steps=training_config['checkpoint_steps'],
+            resume=resume
         )
         
         if success:
@@ -103,6 +121,12 @@ def main():
             Computer Engineering, Electrical Engineering, Mechanical Engineering, and more. GIKI is known 
             for its high academic standards and research quality."""
             
+            # Answer from the passage index when one was built, else from the context above
+            if not model.passage_store.passages:
+                logger.info("No passage index, answering from the sample context")
+            else:
+                context = None
+            
             logger.info("Sample model responses:")
             for question in test_questions:
                 answer, confidence = model.get_answer(question, context)
@@ -118,8 +142,9 @@ def main():
         raise
     
     finally:
-        # Clean up wandb
-        if wandb.run is not None:
+        # Clean up wandb, if the model imported it
+        wandb = sys.modules.get('wandb')
+        if wandb is not None and wandb.run is not None:
             wandb.finish()
 
 if __name__ == "__main__":
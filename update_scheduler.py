@@ -1,17 +1,25 @@
 import schedule
 import time
-from data_scraper import GIKIDataScraper
-from model_trainer import GIKIModelTrainer
+import random
+import threading
+from chat_store import ShardedChatStore
+from chat_archive import ChatArchive, archive_old_chats
 import logging
 from pathlib import Path
 
 class UpdateScheduler:
-    def __init__(self):
+    def __init__(self, jitter_seconds: float = 300, archive_after_days: float = 30):
         self.data_dir = Path("data")
         self.data_dir.mkdir(exist_ok=True)
         self.setup_logging()
-        self.scraper = GIKIDataScraper()
-        self.trainer = GIKIModelTrainer()
+        # Created on the first update, so the idle loop never imports torch or loads the model
+        self._scraper = None
+        self._trainer = None
+        # Random delay before scheduled updates so several schedulers don't hit the site at once
+        self.jitter_seconds = jitter_seconds
+        self._update_lock = threading.Lock()
+        self._worker = None
+        self.archive_after_days = archive_after_days
     
     def setup_logging(self):
         """Setup logging configuration"""
@@ -22,7 +30,21 @@ class UpdateScheduler:
         )
         self.logger = logging.getLogger('Scheduler')
     
-    def update_data_and_model(self):
+    @property
+    def scraper(self):
+        if self._scraper is None:
+            from data_scraper import GIKIDataScraper
+            self._scraper = GIKIDataScraper()
+        return self._scraper
+    
+    @property
+    def trainer(self):
+        if self._trainer is None:
+            from model_trainer import GIKIModelTrainer
+            self._trainer = GIKIModelTrainer()
+        return self._trainer
+    
+    def update_data_and_model(self) -> bool:
         """Update dataset and retrain model"""
         try:
             self.logger.info("Starting data update...")
@@ -30,8 +52,10 @@ class UpdateScheduler:
                 self.logger.info("Dataset updated successfully")
                 
                 self.logger.info("Starting model training...")
+                # train() publishes a new model version, which serving processes hot-swap to
                 if self.trainer.train():
                     self.logger.info("Model training completed successfully")
+                    return True
                 else:
                     self.logger.error("Model training failed")
             else:
@@ -39,15 +63,54 @@ class UpdateScheduler:
         
         except Exception as e:
             self.logger.error(f"Error in update process: {str(e)}")
+        return False
+    
+    def _run_update(self, jitter: bool):
+        """Worker body: optional jitter, then the update; always releases the lock"""
+        try:
+            if jitter and self.jitter_seconds > 0:
+                delay = random.uniform(0, self.jitter_seconds)
+                self.logger.info(f"Delaying update by {delay:.0f}s")
+                time.sleep(delay)
+            
+            start = time.time()
+            success = self.update_data_and_model()
+            self.logger.info(f"Update finished in {time.time() - start:.1f}s (success={success})")
+        finally:
+            self._update_lock.release()
+    
+    def trigger_update(self, jitter: bool = True) -> bool:
+        """Start an update in a worker thread; skipped if one is already running"""
+        if not self._update_lock.acquire(blocking=False):
+            self.logger.warning("Previous update still running, skipping this run")
+            return False
+        
+        self._worker = threading.Thread(
+            target=self._run_update,
+            args=(jitter,),
+            name='giki-update',
+            daemon=True
+        )
+        self._worker.start()
+        return True
+    
+    def archive_chats(self):
+        """Move idle chats into the compressed archive"""
+        try:
+            moved = archive_old_chats(ShardedChatStore(), ChatArchive(), self.archive_after_days)
+            self.logger.info(f"Archived {moved} idle chats")
+        except Exception as e:
+            self.logger.error(f"Error archiving chats: {str(e)}")
     
     def run(self):
         """Run the scheduler"""
         # Schedule updates
-        schedule.every().day.at("00:00").do(self.update_data_and_model)  # Daily update at midnight
-        schedule.every().day.at("12:00").do(self.update_data_and_model)  # Daily update at noon
+        schedule.every().day.at("00:00").do(self.trigger_update)  # Daily update at midnight
+        schedule.every().day.at("12:00").do(self.trigger_update)  # Daily update at noon
+        schedule.every().day.at("03:00").do(self.archive_chats)  # Nightly chat archiving
         
         # Initial update
-        self.update_data_and_model()
+        self.trigger_update(jitter=False)
         
         # Keep running
         while True:
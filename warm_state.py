@@ -0,0 +1,162 @@
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_FILE = Path("models") / "warm_state.bin"
+MAGIC = b'GIKIWARM'
+FORMAT_VERSION = 1
+# magic, format version, header length
+PREAMBLE = struct.Struct('<8sIQ')
+# Arrays start on cache-line boundaries so they can be used straight from the mapping
+ALIGNMENT = 64
+
+logger = logging.getLogger('WarmState')
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def write_snapshot(path: Path, arrays: Dict[str, np.ndarray], objects: Dict[str, Any], meta: Dict) -> Path:
+    """Write one snapshot file: a JSON header, then raw arrays and pickled objects.
+
+    The file is written next to the target and renamed over it, so workers that
+    already mapped the old snapshot keep a consistent view."""
+    sections, blobs = {}, []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _align(offset)
+        sections[name] = {'kind': 'array', 'offset': offset, 'length': array.nbytes,
+                          'dtype': array.dtype.str, 'shape': list(array.shape)}
+        blobs.append((offset, array.tobytes()))
+        offset += array.nbytes
+    for name, value in objects.items():
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        sections[name] = {'kind': 'pickle', 'offset': offset, 'length': len(data)}
+        blobs.append((offset, data))
+        offset += len(data)
+
+    header = json.dumps({'meta': meta, 'sections': sections}).encode('utf-8')
+    # Section offsets are relative to the (aligned) end of the header
+    data_start = _align(PREAMBLE.size + len(header))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for section_offset, data in blobs:
+            f.seek(data_start + section_offset)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    return path
+
+class WarmState:
+    """Read-only view of a snapshot file through one shared memory mapping.
+
+    Arrays are zero-copy numpy views of the mapping, so every worker on the host
+    shares the same physical pages; pickled objects are unpickled on first access."""
+
+    def __init__(self, path: Path = SNAPSHOT_FILE):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a warm-state snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.meta: Dict = header['meta']
+        self.sections: Dict[str, Dict] = header['sections']
+        self._data_start = _align(PREAMBLE.size + header_length)
+        self._objects: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def array(self, name: str) -> np.ndarray:
+        """A read-only array backed by the mapping"""
+        section = self.sections[name]
+        dtype = np.dtype(section['dtype'])
+        count = section['length'] // dtype.itemsize
+        return np.frombuffer(self._mmap, dtype=dtype, count=count,
+                             offset=self._data_start + section['offset']).reshape(section['shape'])
+
+    def object(self, name: str) -> Any:
+        """An unpickled object, cached after the first access"""
+        with self._lock:
+            if name not in self._objects:
+                section = self.sections[name]
+                start = self._data_start + section['offset']
+                self._objects[name] = pickle.loads(self._mmap[start:start + section['length']])
+            return self._objects[name]
+
+_snapshots: Dict[Path, Tuple[int, Optional[WarmState]]] = {}
+_snapshots_lock = threading.Lock()
+
+def load_warm_state(path: Path = SNAPSHOT_FILE) -> Optional[WarmState]:
+    """The process-wide mapping of a snapshot, or None if there is no usable one.
+
+    Re-mapped when the file is replaced, so a long-running worker follows new snapshots."""
+    path = Path(path)
+    with _snapshots_lock:
+        try:
+            inode = path.stat().st_ino
+        except FileNotFoundError:
+            return None
+        if path in _snapshots and _snapshots[path][0] == inode:
+            return _snapshots[path][1]
+        try:
+            snapshot = WarmState(path)
+        except Exception as e:
+            logger.error(f"Ignoring warm-state snapshot {path}: {str(e)}")
+            snapshot = None
+        _snapshots[path] = (inode, snapshot)
+        return snapshot
+
+def build_snapshot(model_dir: Path = Path("models"), version: Optional[int] = None) -> Optional[Path]:
+    """Snapshot the derived serving state after training: the normalized question
+    matrix and answers, the knowledge-base indexes and the quick-response table"""
+    from giki_knowledge import GIKIKnowledgeBase
+    from quick_responses import QuickResponses
+
+    model_dir = Path(model_dir)
+    embeddings_file = model_dir / 'question_embeddings.npy'
+    arrays, objects = {}, {}
+    if embeddings_file.exists():
+        q_emb = np.load(embeddings_file).astype(np.float32)
+        norms = np.linalg.norm(q_emb, axis=1, keepdims=True)
+        arrays['question_index'] = q_emb / np.where(norms == 0, 1.0, norms)
+        with open(model_dir / 'answers.json', 'r') as f:
+            objects['answers'] = json.load(f)
+
+    try:
+        kb = GIKIKnowledgeBase(snapshot=False)
+        objects['knowledge_base'] = kb.snapshot_state()
+    except Exception as e:
+        logger.error(f"Knowledge base left out of the snapshot: {str(e)}")
+    objects['quick_answers'] = QuickResponses(snapshot=False).snapshot_state()
+
+    meta = {'version': version, 'created': datetime.now().isoformat()}
+    path = write_snapshot(model_dir / SNAPSHOT_FILE.name, arrays, objects, meta)
+    logger.info(f"Wrote warm-state snapshot {path} ({', '.join(list(arrays) + list(objects))})")
+    return path
+
+if __name__ == "__main__":
+    from model_events import get_model_events
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(build_snapshot(version=get_model_events(Path("models")).current_version().get('version', 0)))
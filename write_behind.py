@@ -0,0 +1,200 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict
+
+from chat_store import ShardedChatStore, message_key, try_lock
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+class WriteBehindQueue:
+    """Accepts chat writes immediately and persists them to the chat store in batches.
+
+    Every append is first written to a per-queue journal (fsync'd per fsync_policy),
+    then coalesced per chat in memory. A background thread flushes the pending chats
+    when flush_interval elapses or max_pending chats are waiting. Journals left behind
+    by a crashed process are replayed into the store on startup.
+
+    Journals and locks are named by pid plus an instance id, so several queues in one
+    process (e.g. after a Streamlit rerun) never share or replay each other's journal."""
+
+    def __init__(self, store: ShardedChatStore, flush_interval: float = 1.0, max_pending: int = 50,
+                 fsync_policy: str = 'interval'):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}")
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync_policy = fsync_policy
+        self.logger = logging.getLogger('WriteBehind')
+
+        self.journal_dir = store.data_dir / 'journal'
+        self.journal_dir.mkdir(exist_ok=True)
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.journal_file = self.journal_dir / f'{self.owner}.journal'
+        self.lock_file = self.journal_dir / f'{self.owner}.lock'
+        # Held for the life of the queue; recovery only replays journals whose lock is free.
+        # flock locks belong to the open file, so this also excludes other queues in this process
+        self._owner_lock = open(self.lock_file, 'a+')
+        try_lock(self._owner_lock)
+
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+
+        self.recover()
+        self._journal = open(self.journal_file, 'a')
+        self._thread = threading.Thread(target=self._run, name='chat-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _write_journal(self, record: Dict):
+        """Append a record to the journal (caller holds self._lock)"""
+        self._journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        if self.fsync_policy == 'always':
+            os.fsync(self._journal.fileno())
+
+    def enqueue_chat(self, chat_id: str, chat: Dict):
+        """Queue a chat's metadata (new chat, title change); messages go through enqueue_append"""
+        with self._lock:
+            self._write_journal({'op': 'chat', 'chat_id': chat_id,
+                                 'chat': {k: v for k, v in chat.items() if k != 'messages'}})
+            self._pending[chat_id] = chat
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.notify()
+
+    def enqueue_append(self, chat_id: str, chat: Dict, message: Dict):
+        """Queue a message that has already been appended to chat['messages']"""
+        with self._lock:
+            self._write_journal({'op': 'append', 'chat_id': chat_id, 'message': message})
+            self._pending[chat_id] = chat
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.notify()
+
+    def discard(self, chat_id: str):
+        """Drop pending writes for a deleted chat"""
+        with self._lock:
+            self._pending.pop(chat_id, None)
+
+    def pending_snapshot(self) -> Dict:
+        """Copies of chats not yet flushed, to overlay on what the store returns"""
+        with self._lock:
+            return {chat_id: {**chat, 'messages': list(chat['messages'])}
+                    for chat_id, chat in self._pending.items()}
+
+    def flush(self) -> bool:
+        """Write all pending chats to the store and start a fresh journal"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                batch = self._pending
+                self._pending = {}
+                # Snapshot under the lock so concurrent appends don't race the write
+                snapshots = {chat_id: {**chat, 'messages': list(chat['messages'])} for chat_id, chat in batch.items()}
+                if self.fsync_policy != 'never':
+                    os.fsync(self._journal.fileno())
+                # Rotate: records written from now on belong to the next batch
+                self._journal.close()
+                flushing_file = self.journal_file.with_suffix(f'.{time.time_ns()}.flushing')
+                os.replace(self.journal_file, flushing_file)
+                self._journal = open(self.journal_file, 'a')
+
+            try:
+                conflicts = set(self.store.save_chats(snapshots))
+            except Exception as e:
+                self.logger.error(f"Error flushing {len(snapshots)} chats: {str(e)}")
+                with self._lock:
+                    # Keep newer pending state; re-queue the rest and keep the journal for recovery
+                    for chat_id, chat in batch.items():
+                        self._pending.setdefault(chat_id, chat)
+                return False
+
+            # A merged chat keeps its old version, so its next flush merges again instead of
+            # overwriting messages another process added
+            for chat_id, snapshot in snapshots.items():
+                if chat_id not in conflicts:
+                    batch[chat_id]['version'] = snapshot.get('version', 0)
+            flushing_file.unlink()
+            return True
+
+    def _run(self):
+        """Background flusher: time trigger, or size trigger via notify"""
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write everything out; registered with atexit"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join(timeout=self.flush_interval + 5)
+        if self.flush():
+            with self._lock:
+                self._journal.close()
+                if self.journal_file.exists() and self.journal_file.stat().st_size == 0:
+                    self.journal_file.unlink(missing_ok=True)
+            self._owner_lock.close()
+            self.lock_file.unlink(missing_ok=True)
+        else:
+            # Leave journal and lock behind; the next process replays them
+            self._owner_lock.close()
+
+    def recover(self):
+        """Replay journals of queues that exited without flushing"""
+        for lock_path in sorted(self.journal_dir.glob('*.lock')):
+            owner = lock_path.stem
+            if owner == self.owner:
+                continue
+            lock_file = open(lock_path, 'a+')
+            if not try_lock(lock_file):
+                lock_file.close()
+                continue  # owner is still running
+            journals = sorted(self.journal_dir.glob(f'{owner}.*.flushing')) + \
+                [p for p in [self.journal_dir / f'{owner}.journal'] if p.exists()]
+            if journals:
+                self._replay(journals)
+            for path in journals:
+                path.unlink(missing_ok=True)
+            lock_file.close()
+            lock_path.unlink(missing_ok=True)
+
+    def _replay(self, journals):
+        """Apply journal records on top of the stored chats"""
+        chats: Dict[str, Dict] = {}
+        seen: Dict[str, set] = {}
+        for path in journals:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn write at the end of a crashed journal
+                    chat_id = record['chat_id']
+                    if chat_id not in chats:
+                        chats[chat_id] = self.store.load_chat(chat_id) or {'messages': []}
+                        seen[chat_id] = {message_key(m) for m in chats[chat_id]['messages']}
+                    chat = chats[chat_id]
+                    if record['op'] == 'chat':
+                        chat.update({k: v for k, v in record['chat'].items() if k != 'version'})
+                    elif record['op'] == 'append' and message_key(record['message']) not in seen[chat_id]:
+                        seen[chat_id].add(message_key(record['message']))
+                        chat['messages'].append(record['message'])
+        if chats:
+            self.store.save_chats(chats)
+            self.logger.info(f"Recovered {len(chats)} chats from {len(journals)} journal files")